@@ -1 +1,20 @@
 VERSION = '2.4.1'
+
+
+def prefetch_thumbnail_urls(objects, field_name, thumb_names, **kwargs):
+    """
+    Resolves thumbnail URLs for many objects at once. See
+    :func:`athumb.fields.prefetch_thumbnail_urls`.
+    """
+    # Imported here so that setup.py can get at VERSION without Django.
+    from athumb.fields import prefetch_thumbnail_urls
+    return prefetch_thumbnail_urls(objects, field_name, thumb_names, **kwargs)
+
+
+def delete_with_thumbnails(queryset, field_name):
+    """
+    Deletes objects along with their stored images. See
+    :func:`athumb.deletion.delete_with_thumbnails`.
+    """
+    from athumb.deletion import delete_with_thumbnails
+    return delete_with_thumbnails(queryset, field_name)
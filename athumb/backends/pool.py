@@ -0,0 +1,151 @@
+"""
+A small pool of connections, so storage backends that are shared by every
+thread in the process don't share one connection between them.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionPool(object):
+    """
+    A thread-safe pool of connections made by ``factory``. Each operation
+    takes a connection out with :meth:`connection`, and puts it back when
+    done, so it (and its keep-alive HTTP connections) can be reused.
+
+    The pool never blocks. If every pooled connection is in use, a new one is
+    made. At most ``max_size`` idle connections are kept, and ones that have
+    been idle for over ``max_idle_time`` seconds are closed rather than
+    reused, since the server has likely hung up on them by then. Connections
+    used by an operation that raised are closed too. See :meth:`stats` for
+    counters.
+    """
+    def __init__(self, factory, max_size=10, max_idle_time=60):
+        self.factory = factory
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        # (time put back, connection), least recently used first.
+        self._idle = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.evicted = 0
+        self.discarded = 0
+        self.in_use = 0
+
+    @contextmanager
+    def connection(self):
+        """
+        A context manager that takes a connection from the pool, making one
+        if need be, and puts it back afterwards::
+
+            with pool.connection() as conn:
+                conn.get_bucket('media')
+
+        If the block raises, the connection is discarded instead.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except:
+            # It may have been part way through a request, with a response
+            # left unread, so it can't be trusted with the next one.
+            self.discard(conn)
+            raise
+        self.release(conn)
+
+    def acquire(self):
+        """
+        Returns a connection for the caller's use only. Hand it back with
+        :meth:`release`.
+        """
+        conn = None
+        with self._lock:
+            # The idle list is in the order connections were put back, so
+            # any stale ones are at the front.
+            oldest_allowed = time.time() - self.max_idle_time
+            fresh_from = 0
+            while fresh_from < len(self._idle) and \
+                  self._idle[fresh_from][0] < oldest_allowed:
+                fresh_from += 1
+            stale = [candidate for released_at, candidate
+                     in self._idle[:fresh_from]]
+            del self._idle[:fresh_from]
+            self.evicted += len(stale)
+
+            if self._idle:
+                # The most recently used one is the likeliest to still have
+                # a live socket.
+                conn = self._idle.pop()[1]
+                self.reused += 1
+            else:
+                self.opened += 1
+            self.in_use += 1
+
+        for candidate in stale:
+            self._close(candidate)
+
+        if conn is None:
+            try:
+                conn = self.factory()
+            except Exception:
+                with self._lock:
+                    self.opened -= 1
+                    self.in_use -= 1
+                raise
+        return conn
+
+    def release(self, conn):
+        """
+        Puts a connection from :meth:`acquire` back in the pool, or closes
+        it if the pool is full.
+        """
+        with self._lock:
+            self.in_use -= 1
+            if len(self._idle) < self.max_size:
+                self._idle.append((time.time(), conn))
+                return
+        self._close(conn)
+
+    def discard(self, conn):
+        """
+        Closes a connection from :meth:`acquire` rather than putting it back,
+        for when it's in an unknown state.
+        """
+        with self._lock:
+            self.in_use -= 1
+            self.discarded += 1
+        self._close(conn)
+
+    def clear(self):
+        """
+        Closes all of the idle connections. Ones in use are left alone.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for released_at, conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """
+        Returns a dict of the opened, reused, evicted and discarded
+        counters, plus how many connections are in use and idle right now.
+        """
+        with self._lock:
+            return {
+                'opened': self.opened,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'discarded': self.discarded,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+            }
+
+    def _close(self, conn):
+        close = getattr(conn, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                # It's being thrown away anyway.
+                pass
@@ -6,6 +6,15 @@ import urllib
 import os
 import mimetypes
 import re
+import sys
+import socket
+import httplib
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from tempfile import SpooledTemporaryFile
 
 try:
     from cStringIO import StringIO
@@ -19,13 +28,19 @@ from django.core.exceptions import ImproperlyConfigured
 
 try:
     from boto.s3.connection import S3Connection
-    from boto.exception import S3ResponseError
+    from boto.exception import BotoServerError, S3ResponseError
     from boto.s3.key import Key
+    from boto.s3.multipart import MultiPartUpload
+    from boto.s3.prefix import Prefix
+    from boto.utils import parse_ts
 except ImportError:
     raise ImproperlyConfigured(
         "Could not load boto's S3 bindings. Please install boto."
     )
 
+from athumb.backends.pool import ConnectionPool
+from athumb.local_cache import LocalCache
+
 AWS_REGIONS = [
     'eu-west-1',
     'us-east-1',
@@ -55,9 +70,57 @@ GZIP_CONTENT_TYPES = getattr(settings, 'GZIP_CONTENT_TYPES', (
     'application/x-javascript'
 ))
 
+# Compressed content is held in memory up to this many bytes, then spills
+# over to a temporary file on disk.
+SPOOL_MAX_MEMORY = getattr(settings, 'AWS_SPOOL_MAX_MEMORY', 1024 * 1024)
+# Files at least this many bytes big are uploaded in parts, several at once.
+# 0 turns multipart uploads off.
+MULTIPART_THRESHOLD = getattr(settings, 'AWS_MULTIPART_THRESHOLD', 16 * 1024 * 1024)
+# The size of each part, in bytes. S3 won't take parts under 5MB (except for
+# the last one).
+MULTIPART_CHUNK_SIZE = getattr(settings, 'AWS_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024)
+# How many parts of one file to upload at once. This many parts (plus the
+# one being read) are held in memory.
+MULTIPART_CONCURRENCY = getattr(settings, 'AWS_MULTIPART_CONCURRENCY', 4)
+# How many times to retry a part that failed with a network or server error.
+MULTIPART_RETRIES = getattr(settings, 'AWS_MULTIPART_RETRIES', 3)
+# Seconds to wait before the first retry of a part. Each retry after that
+# waits twice as long as the one before.
+MULTIPART_RETRY_DELAY = getattr(settings, 'AWS_MULTIPART_RETRY_DELAY', 1)
+# S3 rejects parts smaller than this, except for the last one.
+MULTIPART_MIN_CHUNK_SIZE = 5 * 1024 * 1024
+# Signed URLs are cached in-process, and handed out until they have this many
+# seconds of validity left. Caching is off if AWS_QUERYSTRING_EXPIRE isn't
+# more than this.
+URL_CACHE_MARGIN = getattr(settings, 'AWS_URL_CACHE_MARGIN', 300)
+# The most signed URLs each storage instance caches.
+URL_CACHE_SIZE = getattr(settings, 'AWS_URL_CACHE_SIZE', 10000)
+# Upload with If-None-Match: *, so S3 leaves objects that already exist
+# alone. Off by default: a save overwrites, like get_available_name() says.
+CONDITIONAL_WRITES = getattr(settings, 'AWS_CONDITIONAL_WRITES', False)
+# Each storage instance keeps up to this many idle S3 connections for its
+# threads to reuse. More are made as needed, but not kept.
+CONNECTION_POOL_SIZE = getattr(settings, 'AWS_CONNECTION_POOL_SIZE', 10)
+# Pooled connections idle for longer than this many seconds are closed
+# instead of reused, as S3 has probably hung up on them.
+CONNECTION_MAX_IDLE_TIME = getattr(settings, 'AWS_CONNECTION_MAX_IDLE_TIME', 60)
+
+# What S3BotoStorage.iter_keys() yields for each key.
+# name: The key's name.
+# size: Its size, in bytes.
+# etag: Its ETag, without the quotes. The MD5 of the content, for keys that
+#     weren't uploaded in parts.
+# last_modified: When it was last written, as a naive UTC datetime.
+KeyInfo = namedtuple('KeyInfo', ['name', 'size', 'etag', 'last_modified'])
+
 if IS_GZIPPED:
     from gzip import GzipFile
 
+# Older Pythons don't know these image types, and would upload thumbnails in
+# them as application/x-octet-stream.
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
 
 class S3BotoStorage(Storage):
     """Amazon Simple Storage Service using Boto"""
@@ -69,7 +132,15 @@ class S3BotoStorage(Storage):
                        headers=HEADERS, gzip=IS_GZIPPED,
                        gzip_content_types=GZIP_CONTENT_TYPES,
                        querystring_auth=QUERYSTRING_AUTH,
-                       force_no_ssl=False):
+                       force_no_ssl=False,
+                       conditional_writes=CONDITIONAL_WRITES,
+                       multipart_threshold=MULTIPART_THRESHOLD,
+                       multipart_chunk_size=MULTIPART_CHUNK_SIZE,
+                       multipart_concurrency=MULTIPART_CONCURRENCY,
+                       multipart_retries=MULTIPART_RETRIES,
+                       multipart_retry_delay=MULTIPART_RETRY_DELAY,
+                       pool_size=CONNECTION_POOL_SIZE,
+                       pool_max_idle_time=CONNECTION_MAX_IDLE_TIME):
         self.bucket_name = bucket
         self.bucket_cname = bucket_cname
         self.host = self._get_host(region)
@@ -79,6 +150,19 @@ class S3BotoStorage(Storage):
         self.gzip_content_types = gzip_content_types
         self.querystring_auth = querystring_auth
         self.force_no_ssl = force_no_ssl
+        self.conditional_writes = conditional_writes
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunk_size = multipart_chunk_size
+        self.multipart_concurrency = max(1, multipart_concurrency)
+        self.multipart_retries = multipart_retries
+        self.multipart_retry_delay = multipart_retry_delay
+        if multipart_threshold and \
+           multipart_chunk_size < MULTIPART_MIN_CHUNK_SIZE:
+            # Otherwise every upload over the threshold would only fail once
+            # all its parts were sent.
+            raise ImproperlyConfigured(
+                "AWS_MULTIPART_CHUNK_SIZE must be at least %d bytes (5MB), "
+                "S3's smallest part size." % MULTIPART_MIN_CHUNK_SIZE)
         # This is called as chunks are uploaded to S3. Useful for getting
         # around limitations in eventlet for things like gunicorn.
         self.s3_callback_during_upload = None
@@ -86,16 +170,59 @@ class S3BotoStorage(Storage):
         if not access_key and not secret_key:
             access_key, secret_key = self._get_access_keys()
 
-        self.connection = S3Connection(
-            access_key, secret_key, host=self.host,
+        self._access_key = access_key
+        self._secret_key = secret_key
+        # Only used to sign URLs, which happens locally. Anything that talks
+        # to S3 takes a connection from the pool, so threads never share one.
+        self.connection = self._new_connection()
+        self.connection_pool = ConnectionPool(
+            self._new_connection, max_size=pool_size,
+            max_idle_time=pool_max_idle_time,
+        )
+        self._bucket_checked = False
+        self._bucket_lock = threading.Lock()
+        url_cache_time = QUERYSTRING_EXPIRE - URL_CACHE_MARGIN
+        self.url_cache = LocalCache(
+            URL_CACHE_SIZE if url_cache_time > 0 else 0, url_cache_time)
+
+    def _new_connection(self):
+        return S3Connection(
+            self._access_key, self._secret_key, host=self.host,
         )
 
     @property
     def bucket(self):
+        """
+        The bucket, on the shared URL signing connection. Kept for backwards
+        compatibility. This isn't safe to make requests with from several
+        threads at once, see :meth:`pooled_bucket` instead.
+        """
         if not hasattr(self, '_bucket'):
-            self._bucket = self._get_or_create_bucket(self.bucket_name)
+            self._bucket = self._get_or_create_bucket(self.bucket_name,
+                                                      self.connection)
         return self._bucket
 
+    @contextmanager
+    def pooled_bucket(self):
+        """
+        A context manager that provides the bucket on a connection from the
+        pool, for this thread's use only::
+
+            with storage.pooled_bucket() as bucket:
+                bucket.get_key(name)
+
+        The first use makes sure the bucket exists (creating it if
+        AWS_AUTO_CREATE_BUCKET is on). After that, no request is made until
+        you make one.
+        """
+        with self.connection_pool.connection() as conn:
+            if not self._bucket_checked:
+                with self._bucket_lock:
+                    if not self._bucket_checked:
+                        self._get_or_create_bucket(self.bucket_name, conn)
+                        self._bucket_checked = True
+            yield conn.get_bucket(self.bucket_name, validate=False)
+
     def _get_access_keys(self):
         access_key = ACCESS_KEY_NAME
         secret_key = SECRET_KEY_NAME
@@ -125,13 +252,13 @@ class S3BotoStorage(Storage):
         # can be full host or empty string, default region
         return  region
 
-    def _get_or_create_bucket(self, name):
+    def _get_or_create_bucket(self, name, connection):
         """Retrieves a bucket if it exists, otherwise creates it."""
         try:
-            return self.connection.get_bucket(name)
+            return connection.get_bucket(name)
         except S3ResponseError, e:
             if AUTO_CREATE_BUCKET:
-                return self.connection.create_bucket(name)
+                return connection.create_bucket(name)
             raise ImproperlyConfigured, ("Bucket specified by "
             "AWS_STORAGE_BUCKET_NAME does not exist. Buckets can be "
             "automatically created by setting AWS_AUTO_CREATE_BUCKET=True")
@@ -141,12 +268,16 @@ class S3BotoStorage(Storage):
         return os.path.normpath(name).replace('\\', '/')
 
     def _compress_content(self, content):
-        """Gzip a given string."""
-        zbuf = StringIO()
+        """Gzip a given file, a chunk at a time."""
+        zbuf = SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
         zfile = GzipFile(mode='wb', compresslevel=6, fileobj=zbuf)
-        zfile.write(content.read())
+        for chunk in content.chunks():
+            zfile.write(chunk)
         zfile.close()
         content.file = zbuf
+        # The size may have been cached from before we compressed.
+        content.size = zbuf.tell()
+        zbuf.seek(0)
         return content
 
     def _open(self, name, mode='rb'):
@@ -156,10 +287,12 @@ class S3BotoStorage(Storage):
     def _save(self, name, content):
         name = self._clean_name(name)
 
+        # Work on a copy. The storage instance is usually a module-level
+        # singleton, and thumbnails for one upload are saved concurrently.
         if callable(self.headers):
-            headers = self.headers(name, content)
+            headers = dict(self.headers(name, content))
         else:
-            headers = self.headers
+            headers = dict(self.headers)
 
         if hasattr(content.file, 'content_type'):
             content_type = content.file.content_type
@@ -175,43 +308,285 @@ class S3BotoStorage(Storage):
             'Content-Length' : len(content),
         })
 
+        if self.conditional_writes:
+            headers['If-None-Match'] = '*'
+
         content.name = name
-        k = self.bucket.get_key(name)
-        if not k:
-            k = self.bucket.new_key(name)
-        # The callback seen here is particularly important for async WSGI
-        # servers. This allows us to call back to eventlet or whatever
-        # async support library we're using periodically to prevent timeouts.
-        k.set_contents_from_file(content, headers=headers, policy=self.acl,
-                                 cb=self.s3_callback_during_upload,
-                                 num_cb=-1)
+        # S3 can make the final step of a multipart upload conditional too,
+        # but boto has no way to ask for that.
+        if self.multipart_threshold and not self.conditional_writes and \
+           len(content) >= self.multipart_threshold:
+            del headers['Content-Length']
+            self._save_multipart(name, content, headers)
+            return name
+
+        with self.pooled_bucket() as bucket:
+            # Made locally. Whether the key exists already doesn't matter, so
+            # there's no need to ask S3, and the upload is the only request.
+            k = bucket.new_key(name)
+            # The callback seen here is particularly important for async WSGI
+            # servers. This allows us to call back to eventlet or whatever
+            # async support library we're using periodically to prevent
+            # timeouts. Boto streams from the file object (for the MD5, then
+            # the upload), so content is never read into memory all at once
+            # here.
+            try:
+                k.set_contents_from_file(content, headers=headers,
+                                         policy=self.acl,
+                                         cb=self.s3_callback_during_upload,
+                                         num_cb=-1, rewind=True)
+            except S3ResponseError, exc:
+                if not (self.conditional_writes and exc.status == 412):
+                    raise
+                # Precondition Failed: it's already there, so it stays.
         return name
 
+    def _save_multipart(self, name, content, headers):
+        """
+        Uploads ``content`` as a multipart upload, several parts at a time.
+        Parts are read off of ``content.chunks()`` as uploads free up, so only
+        a few are in memory at once. Each part is retried on network and
+        server errors. If the upload fails, it's aborted, so S3 doesn't keep
+        (and bill for) the parts.
+        """
+        with self.pooled_bucket() as bucket:
+            upload = bucket.initiate_multipart_upload(name, headers=headers,
+                                                      policy=self.acl)
+
+        total_size = len(content)
+        progress = {}
+        progress_lock = threading.Lock()
+        # Freed up as each part finishes, to keep reading from getting ahead.
+        slots = threading.Semaphore(self.multipart_concurrency)
+
+        def report_progress(part_num, bytes_transmitted):
+            with progress_lock:
+                progress[part_num] = bytes_transmitted
+                transmitted = sum(progress.values())
+            self.s3_callback_during_upload(transmitted,
+                                           total_size - transmitted)
+
+        def upload_part(part_num, data):
+            try:
+                self._upload_part(upload, part_num, data, report_progress)
+            finally:
+                slots.release()
+
+        pool = ThreadPool(self.multipart_concurrency)
+        results = []
+        try:
+            for part_num, data in enumerate(
+                    self._iter_parts(content, self.multipart_chunk_size), 1):
+                slots.acquire()
+                if any(result.ready() and not result.successful()
+                       for result in results):
+                    # Don't bother reading any more.
+                    slots.release()
+                    break
+                results.append(pool.apply_async(upload_part,
+                                                (part_num, data)))
+            for result in results:
+                # Re-raises the part's exception, if any.
+                result.get()
+
+            with self.pooled_bucket() as bucket:
+                upload.bucket = bucket
+                upload.complete_upload()
+        except Exception:
+            exc_info = sys.exc_info()
+            pool.close()
+            pool.join()
+            try:
+                with self.pooled_bucket() as bucket:
+                    upload.bucket = bucket
+                    upload.cancel_upload()
+            except Exception:
+                # The original error is the one worth seeing.
+                pass
+            raise exc_info[0], exc_info[1], exc_info[2]
+        pool.close()
+        pool.join()
+
+    def _upload_part(self, upload, part_num, data, report_progress):
+        """
+        Uploads one part of a multipart upload, retrying on network and
+        server errors. Waits longer before each retry, to give a struggling
+        S3 (or network) time to recover.
+        """
+        if self.s3_callback_during_upload:
+            cb = lambda transmitted, remaining: report_progress(part_num,
+                                                                transmitted)
+        else:
+            cb = None
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self.pooled_bucket() as bucket:
+                    # The upload's requests go through its bucket's
+                    # connection, so use this thread's own.
+                    part_upload = MultiPartUpload(bucket)
+                    part_upload.key_name = upload.key_name
+                    part_upload.id = upload.id
+                    part_upload.upload_part_from_file(StringIO(data),
+                                                      part_num, cb=cb,
+                                                      num_cb=-1)
+                return
+            # BotoServerError is what boto raises once its own retries of a
+            # 5xx response run out.
+            except (BotoServerError, socket.error, httplib.HTTPException), exc:
+                if attempt > self.multipart_retries or \
+                   getattr(exc, 'status', 500) < 500:
+                    raise
+            time.sleep(self.multipart_retry_delay * 2 ** (attempt - 1))
+
+    def _iter_parts(self, content, part_size):
+        """
+        Yields ``content`` in strings of ``part_size`` bytes, the last one
+        possibly shorter.
+        """
+        buf = []
+        buf_size = 0
+        for chunk in content.chunks(chunk_size=part_size):
+            buf.append(chunk)
+            buf_size += len(chunk)
+            while buf_size >= part_size:
+                data = ''.join(buf)
+                yield data[:part_size]
+                buf = [data[part_size:]]
+                buf_size = len(buf[0])
+        if buf_size:
+            yield ''.join(buf)
+
     def delete(self, name):
         name = self._clean_name(name)
-        self.bucket.delete_key(name)
+        with self.pooled_bucket() as bucket:
+            bucket.delete_key(name)
+
+    def delete_many(self, names):
+        """
+        Deletes the given names using S3's multi-object delete, which handles
+        up to 1000 keys per request.
+
+        :param list names: Storage names to delete.
+        :rtype: dict
+        :returns: A dict mapping the names that couldn't be deleted to a
+            string describing why. Empty if everything was deleted.
+        """
+        names = [self._clean_name(name) for name in names]
+        if not names:
+            return {}
+
+        try:
+            with self.pooled_bucket() as bucket:
+                result = bucket.delete_keys(names, quiet=True)
+        except (BotoServerError, socket.error, httplib.HTTPException), exc:
+            # The request itself failed, so we don't know about any of them.
+            error = '%s: %s' % (exc.__class__.__name__, exc)
+            return dict((name, error) for name in names)
+
+        return dict((error.key, '%s: %s' % (error.code, error.message))
+                    for error in result.errors)
 
     def exists(self, name):
         name = self._clean_name(name)
-        k = Key(self.bucket, name)
-        return k.exists()
+        with self.pooled_bucket() as bucket:
+            return Key(bucket, name).exists()
 
     def listdir(self, name):
-        name = self._clean_name(name)
-        return [l.name for l in self.bucket.list() if not len(name) or l.name[:len(name)] == name]
+        """
+        Lists the contents of the "directory" ``name``, as a tuple of
+        (directories, files). S3 does the filtering and grouping, so only
+        what's directly in ``name`` is sent back.
+        """
+        prefix = self._get_dir_prefix(name)
+        dirs, files = [], []
+        with self.pooled_bucket() as bucket:
+            # Fetched a page at a time, as we go.
+            for item in bucket.list(prefix=prefix, delimiter='/'):
+                if isinstance(item, Prefix):
+                    dirs.append(item.name[len(prefix):-1])
+                elif item.name != prefix:
+                    # Skips the placeholder some tools make for directories.
+                    files.append(item.name[len(prefix):])
+        return dirs, files
+
+    def iter_keys(self, prefix='', page_size=1000):
+        """
+        Yields a :class:`KeyInfo` for every key under ``prefix``, however
+        deep, in name order. Keys are fetched ``page_size`` at a time as
+        they're needed, so this works on buckets of any size. A pooled
+        connection is only held while fetching each page.
+
+        :keyword str prefix: Only list keys whose names start with this.
+        :keyword int page_size: How many keys to ask S3 for at once. S3
+            won't return more than 1000.
+        :rtype: generator
+        """
+        marker = ''
+        while True:
+            with self.pooled_bucket() as bucket:
+                page = bucket.get_all_keys(prefix=prefix, marker=marker,
+                                           max_keys=page_size)
+            for key in page:
+                yield KeyInfo(name=key.name, size=key.size,
+                              etag=key.etag.strip('"') if key.etag else None,
+                              last_modified=parse_ts(key.last_modified))
+            if not page.is_truncated or not len(page):
+                return
+            marker = page[-1].name
+
+    def _get_dir_prefix(self, name):
+        """
+        Returns the key prefix for the directory ``name``: its cleaned name
+        with a trailing slash, or an empty string for the top.
+        """
+        if not name:
+            return ''
+        name = self._clean_name(name).strip('/')
+        if name in ('', '.'):
+            return ''
+        return name + '/'
 
     def size(self, name):
         name = self._clean_name(name)
-        return self.bucket.get_key(name).size
+        with self.pooled_bucket() as bucket:
+            return bucket.get_key(name).size
 
-    def url(self, name):
+    def url(self, name, verify_exists=False):
+        """
+        Returns the URL for ``name``. If querystring_auth is on, it's signed
+        locally and cached until it gets close to expiring, so this doesn't
+        normally make any requests to S3.
+
+        :param str name: The storage name of the file.
+        :keyword bool verify_exists: If ``True``, check with S3 first, and
+            return an empty string if there's no such key.
+        :rtype: str
+        """
         name = self._clean_name(name)
-        if self.bucket.get_key(name) is None:
-            return ''
-        return self.bucket.get_key(name).generate_url(QUERYSTRING_EXPIRE,
-                                                      method='GET',
-                                                      query_auth=self.querystring_auth,
-                                                      force_http=self.force_no_ssl)
+        if verify_exists:
+            with self.pooled_bucket() as bucket:
+                if bucket.get_key(name) is None:
+                    return ''
+        return self._generate_url(name, self.querystring_auth,
+                                  self.force_no_ssl)
+
+    def url_for_name(self, name, ssl=False):
+        """
+        Builds the plain, unsigned URL for ``name`` purely from
+        configuration, without checking whether the key exists. Thumbnail
+        URLs are built with this. They are cached for far longer than a
+        signature would last, so (as always) they aren't signed.
+
+        :param str name: The storage name of the file.
+        :keyword bool ssl: If ``True``, always return an https URL.
+        :rtype: str
+        """
+        name = self._clean_name(name)
+        return self._generate_url(name, False,
+                                  self.force_no_ssl and not ssl)
 
     def url_as_attachment(self, name, filename=None):
         name = self._clean_name(name)
@@ -221,17 +596,35 @@ class S3BotoStorage(Storage):
         else:
             disposition = 'attachment;'
 
-        response_headers = {
-            'response-content-disposition': disposition,
-        }
+        return self._generate_url(name, True, self.force_no_ssl,
+                                  disposition=disposition)
 
-        return self.connection.generate_url(QUERYSTRING_EXPIRE, 'GET',
-                                            bucket=self.bucket.name, key=name,
-                                            query_auth=True,
-                                            force_http=self.force_no_ssl,
-                                            response_headers=response_headers)
-
-    def get_available_name(self, name):
+    def _generate_url(self, name, query_auth, force_http, disposition=None):
+        """
+        Signs (if ``query_auth``) and returns a GET URL for ``name``, from the
+        URL cache if we have it.
+        """
+        cache_key = (name, query_auth, force_http, disposition)
+        url = self.url_cache.get(cache_key)
+        if url is not None:
+            return url
+
+        response_headers = None
+        if disposition:
+            response_headers = {
+                'response-content-disposition': disposition,
+            }
+        url = self.connection.generate_url(QUERYSTRING_EXPIRE, 'GET',
+                                           bucket=self.bucket_name, key=name,
+                                           query_auth=query_auth,
+                                           force_http=force_http,
+                                           response_headers=response_headers)
+        if query_auth:
+            # Unsigned URLs are as cheap to build as to look up.
+            self.url_cache.set(cache_key, url)
+        return url
+
+    def get_available_name(self, name, max_length=None):
         """ Overwrite existing file with the same name. """
         name = self._clean_name(name)
         return name
@@ -262,14 +655,21 @@ class S3BotoStorage_AllPublic(S3BotoStorage):
         Since we assume all public storage with no authorization keys, we can
         just simply dump out a URL rather than having to query S3 for new keys.
         """
+        return self.url_for_name(name)
+
+    def url_for_name(self, name, ssl=False):
+        """
+        Same as :meth:`url`, but returns an https URL if ``ssl`` is ``True``.
+        """
         name = urllib.quote_plus(self._clean_name(name), safe='/')
+        scheme = 'https' if ssl else 'http'
 
         if self.bucket_cname:
-            return "http://%s/%s" % (self.bucket_cname, name)
+            return "%s://%s/%s" % (scheme, self.bucket_cname, name)
         elif self.host:
-            return "http://%s/%s/%s" % (self.host, self.bucket_name, name)
+            return "%s://%s/%s/%s" % (scheme, self.host, self.bucket_name, name)
         # No host ? Then it's the default region
-        return "http://s3.amazonaws.com/%s/%s" % (self.bucket_name, name)
+        return "%s://s3.amazonaws.com/%s/%s" % (scheme, self.bucket_name, name)
 
 
 class S3BotoStorageFile(File):
@@ -277,7 +677,8 @@ class S3BotoStorageFile(File):
         self._storage = storage
         self.name = name
         self._mode = mode
-        self.key = storage.bucket.get_key(name)
+        with storage.pooled_bucket() as bucket:
+            self.key = bucket.get_key(name)
         self._is_dirty = False
         self.file = StringIO()
 
@@ -292,7 +693,10 @@ class S3BotoStorageFile(File):
         self._is_dirty = False
         if not self.key:
             raise IOError('No such S3 key: %s' % self.name)
-        self.key.get_contents_to_file(self.file)
+        with self._storage.pooled_bucket() as bucket:
+            # Keys make their requests through their bucket's connection.
+            self.key.bucket = bucket
+            self.key.get_contents_to_file(self.file)
         return self.file.getvalue()
 
     def write(self, content):
@@ -303,7 +707,12 @@ class S3BotoStorageFile(File):
 
     def close(self):
         if self._is_dirty:
-            if not self.key:
-                self.key = self._storage.bucket.new_key(key_name=self.name)
-            self.key.set_contents_from_string(self.file.getvalue(), headers=self._storage.headers, policy=self.storage.acl)
-        self.key.close()
+            with self._storage.pooled_bucket() as bucket:
+                if self.key:
+                    self.key.bucket = bucket
+                else:
+                    self.key = bucket.new_key(key_name=self.name)
+                self.key.set_contents_from_string(self.file.getvalue(), headers=self._storage.headers, policy=self._storage.acl)
+            self._is_dirty = False
+        if self.key:
+            self.key.close()
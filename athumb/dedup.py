@@ -0,0 +1,190 @@
+"""
+Content-addressed deduplication of uploads. When enabled, an upload whose
+contents (and field thumbnail specs) match something we've already stored
+re-uses the stored original and thumbnails instead of generating and
+uploading them all over again. Stored files are reference counted, so
+deleting one field value doesn't pull the files out from under the others.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+# Dotted path to the index class to use. None disables deduplication.
+THUMBNAIL_DEDUP_INDEX = getattr(settings, 'THUMBNAIL_DEDUP_INDEX', None)
+# How long CacheIndex entries live.
+THUMBNAIL_DEDUP_CACHE_TIME = getattr(settings, 'THUMBNAIL_DEDUP_CACHE_TIME',
+                                     3600 * 24 * 30)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    """
+    Returns the process-wide instance of the index class named by the
+    THUMBNAIL_DEDUP_INDEX setting, or ``None`` if deduplication is off.
+    """
+    global _index
+
+    if THUMBNAIL_DEDUP_INDEX is None:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = import_string(THUMBNAIL_DEDUP_INDEX)()
+    return _index
+
+
+def hash_content(content):
+    """
+    Returns the SHA1 hex digest of a Django File's contents, reading it a
+    chunk at a time. The file is left rewound.
+    """
+    digest = hashlib.sha1()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class BaseIndex(object):
+    """
+    Maps (content hash, thumb spec fingerprint) pairs to the storage name of
+    the original stored for them, and keeps a reference count per name.
+    """
+    def lookup(self, content_hash, fingerprint):
+        """
+        Returns the storage name stored for this content and fingerprint, or
+        ``None`` if there isn't one.
+        """
+        raise NotImplementedError()
+
+    def acquire(self, name):
+        """
+        Adds a reference to ``name``. Returns ``False`` if the entry has gone
+        away since it was looked up, in which case the caller should store
+        the upload as usual.
+        """
+        raise NotImplementedError()
+
+    def register(self, content_hash, fingerprint, name):
+        """
+        Records that ``name`` was stored for this content and fingerprint,
+        with one reference.
+        """
+        raise NotImplementedError()
+
+    def release(self, name):
+        """
+        Drops a reference to ``name``. Returns ``True`` if the stored files
+        are no longer referenced and should be deleted.
+        """
+        raise NotImplementedError()
+
+
+class CacheIndex(BaseIndex):
+    """
+    Keeps the index in Django's cache. This is cheap, but best-effort: if the
+    cache evicts a reference count, we can no longer tell whether the files
+    are shared, so :meth:`release` errs on the side of leaving them in place.
+    Use :class:`DatabaseIndex` if you need deletes to be exact.
+    """
+    def _entry_key(self, content_hash, fingerprint):
+        return "Thumbdedup_%s_%s" % (content_hash, fingerprint)
+
+    def _refs_key(self, name):
+        return "Thumbdedup_refs_%s" % name.replace(' ', '%20')
+
+    def lookup(self, content_hash, fingerprint):
+        return cache.get(self._entry_key(content_hash, fingerprint))
+
+    def acquire(self, name):
+        try:
+            cache.incr(self._refs_key(name))
+        except ValueError:
+            # The reference count was evicted.
+            return False
+        return True
+
+    def register(self, content_hash, fingerprint, name):
+        # Something may already be stored (and referenced) under this name.
+        if not cache.add(self._refs_key(name), 1, THUMBNAIL_DEDUP_CACHE_TIME):
+            self.acquire(name)
+        cache.set(self._entry_key(content_hash, fingerprint), name,
+                  THUMBNAIL_DEDUP_CACHE_TIME)
+
+    def release(self, name):
+        try:
+            refs = cache.decr(self._refs_key(name))
+        except ValueError:
+            return False
+        if refs <= 0:
+            cache.delete(self._refs_key(name))
+            return True
+        return False
+
+
+class DatabaseIndex(BaseIndex):
+    """
+    Keeps the index in the DeduplicatedImage table. Files that were stored
+    before the index was turned on aren't in it, and are deleted as usual.
+    """
+    def lookup(self, content_hash, fingerprint):
+        from athumb.models import DeduplicatedImage
+
+        names = DeduplicatedImage.objects.filter(
+            content_hash=content_hash, fingerprint=fingerprint
+        ).values_list('name', flat=True)[:1]
+        return names[0] if names else None
+
+    def acquire(self, name):
+        from athumb.models import DeduplicatedImage
+
+        updated = DeduplicatedImage.objects.filter(name=name).update(
+            refcount=F('refcount') + 1)
+        return updated > 0
+
+    def register(self, content_hash, fingerprint, name):
+        from athumb.models import DeduplicatedImage
+
+        with transaction.atomic():
+            # Storage backends that overwrite (S3BotoStorage, for one) may
+            # have just replaced a file that's indexed, and referenced, under
+            # this name. Those references now point at our content.
+            stale = list(DeduplicatedImage.objects.select_for_update()
+                                                  .filter(name=name))
+            try:
+                with transaction.atomic():
+                    DeduplicatedImage.objects.create(
+                        content_hash=content_hash, fingerprint=fingerprint,
+                        name=name,
+                        refcount=1 + sum(entry.refcount for entry in stale))
+            except IntegrityError:
+                # Someone beat us to it with the same content. Their entry
+                # stands, ours is a regular, un-shared file.
+                return
+            DeduplicatedImage.objects.filter(
+                pk__in=[entry.pk for entry in stale]).delete()
+
+    def release(self, name):
+        from athumb.models import DeduplicatedImage
+
+        with transaction.atomic():
+            entries = list(DeduplicatedImage.objects.select_for_update()
+                                                    .filter(name=name))
+            if not entries:
+                return True
+
+            entry = entries[0]
+            if entry.refcount <= 1:
+                entry.delete()
+                return True
+
+            entry.refcount -= 1
+            entry.save(update_fields=['refcount'])
+            return False
@@ -0,0 +1,76 @@
+"""
+Deleting many stored files at once.
+"""
+from athumb.dedup import get_dedup_index
+from athumb.workers import run_all
+
+
+def delete_many(storage, names):
+    """
+    Deletes the given names from ``storage``. Storage backends that can do
+    this in bulk provide a ``delete_many(names)`` method of their own, with
+    the same return value as this function. For the rest, we delete the
+    files concurrently on the worker pool.
+
+    :param Storage storage: The storage backend to delete from.
+    :param list names: Storage names to delete.
+    :rtype: dict
+    :returns: A dict mapping the names that couldn't be deleted to a string
+        describing why. Empty if everything was deleted.
+    """
+    if hasattr(storage, 'delete_many'):
+        return storage.delete_many(names)
+
+    errors = {}
+
+    def _delete(name):
+        try:
+            storage.delete(name)
+        except Exception, exc:
+            errors[name] = '%s: %s' % (exc.__class__.__name__, exc)
+
+    run_all(_delete, [(name,) for name in names])
+    return errors
+
+
+def delete_with_thumbnails(queryset, field_name):
+    """
+    Deletes every object in ``queryset``, along with the original and
+    thumbnails stored in its ``field_name`` ImageWithThumbsField. All of the
+    files for one storage backend are deleted in one batch, and the rows are
+    deleted with a single query.
+
+    Rows are deleted even if some of their files couldn't be. Check the
+    returned dict to see which ones.
+
+    :param QuerySet queryset: The objects to delete.
+    :param str field_name: The name of the ImageWithThumbsField.
+    :rtype: dict
+    :returns: A dict mapping the names of files that couldn't be deleted to
+        a string describing why.
+    """
+    objects = list(queryset)
+    dedup_index = get_dedup_index()
+
+    # Names to delete, grouped by storage backend.
+    by_storage = {}
+    for obj in objects:
+        field_file = getattr(obj, field_name)
+        if not field_file:
+            continue
+        field_file._forget_urls()
+        if dedup_index is not None and \
+           not dedup_index.release(field_file.name):
+            # Still in use by something else.
+            continue
+        storage, names = by_storage.setdefault(id(field_file.storage),
+                                               (field_file.storage, []))
+        names.extend(field_file._stored_filenames())
+
+    errors = {}
+    for storage, names in by_storage.values():
+        errors.update(delete_many(storage, names))
+
+    queryset.model._default_manager.filter(
+        pk__in=[obj.pk for obj in objects]).delete()
+    return errors
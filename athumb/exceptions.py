@@ -8,4 +8,12 @@ class UploadedImageIsUnreadableError(Exception):
     mal-formed or corrupt, but the imaging library (as it is compiled) can't
     read it.
     """
-    pass
\ No newline at end of file
+    pass
+
+class UploadedImageIsTooLargeError(Exception):
+    """
+    Raise this when the image being uploaded has more pixels than we're
+    willing to decode (see ATHUMB_MAX_PIXELS). This is checked from the
+    image's header, before anything is decoded or stored.
+    """
+    pass
@@ -3,18 +3,31 @@
 Fields, FieldFiles, and Validators.
 """
 import os
-import cStringIO
+import math
+import hashlib
+import logging
 
-from PIL import Image
-from django.db.models import ImageField
+from django.db.models import ImageField, signals
 from django.db.models.fields.files import ImageFieldFile
 from django.conf import settings
 from django.core.cache import cache
-from django.core.files.base import ContentFile
-from athumb.exceptions import UploadedImageIsUnreadableError
-from athumb.pial.engines.pil_engine import PILEngine
-
-from validators import ImageUploadExtensionValidator
+from django.core.files.base import File
+from django.core.validators import ValidationError
+from django.utils.http import urlquote
+from django.utils.module_loading import import_string
+from athumb.dedup import get_dedup_index, hash_content
+from athumb.deletion import delete_many
+from athumb.exceptions import UploadedImageIsUnreadableError, \
+                              UploadedImageIsTooLargeError
+from athumb.local_cache import LocalCache
+from athumb.plans import compile_thumbs
+from athumb.queues import get_queue
+from athumb.queues.base import ThumbnailJob
+from athumb.signals import thumbnail_stored
+from athumb.workers import run_all
+
+from validators import ImageUploadExtensionValidator, \
+                       ImagePixelCountValidator, check_pixel_count
 
 try:
     #noinspection PyUnresolvedReferences
@@ -24,26 +37,88 @@ except ImportError:
     # Not using South, no big deal.
     pass
 
-# Thumbnailing is done through here. Eventually we can support image libraries
-# other than PIL.
-THUMBNAIL_ENGINE = PILEngine()
+# Thumbnailing is done through here. Dotted path to an EngineBase subclass:
+# PIL (the default), or libvips via
+# 'athumb.pial.engines.vips_engine.VipsEngine'.
+THUMBNAIL_ENGINE = import_string(getattr(
+    settings, 'THUMBNAIL_ENGINE',
+    'athumb.pial.engines.pil_engine.PILEngine'))()
 
 # Cache URLs for thumbnails so we don't have to keep re-generating them.
 THUMBNAIL_URL_CACHE_TIME = getattr(settings, 'THUMBNAIL_URL_CACHE_TIME', 3600 * 24)
 # Optional cache-buster string to append to end of thumbnail URLs.
 MEDIA_CACHE_BUSTER = getattr(settings, 'MEDIA_CACHE_BUSTER', '')
+# Thumbnail URLs are also kept in a per-process cache, in front of Django's,
+# so the most used ones don't cost a network round trip. This is the most
+# URLs to keep (0 turns it off), and how long to keep them for.
+THUMBNAIL_LOCAL_CACHE_SIZE = getattr(settings, 'THUMBNAIL_LOCAL_CACHE_SIZE', 10000)
+THUMBNAIL_LOCAL_CACHE_TIME = getattr(settings, 'THUMBNAIL_LOCAL_CACHE_TIME', 300)
+# Derive smaller thumbnails from larger, already-scaled ones instead of
+# scaling every size down from the full-resolution original.
+THUMBNAIL_CASCADE = getattr(settings, 'THUMBNAIL_CASCADE', True)
+# When cascading, a larger thumbnail is only used as the source for a smaller
+# one if it is at least this many times the smaller one's size. Higher values
+# trade speed for being closer to from-the-original quality.
+THUMBNAIL_CASCADE_MIN_RATIO = getattr(settings, 'THUMBNAIL_CASCADE_MIN_RATIO', 2.0)
+# Let the decoder downscale while loading (JPEG DCT scaling), so long as the
+# decoded image is still at least this many times the largest thumbnail.
+# Set to 0 to always decode at full resolution.
+THUMBNAIL_DRAFT_MIN_RATIO = getattr(settings, 'THUMBNAIL_DRAFT_MIN_RATIO', 2.0)
+# Leave EXIF, ICC profiles, XMP and such out of thumbnails. They can be tens
+# of KB, which is often more than a small thumbnail's pixels.
+THUMBNAIL_STRIP_METADATA = getattr(settings, 'THUMBNAIL_STRIP_METADATA', True)
+# Convert originals with an embedded ICC profile (like Display P3 photos) to
+# plain sRGB, so their colors still look right without the profile.
+THUMBNAIL_CONVERT_SRGB = getattr(settings, 'THUMBNAIL_CONVERT_SRGB', False)
+# Queue thumbnail generation instead of doing it during save(). Can also be
+# set per-field.
+THUMBNAIL_DEFERRED = getattr(settings, 'THUMBNAIL_DEFERRED', False)
+# URL to hand out while a deferred thumbnail is still being generated. If
+# None, the original's URL is used instead.
+THUMBNAIL_PENDING_URL = getattr(settings, 'THUMBNAIL_PENDING_URL', None)
+# How long to consider thumbnails pending if the job never reports back.
+THUMBNAIL_PENDING_TIMEOUT = getattr(settings, 'THUMBNAIL_PENDING_TIMEOUT', 3600)
+# Encoded thumbnails are held in memory up to this many bytes, then spill
+# over to a temporary file on disk.
+THUMBNAIL_SPOOL_MAX_MEMORY = getattr(settings, 'THUMBNAIL_SPOOL_MAX_MEMORY', 1024 * 1024)
+
+logger = logging.getLogger(__name__)
 
 # Models want this instantiated ahead of time.
 IMAGE_EXTENSION_VALIDATOR = ImageUploadExtensionValidator()
+IMAGE_PIXEL_COUNT_VALIDATOR = ImagePixelCountValidator()
+
+# Per-process thumbnail URL cache. LOCAL_URL_CACHE.stats() has the counters.
+LOCAL_URL_CACHE = LocalCache(THUMBNAIL_LOCAL_CACHE_SIZE,
+                             THUMBNAIL_LOCAL_CACHE_TIME)
+
+# Model instances keep the names their image fields were last stored under
+# in this attribute, a dict keyed by field name. Saving a new file releases
+# the old one's deduplication reference.
+STORED_NAMES_ATTR = '_athumb_stored_names'
+
 
 class ImageWithThumbsFieldFile(ImageFieldFile):
     """
     Serves as the file-level storage object for thumbnails.
     """
-    def generate_url(self, thumb_name, ssl_mode=False, check_cache=True, cache_bust=True):
-        # This is tacked on to the end of the cache key to make sure SSL
-        # URLs are stored separate from plain http.
-        ssl_postfix = '_ssl' if ssl_mode else ''
+    def generate_url(self, thumb_name, ssl_mode=False, check_cache=True,
+                     cache_bust=True, format=None):
+        """
+        Returns the URL for the given thumbnail.
+
+        format: (str) If the thumbnail is also stored in this format (see
+            thumbnail_variants), return that variant's URL. Otherwise, the
+            thumbnail's regular URL is returned.
+        """
+        format = self._calc_variant(thumb_name, format)
+
+        if check_cache:
+            # prefetch_thumbnail_urls() may have already worked this out.
+            prefetched = getattr(self, '_prefetched_urls', {}).get(
+                (thumb_name, bool(ssl_mode), bool(cache_bust), format))
+            if prefetched:
+                return prefetched
 
         # Try to see if we can hit the cache instead of asking the storage
         # backend for the URL. This is particularly important for S3 backends.
@@ -51,19 +126,85 @@ class ImageWithThumbsFieldFile(ImageFieldFile):
         cache_key = None
 
         if check_cache:
-            cache_key = "Thumbcache_%s_%s%s" % (self.url,
-                                                   thumb_name,
-                                                   ssl_postfix)
-            cache_key = cache_key.strip()
+            cache_key = self._url_cache_key(thumb_name, ssl_mode, cache_bust,
+                                            format)
+
+            # URLs are only cached once the thumbnails exist, so a hit here
+            # means there's no need to ask whether they're pending.
+            cached_val = LOCAL_URL_CACHE.get(cache_key)
+            if cached_val:
+                return cached_val
 
+        if self.field.use_deferred() and self.thumbs_pending():
+            # The thumbnails haven't been generated yet. Don't cache this,
+            # we'll want the real URL as soon as it's there.
+            return self._pending_url(ssl_mode)
+
+        if check_cache:
             cached_val = cache.get(cache_key)
             if cached_val:
+                LOCAL_URL_CACHE.set(cache_key, cached_val)
                 return cached_val
 
+        new_url = self._build_thumb_url(thumb_name, ssl_mode, cache_bust,
+                                        format)
+
+        if cache_key:
+            # Cache this so we don't have to hit the storage backend for a while.
+            cache.set(cache_key, new_url, THUMBNAIL_URL_CACHE_TIME)
+            LOCAL_URL_CACHE.set(cache_key, new_url)
+
+        return new_url
+
+    def _url_cache_key(self, thumb_name, ssl_mode, cache_bust, format=None):
+        """
+        Returns the key generate_url() caches a thumbnail's URL under.
+        """
+        # This is tacked on to the end of the cache key to make sure SSL
+        # URLs are stored separate from plain http.
+        ssl_postfix = '_ssl' if ssl_mode else ''
+        # Likewise for the cache buster, which also means changing
+        # MEDIA_CACHE_BUSTER moves everyone on to new keys.
+        if cache_bust and MEDIA_CACHE_BUSTER:
+            bust_postfix = '_cb%s' % MEDIA_CACHE_BUSTER
+        else:
+            bust_postfix = ''
+
+        # Keyed on the storage and file name rather than the URL, so we
+        # don't have to ask the storage backend for a URL to check the cache.
+        storage_id = getattr(self.storage, 'bucket_name', None) or \
+                     getattr(self.storage, 'base_url', None) or ''
+
+        # Format variants each have their own URL.
+        format_postfix = '_%s' % format if format else ''
+
+        cache_key = "Thumbcache_%s_%s_%s%s%s%s" % (storage_id,
+                                                      urlquote(self.name),
+                                                      thumb_name,
+                                                      format_postfix,
+                                                      ssl_postfix,
+                                                      bust_postfix)
+        return cache_key.strip()
+
+    def _build_thumb_url(self, thumb_name, ssl_mode, cache_bust, format=None):
+        """
+        Works out a thumbnail's URL, without checking any caches.
+        """
         # Determine what the filename would be for a thumb with these
         # dimensions, regardless of whether it actually exists.
-        new_filename = self._calc_thumb_filename(thumb_name)
-
+        new_filename = self._calc_thumb_filename(thumb_name, format)
+
+        if hasattr(self.storage, 'url_for_name'):
+            # The storage backend can build URLs from its configuration alone,
+            # so we never need to touch the original's URL.
+            new_url = self.storage.url_for_name(new_filename, ssl=ssl_mode)
+            if cache_bust and MEDIA_CACHE_BUSTER:
+                separator = '&' if '?' in new_url else '?'
+                new_url = "%s%scbust=%s" % (new_url, separator,
+                                            MEDIA_CACHE_BUSTER)
+            return new_url
+
+        # Otherwise, derive it from the original's URL.
         # Split URL from GET attribs.
         url_get_split = self.url.rsplit('?', 1)
         # Just the URL string (no GET attribs).
@@ -85,12 +226,49 @@ class ImageWithThumbsFieldFile(ImageFieldFile):
         if ssl_mode:
             new_url = new_url.replace('http://', 'https://')
 
-        if cache_key:
-            # Cache this so we don't have to hit the storage backend for a while.
-            cache.set(cache_key, new_url, THUMBNAIL_URL_CACHE_TIME)
+        return new_url
 
+    def _pending_url(self, ssl_mode):
+        """
+        Returns the URL to hand out while this file's thumbnails are still
+        being generated.
+        """
+        if THUMBNAIL_PENDING_URL:
+            new_url = THUMBNAIL_PENDING_URL
+        else:
+            # Not cached, so it's fine if this one is signed.
+            new_url = self.url
+
+        if ssl_mode:
+            new_url = new_url.replace('http://', 'https://')
         return new_url
 
+    def _remember_url(self, thumb_name, ssl_mode, cache_bust, url,
+                      format=None):
+        """
+        Stashes a resolved URL on this file, for generate_url() to return
+        without going to the cache. Used by prefetch_thumbnail_urls().
+        """
+        if not hasattr(self, '_prefetched_urls'):
+            self._prefetched_urls = {}
+        self._prefetched_urls[(thumb_name, bool(ssl_mode), bool(cache_bust),
+                               format)] = url
+
+    def _forget_urls(self):
+        """
+        Drops any URLs remembered for this file, here and in the per-process
+        cache. Called whenever the file changes.
+        """
+        self._prefetched_urls = {}
+
+        if self.name:
+            LOCAL_URL_CACHE.delete_many(
+                [self._url_cache_key(plan.name, ssl_mode, cache_bust, format)
+                 for plan in self.field.thumb_plans
+                 for format in (None,) + self._get_variants(plan)
+                 for ssl_mode in (False, True)
+                 for cache_bust in (False, True)])
+
     def get_thumbnail_format(self):
         """
         Determines the target thumbnail type either by looking for a format
@@ -105,39 +283,221 @@ class ImageWithThumbsFieldFile(ImageFieldFile):
             filename_split = self.name.rsplit('.', 1)
             return filename_split[-1]
 
+    def get_thumb_variants(self, thumb_name):
+        """
+        Returns the extra formats (like 'webp') the given thumbnail is stored
+        in, next to the regular thumbnail format.
+        """
+        plan = self.field.get_thumb_plan(thumb_name)
+        if plan is None:
+            return []
+        return list(self._get_variants(plan))
+
+    def _get_variants(self, plan):
+        """
+        Returns the extra formats the given ThumbnailPlan is stored in, for
+        this file.
+        """
+        if plan.format or not plan.variants:
+            # Doesn't depend on the original's format.
+            return plan.variants
+        return plan.get_variants(self.get_thumbnail_format())
+
+    def _calc_variant(self, thumb_name, format):
+        """
+        Returns ``format`` if the given thumbnail is stored in it as a
+        variant, or None if the regular thumbnail should be used.
+        """
+        if not format:
+            return None
+        plan = self.field.get_thumb_plan(thumb_name)
+        format = format.lower()
+        if plan is not None and format in self._get_variants(plan):
+            return format
+        return None
+
     def save(self, name, content, save=True):
         """
         Handles some extra logic to generate the thumbnails when the original
         file is uploaded.
         """
-        super(ImageWithThumbsFieldFile, self).save(name, content, save)
+        self._forget_urls()
+
+        # Check the dimensions in the header before storing or decoding
+        # anything, in case the form didn't run the field's validators.
         try:
-            self.generate_thumbs(name, content)
-        except IOError, exc:
-            if 'cannot identify' in exc.message or \
-               'bad EPS header' in exc.message:
-                raise UploadedImageIsUnreadableError(
-                    "We were unable to read the uploaded image. "
-                    "Please make sure you are uploading a valid image file."
-                )
-            else:
-                raise
+            check_pixel_count(THUMBNAIL_ENGINE, content)
+        except ValidationError, exc:
+            raise UploadedImageIsTooLargeError(exc.messages[0])
+
+        dedup_index = get_dedup_index()
+        if dedup_index is not None:
+            # The file being replaced, if any, whose reference we hold. Like
+            # Django, we leave it in storage, but others may now delete it.
+            replaced_name = self._get_replaced_name()
+            content_hash = hash_content(content)
+            fingerprint = self.field.thumbs_fingerprint()
+            existing_name = dedup_index.lookup(content_hash, fingerprint)
+            if existing_name and dedup_index.acquire(existing_name):
+                # We've already stored this exact image, with this exact set
+                # of thumbnails. Point at those instead of making new ones.
+                self._reuse_stored(existing_name, save)
+                if replaced_name:
+                    dedup_index.release(replaced_name)
+                self._remember_stored_name()
+                return
+
+        super(ImageWithThumbsFieldFile, self).save(name, content, save)
+
+        if self.field.use_deferred():
+            # Hand the work off. generate_url() serves up a stand-in until
+            # the job is done.
+            self.mark_thumbs_pending()
+            get_queue().enqueue(ThumbnailJob.for_field_file(self))
+        else:
+            try:
+                self.generate_thumbs(name, content)
+            except IOError, exc:
+                if 'cannot identify' in exc.message or \
+                   'bad EPS header' in exc.message:
+                    raise UploadedImageIsUnreadableError(
+                        "We were unable to read the uploaded image. "
+                        "Please make sure you are uploading a valid image file."
+                    )
+                else:
+                    raise
+
+        if dedup_index is not None:
+            dedup_index.register(content_hash, fingerprint, self.name)
+            if replaced_name:
+                # Only after registering: a backend that overwrites may have
+                # stored the new file under the old name, and register()
+                # carries the old name's references over to it.
+                dedup_index.release(replaced_name)
+        self._remember_stored_name()
+
+    def _get_replaced_name(self):
+        """
+        Returns the name this field value was stored under before the file
+        now being saved, or None if there wasn't one. Assigning an upload to
+        the model attribute makes a new field file, so that name is also
+        kept on the instance (see ImageWithThumbsField.contribute_to_class).
+        """
+        if self._committed:
+            return self.name or None
+        stored_names = getattr(self.instance, STORED_NAMES_ATTR, {})
+        return stored_names.get(self.field.name)
+
+    def _remember_stored_name(self):
+        """
+        Notes the name this field value is now stored under, for
+        :meth:`_get_replaced_name`.
+        """
+        if self.instance is not None:
+            self.instance.__dict__.setdefault(
+                STORED_NAMES_ATTR, {})[self.field.name] = self.name or None
+
+    def _reuse_stored(self, name, save):
+        """
+        Points this file at an already-stored original (and its thumbnails),
+        the way save() would have if it had just uploaded it.
+        """
+        self.name = name
+        setattr(self.instance, self.field.name, self.name)
+        self._committed = True
+
+        if save:
+            self.instance.save()
+
+    def _pending_cache_key(self):
+        return "Thumbpending_%s" % self.name.replace(' ', '%20')
+
+    def mark_thumbs_pending(self):
+        """
+        Flags this file's thumbnails as queued, but not yet generated.
+        """
+        cache.set(self._pending_cache_key(), True, THUMBNAIL_PENDING_TIMEOUT)
+
+    def clear_thumbs_pending(self):
+        """
+        Flags this file's thumbnails as generated.
+        """
+        cache.delete(self._pending_cache_key())
+
+    def thumbs_pending(self):
+        """
+        Returns ``True`` if this file's thumbnails are queued for generation,
+        but haven't been generated yet.
+        """
+        return bool(cache.get(self._pending_cache_key()))
 
-    def generate_thumbs(self, name, content):
+    def generate_thumbs(self, name, content, thumb_names=None):
+        """
+        Generates and stores thumbnails from the image in ``content``.
+
+        thumb_names: (list) If given, only generate the thumbnails with these
+            names. By default, all of the field's thumbnails are generated.
+        """
         # see http://code.djangoproject.com/ticket/8222 for details
         content.seek(0)
-        image = Image.open(content)
+        if THUMBNAIL_DRAFT_MIN_RATIO:
+            min_size = self._calc_decode_size
+        else:
+            min_size = None
+        image = THUMBNAIL_ENGINE.get_image(content, min_size=min_size)
+        # Decode now, in this thread, so the workers below all share one
+        # read-only copy of the pixel data. This also turns it upright.
+        image = THUMBNAIL_ENGINE.normalize(
+            image,
+            strip_metadata=THUMBNAIL_STRIP_METADATA,
+            convert_srgb=THUMBNAIL_CONVERT_SRGB,
+        )
+
+        plans = [plan for plan in self.field.thumb_plans
+                 if thumb_names is None or plan.name in thumb_names]
+        if self.field.use_cascade():
+            # Do the scaling up front, largest first, so each size can start
+            # from the nearest suitable larger one. The sizes made from the
+            # same source are scaled in the workers, a level at a time, and
+            # cropping, encoding and storing all of them follows.
+            sources = THUMBNAIL_ENGINE.scale_chain(
+                image,
+                [(plan.size, plan.upscale, plan.crop, plan.scale_options)
+                 for plan in plans],
+                min_ratio=THUMBNAIL_CASCADE_MIN_RATIO,
+                run_all=run_all,
+            )
+        else:
+            sources = [image] * len(plans)
 
-        # Convert to RGBA (alpha) if necessary
-        if image.mode not in ('L', 'RGB', 'RGBA'):
-            image = image.convert('RGBA')
+        # Pre-create all of the thumbnail sizes, several at a time.
+        run_all(self.create_and_store_thumb, zip(sources, plans))
 
-        for thumb in self.field.thumbs:
-            thumb_name, thumb_options = thumb
-            # Pre-create all of the thumbnail sizes.
-            self.create_and_store_thumb(image, thumb_name, thumb_options)
+    def _calc_decode_size(self, image_size):
+        """
+        Calculates the smallest dimensions an image of the given size can be
+        decoded at while still leaving enough resolution for every one of
+        the field's thumbnails.
+
+        image_size: (tuple) The original's full dimensions, as (width, height).
 
-    def _calc_thumb_filename(self, thumb_name):
+        Returns a (width, height) tuple.
+        """
+        x_image, y_image = image_size
+        x_needed, y_needed = 1, 1
+        for plan in self.field.thumb_plans:
+            scaled_size = THUMBNAIL_ENGINE.get_scaled_size(
+                image_size, plan.size, plan.upscale, plan.crop)
+            if not scaled_size:
+                # This one keeps the original dimensions.
+                return image_size
+            x_needed = max(x_needed, scaled_size[0] * THUMBNAIL_DRAFT_MIN_RATIO)
+            y_needed = max(y_needed, scaled_size[1] * THUMBNAIL_DRAFT_MIN_RATIO)
+
+        return (min(x_image, int(math.ceil(x_needed))),
+                min(y_image, int(math.ceil(y_needed))))
+
+    def _calc_thumb_filename(self, thumb_name, format=None):
         """
         Calculates the correct filename for a would-be (or potentially
         existing) thumbnail of the given size.
@@ -146,65 +506,224 @@ class ImageWithThumbsFieldFile(ImageFieldFile):
         uploads/cbid_images/photo.png
         
         size: (tuple) In the format of (width, height)
+        format: (str) A variant format, like 'webp'. If omitted, the regular
+            thumbnail format.
         
         Returns a string filename.
         """
         filename_split = self.name.rsplit('.', 1)
         file_name = filename_split[0]
-        file_extension = self.get_thumbnail_format()
+        file_extension = format or self.get_thumbnail_format()
 
         return '%s_%s.%s' % (file_name, thumb_name, file_extension)
 
-    def create_and_store_thumb(self, image, thumb_name, thumb_options):
+    def create_and_store_thumb(self, image, plan):
         """
-        Given that 'image' is a PIL Image object, create a thumbnail for the
-        given size tuple and store it via the storage backend.
+        Given that 'image' is a thumbnail engine Image object, create a
+        thumbnail for the given plan and store it via the storage backend.
         
-        image: (Image) PIL Image object.
-        size: (tuple) Tuple in form of (width, height). Image will be
-            thumbnailed to this size.
+        image: (Image) The engine's Image object (PIL Image, by default).
+        plan: (ThumbnailPlan) One of the field's thumb_plans.
         """
-        size = thumb_options['size']
-        upscale = thumb_options.get('upscale', True)
-        crop = thumb_options.get('crop')
-        if crop is True:
-            # We'll just make an assumption here. Center cropping is the
-            # typical default.
-            crop = 'center'
-
-        thumb_filename = self._calc_thumb_filename(thumb_name)
-        file_extension = self.get_thumbnail_format()
-
         # The work starts here.
         thumbed_image = THUMBNAIL_ENGINE.create_thumbnail(
             image,
-            size,
-            crop=crop,
-            upscale=upscale
+            plan.size,
+            crop=plan.crop,
+            upscale=plan.upscale,
+            **plan.scale_options
         )
-
-        # TODO: Avoiding hitting the disk here, but perhaps we should use temp
-        # files down the road? Big images might choke us as we do part in
-        # RAM then hit swap.
-        img_fobj = cStringIO.StringIO()
-        # This writes the thumbnailed PIL.Image to the file-like object.
-        THUMBNAIL_ENGINE.write(thumbed_image, img_fobj, format=file_extension)
-        # Save the result to the storage backend.
-        thumb_content = ContentFile(img_fobj.getvalue())
-        self.storage.save(thumb_filename, thumb_content)
-        img_fobj.close()
+        if thumbed_image is image:
+            # Already the right size, so it's the very image the other
+            # plans are working from, possibly in other threads.
+            thumbed_image = THUMBNAIL_ENGINE.copy(image)
+
+        # The regular thumbnail, then any extra formats of it.
+        for format in (None,) + self._get_variants(plan):
+            thumb_filename = self._calc_thumb_filename(plan.name, format)
+            quality, max_bytes, encoder_options = \
+                plan.get_encoder_settings(format)
+            encode_options = dict(
+                encoder_options,
+                format=format or self.get_thumbnail_format(),
+                quality=quality,
+                max_memory=THUMBNAIL_SPOOL_MAX_MEMORY,
+            )
+
+            # This encodes the thumbnailed image into a temporary file, which
+            # stays in RAM unless it gets big. The storage backend reads it
+            # from there, so we never hold more than the one copy.
+            if max_bytes:
+                # Lowers the quality until it fits, within a few encodes.
+                img_fobj, quality, size = THUMBNAIL_ENGINE.encode_to_size(
+                    thumbed_image, max_bytes, **encode_options)
+                if size > max_bytes:
+                    logger.warning(
+                        "Thumbnail %s is %d bytes, over its %d byte limit "
+                        "even at quality %d.",
+                        thumb_filename, size, max_bytes, quality)
+            else:
+                img_fobj = THUMBNAIL_ENGINE.encode(
+                    thumbed_image, **encode_options)
+                img_fobj.seek(0, os.SEEK_END)
+                size = img_fobj.tell()
+                img_fobj.seek(0)
+
+            try:
+                # Save the result to the storage backend.
+                saved_name = self.storage.save(thumb_filename, File(img_fobj))
+            finally:
+                img_fobj.close()
+
+            if self.instance is not None:
+                sender = self.instance.__class__
+            else:
+                # Deferred jobs only know the file's name, not its instance.
+                sender = self.field.model
+            thumbnail_stored.send(
+                sender=sender,
+                instance=self.instance,
+                field_file=self,
+                thumb_name=plan.name,
+                name=saved_name,
+                format=encode_options['format'],
+                quality=quality,
+                size=size,
+                max_bytes=max_bytes,
+            )
 
     def delete(self, save=True):
         """
         Deletes the original, plus any thumbnails. Fails silently if there
-        are errors deleting the thumbnails.
+        are errors deleting the thumbnails, though they are logged.
+
+        Returns a dict mapping the names of any thumbnails that couldn't be
+        deleted to the reason why.
         """
-        for thumb in self.field.thumbs:
-            thumb_name, thumb_options = thumb
-            thumb_filename = self._calc_thumb_filename(thumb_name)
-            self.storage.delete(thumb_filename)
+        self._forget_urls()
+
+        if not self:
+            # No file, nothing to clean up.
+            return {}
+
+        dedup_index = get_dedup_index()
+        if dedup_index is not None and not dedup_index.release(self.name):
+            # Other field values still use these files. Just let go of them.
+            self._detach(save)
+            return {}
+
+        # Everything goes in one batch, which is a single request on S3.
+        errors = delete_many(self.storage, self._stored_filenames())
+
+        original_error = errors.pop(self.name, None)
+        for thumb_filename, error in errors.items():
+            logger.warning("Unable to delete thumbnail %s: %s",
+                           thumb_filename, error)
+        if original_error:
+            raise IOError("Unable to delete %s: %s" % (self.name,
+                                                       original_error))
 
-        super(ImageWithThumbsFieldFile, self).delete(save)
+        self._detach(save)
+        return errors
+
+    def _stored_filenames(self):
+        """
+        Returns the storage names of everything stored for this file: the
+        thumbnails, then the original.
+        """
+        filenames = [self._calc_thumb_filename(plan.name, format)
+                     for plan in self.field.thumb_plans
+                     for format in (None,) + self._get_variants(plan)]
+        filenames.append(self.name)
+        return filenames
+
+    def _detach(self, save):
+        """
+        Does everything delete() does, except remove anything from storage.
+        """
+        if hasattr(self, '_dimensions_cache'):
+            del self._dimensions_cache
+        if hasattr(self, '_file'):
+            self.close()
+            del self.file
+
+        self.name = None
+        setattr(self.instance, self.field.name, self.name)
+        if hasattr(self, '_size'):
+            del self._size
+        self._committed = False
+        self._remember_stored_name()
+
+        if save:
+            self.instance.save()
+
+def prefetch_thumbnail_urls(objects, field_name, thumb_names, ssl_mode=False,
+                            cache_bust=True, format=None):
+    """
+    Resolves thumbnail URLs for a whole list (or QuerySet) of objects at once,
+    with one cache get_many() and at most one set_many(), rather than a cache
+    round trip or two per thumbnail per object. The URLs are stashed on each
+    object's field file, so later generate_url() calls and {% thumbnail %}
+    tags with the same arguments are answered from memory.
+
+    objects: (iterable) Model instances with an ImageWithThumbsField.
+    field_name: (str) The name of the ImageWithThumbsField.
+    thumb_names: (list) The names of the thumbnails you'll be using.
+    ssl_mode: (bool) Same as for generate_url().
+    cache_bust: (bool) Same as for generate_url().
+    format: (str) Same as for generate_url().
+
+    Returns the objects as a list, so a QuerySet is only evaluated once.
+    """
+    objects = list(objects)
+    # Skip anything without a file, generate_url() would fail on those anyway.
+    field_files = [field_file for field_file in
+                   (getattr(obj, field_name) for obj in objects)
+                   if field_file]
+
+    # Anything the per-process cache can answer doesn't need to go in the
+    # get_many(). Pending flags always do, they aren't cached locally.
+    cached = {}
+    cache_keys = []
+    for field_file in field_files:
+        if field_file.field.use_deferred():
+            cache_keys.append(field_file._pending_cache_key())
+        for thumb_name in thumb_names:
+            variant = field_file._calc_variant(thumb_name, format)
+            cache_key = field_file._url_cache_key(thumb_name, ssl_mode,
+                                                  cache_bust, variant)
+            url = LOCAL_URL_CACHE.get(cache_key)
+            if url:
+                cached[cache_key] = url
+            else:
+                cache_keys.append(cache_key)
+    if cache_keys:
+        cached.update(cache.get_many(cache_keys))
+
+    to_cache = {}
+    for field_file in field_files:
+        pending = field_file.field.use_deferred() and \
+            cached.get(field_file._pending_cache_key())
+        for thumb_name in thumb_names:
+            variant = field_file._calc_variant(thumb_name, format)
+            if pending:
+                url = field_file._pending_url(ssl_mode)
+            else:
+                cache_key = field_file._url_cache_key(thumb_name, ssl_mode,
+                                                      cache_bust, variant)
+                url = cached.get(cache_key)
+                if not url:
+                    url = field_file._build_thumb_url(thumb_name, ssl_mode,
+                                                      cache_bust, variant)
+                    to_cache[cache_key] = url
+                LOCAL_URL_CACHE.set(cache_key, url)
+            field_file._remember_url(thumb_name, ssl_mode, cache_bust, url,
+                                     variant)
+
+    if to_cache:
+        cache.set_many(to_cache, THUMBNAIL_URL_CACHE_TIME)
+
+    return objects
 
 class ImageWithThumbsField(ImageField):
     """
@@ -217,17 +736,98 @@ class ImageWithThumbsField(ImageField):
     """
 
     attr_class = ImageWithThumbsFieldFile
-    default_validators = [IMAGE_EXTENSION_VALIDATOR]
+    default_validators = [IMAGE_EXTENSION_VALIDATOR, IMAGE_PIXEL_COUNT_VALIDATOR]
 
     def __init__(self, *args, **kwargs):
         self.thumbs = kwargs.pop('thumbs', ())
         self.thumbnail_format = kwargs.pop('thumbnail_format', None)
+        # Extra formats to store every thumbnail in, like ('webp',).
+        self.thumbnail_variants = tuple(kwargs.pop('thumbnail_variants', ()))
+        # The thumbs, checked and worked out ahead of time. Raises
+        # ImproperlyConfigured if any of them are no good.
+        self.thumb_plans = compile_thumbs(self.thumbs, self.thumbnail_format,
+                                          self.thumbnail_variants,
+                                          THUMBNAIL_ENGINE)
+        self._thumb_plans_by_name = dict((plan.name, plan)
+                                         for plan in self.thumb_plans)
+        # None means "use the THUMBNAIL_CASCADE setting".
+        self.cascade = kwargs.pop('cascade', None)
+        # None means "use the THUMBNAIL_DEFERRED setting".
+        self.deferred = kwargs.pop('deferred', None)
+        self._thumbs_fingerprint = None
 
         if 'max_length' not in kwargs:
             kwargs['max_length'] = 255
 
         super(ImageWithThumbsField, self).__init__(*args, **kwargs)
 
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(ImageWithThumbsField, self).contribute_to_class(cls, name,
+                                                              **kwargs)
+        if not cls._meta.abstract:
+            signals.post_init.connect(self._remember_loaded_name, sender=cls)
+
+    def _remember_loaded_name(self, instance, **kwargs):
+        """
+        Notes the name the image was stored under when the instance was
+        loaded, before anything is assigned over it.
+        """
+        # Straight from __dict__, so deferred fields aren't loaded for this.
+        # From the database, it's the name. Uploads passed to the
+        # constructor haven't been stored anywhere yet.
+        value = instance.__dict__.get(self.attname)
+        if getattr(value, '_committed', False):
+            value = value.name
+        if value and isinstance(value, basestring):
+            instance.__dict__.setdefault(STORED_NAMES_ATTR, {})[self.name] = \
+                value
+
+    def get_thumb_plan(self, thumb_name):
+        """
+        Returns the ThumbnailPlan for the thumbnail with the given name, or
+        None if there isn't one.
+        """
+        return self._thumb_plans_by_name.get(thumb_name)
+
+    def use_cascade(self):
+        """
+        Returns ``True`` if smaller thumbnails should be derived from larger
+        ones, rather than always scaling from the original.
+        """
+        if self.cascade is None:
+            return THUMBNAIL_CASCADE
+        return self.cascade
+
+    def use_deferred(self):
+        """
+        Returns ``True`` if thumbnail generation should be queued rather than
+        done during save().
+        """
+        if self.deferred is None:
+            return THUMBNAIL_DEFERRED
+        return self.deferred
+
+    def thumbs_fingerprint(self):
+        """
+        Returns a hash of everything that determines which files get stored
+        for an upload: the storage, the thumbnail format, and the thumbnail
+        specs. Uploads with the same contents and fingerprint can share
+        stored files.
+        """
+        if self._thumbs_fingerprint is None:
+            storage_class = self.storage.__class__
+            spec = (
+                '%s.%s' % (storage_class.__module__, storage_class.__name__),
+                getattr(self.storage, 'bucket_name', None) or
+                    getattr(self.storage, 'location', None),
+                self.thumbnail_format,
+                self.thumbnail_variants,
+                [(thumb_name, sorted(thumb_options.items()))
+                 for thumb_name, thumb_options in self.thumbs],
+            )
+            self._thumbs_fingerprint = hashlib.sha1(repr(spec)).hexdigest()
+        return self._thumbs_fingerprint
+
     def deconstruct(self):
         name, path, args, kwargs = super(ImageWithThumbsField, self).deconstruct()
         # Only include kwarg if it's not the default
@@ -235,7 +835,13 @@ class ImageWithThumbsField(ImageField):
             kwargs['thumbs'] = self.thumbs
         if self.thumbnail_format:
             kwargs['thumbnail_format'] = self.thumbnail_format
-        if self.validators == [IMAGE_EXTENSION_VALIDATOR] and 'validators' in kwargs:
+        if self.thumbnail_variants:
+            kwargs['thumbnail_variants'] = self.thumbnail_variants
+        if self.cascade is not None:
+            kwargs['cascade'] = self.cascade
+        if self.deferred is not None:
+            kwargs['deferred'] = self.deferred
+        if self.validators == self.default_validators and 'validators' in kwargs:
             del kwargs['validators']
         if 'storage' in kwargs:
             del kwargs['storage']
@@ -0,0 +1,83 @@
+"""
+A small in-process cache, used to keep frequently requested thumbnail URLs
+from costing a network round trip to the shared cache every time.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+
+class LocalCache(object):
+    """
+    A bounded, thread-safe, least-recently-used cache whose entries expire
+    after ``timeout`` seconds. Hits, misses and evictions are counted, see
+    :meth:`stats`.
+    """
+    def __init__(self, max_size, timeout):
+        # The most entries to keep. 0 disables the cache.
+        self.max_size = max_size
+        self.timeout = timeout
+        # Keys map to (expiry time, value), least recently used first.
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Returns the value for ``key``, or ``None`` if it is missing or has
+        expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return None
+            # Re-inserting moves it to the most recently used end.
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """
+        Stores ``value`` under ``key``, evicting the least recently used
+        entries if we're over ``max_size``.
+        """
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.timeout, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        """
+        Removes the given keys, if present.
+        """
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes everything. The counters are left alone.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns a dict of the hit, miss and eviction counters, plus the
+        current number of entries.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
@@ -0,0 +1,43 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+
+from athumb.queues.database import DatabaseQueue, \
+                                   THUMBNAIL_QUEUE_CLAIM_TIMEOUT
+
+class Command(BaseCommand):
+    help = 'Generates thumbnails for the jobs waiting in the database queue.'
+
+    if not hasattr(BaseCommand, 'add_arguments'):
+        # Django < 1.8 only knows about optparse options.
+        option_list = BaseCommand.option_list + (
+            make_option('--limit', type='int', dest='limit', default=None,
+                        help='Stop after attempting this many jobs.'),
+            make_option('--max-attempts', type='int', dest='max_attempts',
+                        default=3,
+                        help='Skip jobs that have already been attempted '
+                             'this many times.'),
+            make_option('--claim-timeout', type='int', dest='claim_timeout',
+                        default=THUMBNAIL_QUEUE_CLAIM_TIMEOUT,
+                        help='Retry jobs claimed more than this many '
+                             'seconds ago.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, dest='limit', default=None,
+                            help='Stop after attempting this many jobs.')
+        parser.add_argument('--max-attempts', type=int, dest='max_attempts',
+                            default=3,
+                            help='Skip jobs that have already been '
+                                 'attempted this many times.')
+        parser.add_argument('--claim-timeout', type=int, dest='claim_timeout',
+                            default=THUMBNAIL_QUEUE_CLAIM_TIMEOUT,
+                            help='Retry jobs claimed more than this many '
+                                 'seconds ago.')
+
+    def handle(self, *args, **options):
+        succeeded, failed = DatabaseQueue().drain(
+            limit=options['limit'],
+            max_attempts=options['max_attempts'],
+            claim_timeout=options['claim_timeout'],
+        )
+        print "Processed %d job(s), %d failed." % (succeeded + failed, failed)
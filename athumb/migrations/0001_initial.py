@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedThumbnailJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('payload', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('claimed', models.BooleanField(default=False)),
+                ('claimed_at', models.DateTimeField(null=True, blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+            bases=(models.Model,),
+        ),
+    ]
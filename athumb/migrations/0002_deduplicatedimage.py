@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('athumb', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeduplicatedImage',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('content_hash', models.CharField(max_length=40)),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('name', models.CharField(max_length=255, db_index=True)),
+                ('refcount', models.PositiveIntegerField(default=1)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='deduplicatedimage',
+            unique_together=set([('content_hash', 'fingerprint')]),
+        ),
+    ]
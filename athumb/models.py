@@ -1 +1,48 @@
-# Just kidding!
\ No newline at end of file
+from django.db import models
+
+
+class QueuedThumbnailJob(models.Model):
+    """
+    A thumbnail generation job waiting in the database queue. See
+    :class:`athumb.queues.database.DatabaseQueue`.
+    """
+    # JSON from ThumbnailJob.to_dict().
+    payload = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    # Set while a drainer is working on the job.
+    claimed = models.BooleanField(default=False)
+    # When it was claimed. Claims that get too old (the drainer died) are
+    # taken over by other drainers.
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # How many times the job has been started.
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ('pk',)
+
+    def __unicode__(self):
+        return u'Thumbnail job %s' % self.pk
+
+
+class DeduplicatedImage(models.Model):
+    """
+    An entry in the database deduplication index. See
+    :class:`athumb.dedup.DatabaseIndex`.
+    """
+    # SHA1 of the original's contents.
+    content_hash = models.CharField(max_length=40)
+    # SHA1 of the field's thumbnail specs and storage. See
+    # ImageWithThumbsField.thumbs_fingerprint().
+    fingerprint = models.CharField(max_length=40)
+    # Storage name of the original that was stored for this content.
+    name = models.CharField(max_length=255, db_index=True)
+    # How many field values point at name.
+    refcount = models.PositiveIntegerField(default=1)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('content_hash', 'fingerprint')
+
+    def __unicode__(self):
+        return self.name
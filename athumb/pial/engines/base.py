@@ -1,7 +1,34 @@
 #coding=utf-8
+from collections import namedtuple
+from cStringIO import StringIO
+from tempfile import SpooledTemporaryFile
+
+from athumb.pial import smartcrop
 from athumb.pial.helpers import toint
 from athumb.pial.parsers import parse_crop
 
+# What EngineBase.probe() finds out about an image from its header.
+# format: The format name, like 'JPEG' or 'PNG'.
+# size: Dimensions in the form of (x,y).
+# mode: The engine's name for the pixel format, like 'RGB'.
+# frames: The number of frames seen (1 for still images).
+# orientation: The EXIF orientation tag, 1 (upright) if there isn't one.
+ImageInfo = namedtuple('ImageInfo',
+                       ['format', 'size', 'mode', 'frames', 'orientation'])
+
+# probe() starts by reading this much, doubling until it finds the header.
+PROBE_CHUNK_SIZE = 16 * 1024
+
+# Formats where quality affects the encoded size. encode_to_size() only
+# searches for a quality with these.
+LOSSY_FORMATS = frozenset(['JPEG', 'WEBP', 'AVIF', 'HEIF', 'JPEG2000'])
+# encode_to_size() estimates sizes from trial encodes of a copy that's this
+# many times smaller on each side, so a quarter (or less) of the work.
+TRIAL_SHRINK = 2
+# The most trial encodes encode_to_size() makes per estimate.
+TRIAL_ATTEMPTS = 6
+
+
 class EngineBase(object):
     """
     A base class whose public methods define the public-facing API for all
@@ -15,7 +42,8 @@ class EngineBase(object):
         sub-classes.
     """
     def create_thumbnail(self, image, geometry,
-                         upscale=True, crop=None, colorspace='RGB'):
+                         upscale=True, crop=None, colorspace='RGB',
+                         resample=None, reducing_gap=None):
         """
         This serves as a really basic example of a thumbnailing method. You
         may want to implement your own logic, but this will work for
@@ -32,13 +60,56 @@ class EngineBase(object):
             '50%', '50px'.
         :keyword str colorspace: The colorspace to set/convert the image to.
             This is typically 'RGB' or 'GRAY'.
+        :keyword str resample: See :meth:`_scale`.
+        :keyword float reducing_gap: See :meth:`_scale`.
         :returns: The thumbnailed image. The returned type depends on your
             choice of Engine.
         """
-        image = self.colorspace(image, colorspace)
-        image = self.scale(image, geometry, upscale, crop)
-        image = self.crop(image, geometry, crop)
+        if self._colorspace_commutes(image, colorspace):
+            # Comes out the same either way, and the thumbnail is a lot
+            # smaller than what we started with.
+            image = self.scale(image, geometry, upscale, crop,
+                               resample=resample, reducing_gap=reducing_gap)
+            image = self.crop(image, geometry, crop)
+            image = self.colorspace(image, colorspace)
+        else:
+            image = self.colorspace(image, colorspace)
+            image = self.scale(image, geometry, upscale, crop,
+                               resample=resample, reducing_gap=reducing_gap)
+            image = self.crop(image, geometry, crop)
+
+        return image
+
+    def normalize(self, image, strip_metadata=True, convert_srgb=False):
+        """
+        Prepares a freshly loaded image for thumbnailing: converts it to a
+        mode the rest of the engine can work with, turns it upright
+        according to its EXIF orientation, and decodes it if loading is
+        lazy. Several thumbnails may then be made from the result at once,
+        from different threads.
+
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :keyword bool strip_metadata: Leave EXIF, ICC profiles and other
+            metadata out of the thumbnails.
+        :keyword bool convert_srgb: Convert the colors from any embedded ICC
+            profile to sRGB.
+        :returns: The normalized image. The returned type depends on your
+            choice of Engine.
+        """
+        return image
+
+    def copy(self, image):
+        """
+        Returns an image that can be encoded at the same time as ``image``,
+        from another thread. The default suits engines whose images are
+        never modified once made, and returns ``image`` itself.
 
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :returns: The image, or a copy of it. The returned type depends on
+            your choice of Engine.
+        """
         return image
 
     def colorspace(self, image, colorspace):
@@ -55,7 +126,8 @@ class EngineBase(object):
         """
         return self._colorspace(image, colorspace)
 
-    def scale(self, image, geometry, upscale, crop):
+    def scale(self, image, geometry, upscale, crop, resample=None,
+              reducing_gap=None):
         """
         Given an image, scales the image down (or up, if ``upscale`` equates
         to a boolean ``True``).
@@ -63,20 +135,122 @@ class EngineBase(object):
         :param Image image: This is your engine's ``Image`` object. For
             PIL it's PIL.Image.
         :param tuple geometry: Geometry of the image in the format of (x,y).
+        :keyword str resample: See :meth:`_scale`.
+        :keyword float reducing_gap: See :meth:`_scale`.
         :returns: The scaled image. The returned type depends on your
             choice of Engine.
         """
-        x_image, y_image = map(float, self.get_image_size(image))
+        image_size = self.get_image_size(image)
+        scaled_size = self.get_scaled_size(image_size, geometry, upscale, crop)
+        if scaled_size and scaled_size != tuple(image_size):
+            image = self._scale(image, scaled_size[0], scaled_size[1],
+                                resample=resample, reducing_gap=reducing_gap)
+
+        return image
+
+    def get_scaled_size(self, image_size, geometry, upscale, crop):
+        """
+        Calculates the dimensions that :meth:`scale` would scale an image of
+        the given size to.
+
+        :param tuple image_size: Dimensions of the source image, in the
+            format of (x,y).
+        :param tuple geometry: Geometry of the thumbnail in the format of (x,y).
+        :rtype: tuple
+        :returns: The scaled dimensions in the form of (x,y), or ``None`` if
+            the image would be left at its original size.
+        """
+        x_image, y_image = map(float, image_size)
 
         # Calculate scaling factor.
         factors = (geometry[0] / x_image, geometry[1] / y_image)
         factor = max(factors) if crop else min(factors)
         if factor < 1 or upscale:
-            width = toint(x_image * factor)
-            height = toint(y_image * factor)
-            image = self._scale(image, width, height)
+            return toint(x_image * factor), toint(y_image * factor)
+        return None
 
-        return image
+    def scale_chain(self, image, specs, min_ratio=2.0, run_all=None):
+        """
+        Scales ``image`` once for each of the given thumbnail specs, deriving
+        smaller sizes from the larger scaled images instead of going back to
+        the (potentially huge) original every time. A larger scaled image is
+        only used as the source if it is at least ``min_ratio`` times the
+        target size in both dimensions, which keeps the quality loss from
+        resampling twice negligible. Images that were upscaled are never used
+        as sources.
+
+        The returned images are scaled to exactly the size :meth:`scale` would
+        produce from the original, but are not cropped. Pass them through
+        :meth:`create_thumbnail` to finish them off.
+
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :param list specs: A list of ``(geometry, upscale, crop,
+            scale_options)`` tuples, where ``scale_options`` is a dict of
+            keyword arguments for :meth:`_scale`.
+        :param float min_ratio: How much larger an intermediate image must be
+            than the target before we'll scale from it.
+        :keyword run_all: A function like :func:`athumb.workers.run_all`,
+            which calls ``func(*args)`` for each tuple in a list and returns
+            once they're all done. The sizes scaled from the same source
+            don't depend on each other, so they're scaled through this, a
+            level of the chain at a time. By default, one after another.
+        :rtype: list
+        :returns: One scaled image per spec, in the same order as ``specs``.
+        """
+        image_size = self.get_image_size(image)
+        scaled_sizes = [self.get_scaled_size(image_size, geometry, upscale, crop)
+                        for geometry, upscale, crop, scale_options in specs]
+
+        # Work from the largest target area down, so every intermediate we
+        # might want to derive from has been planned first.
+        by_area = sorted(
+            [index for index, size in enumerate(scaled_sizes) if size],
+            key=lambda index: scaled_sizes[index][0] * scaled_sizes[index][1],
+            reverse=True)
+
+        # Which spec's result each one is scaled from (None for the
+        # original), and how many scales away from the original it is.
+        sources = {}
+        depths = {}
+        for position, index in enumerate(by_area):
+            width, height = scaled_sizes[index]
+            source = None
+            for candidate in reversed(by_area[:position]):
+                x_candidate, y_candidate = scaled_sizes[candidate]
+                if x_candidate > image_size[0] or \
+                   y_candidate > image_size[1]:
+                    # Upscaled, so it has no more detail than the original,
+                    # and resampling it again would only blur.
+                    continue
+                if x_candidate >= width * min_ratio and \
+                   y_candidate >= height * min_ratio:
+                    source = candidate
+                    break
+            sources[index] = source
+            depths[index] = 0 if source is None else depths[source] + 1
+
+        results = [image] * len(specs)
+
+        def scale_one(index):
+            source = results[sources[index]] \
+                if sources[index] is not None else image
+            width, height = scaled_sizes[index]
+            if (width, height) == tuple(self.get_image_size(source)):
+                results[index] = source
+            else:
+                results[index] = self._scale(source, width, height,
+                                             **specs[index][3])
+
+        if run_all is None:
+            def run_all(func, arg_tuples):
+                for args in arg_tuples:
+                    func(*args)
+        for depth in range(max(depths.values()) + 1 if depths else 0):
+            run_all(scale_one, [(index,) for index in by_area
+                                if depths[index] == depth])
+
+        return results
 
     def crop(self, image, geometry, crop):
         """
@@ -91,7 +265,9 @@ class EngineBase(object):
             amount (pixels or percentage) for both X and Y dimensions is the
             amount given. If two values are specified, X and Y dimension cropping
             may be set independently. Some examples: '50% 50%', '50px 20px',
-            '50%', '50px'.
+            '50%', '50px'. This may also be an anchor already parsed with
+            :func:`athumb.pial.parsers.parse_crop_anchor`, or 'smart' to
+            keep the most detailed part of the image (needs numpy).
         :returns: The cropped image. The returned type depends on your
             choice of Engine.
         """
@@ -99,30 +275,270 @@ class EngineBase(object):
             return image
 
         x_image, y_image = self.get_image_size(image)
-        x_offset, y_offset = parse_crop(crop, (x_image, y_image), geometry)
+        if crop == 'smart':
+            x_offset, y_offset = self.get_smart_crop_offset(image, geometry)
+        else:
+            x_offset, y_offset = parse_crop(crop, (x_image, y_image), geometry)
 
         return self._crop(image, geometry[0], geometry[1], x_offset, y_offset)
 
-    def write(self, image, dest_fobj, quality=95, format=None):
+    def get_smart_crop_offset(self, image, geometry):
+        """
+        Works out where to crop ``image`` to keep the part of it with the
+        most going on, as measured on a small grayscale copy.
+
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :param tuple geometry: Geometry of the crop window, as (x,y).
+        :rtype: tuple
+        :returns: The cropping offsets, as (x,y).
+        """
+        x_image, y_image = self.get_image_size(image)
+        x_window = min(geometry[0], x_image)
+        y_window = min(geometry[1], y_image)
+        if (x_window, y_window) == (x_image, y_image):
+            # Nothing to cut off.
+            return 0, 0
+
+        pixels = self._get_luminance(image, smartcrop.SMART_CROP_SIZE)
+        x_scale = float(pixels.shape[1]) / x_image
+        y_scale = float(pixels.shape[0]) / y_image
+
+        x_small, y_small = smartcrop.find_best_window(
+            smartcrop.get_energy_map(pixels),
+            x_window * x_scale, y_window * y_scale)
+
+        x_offset = min(toint(x_small / x_scale), x_image - x_window)
+        y_offset = min(toint(y_small / y_scale), y_image - y_window)
+        return x_offset, y_offset
+
+    def write_to(self, image, fobj, quality=95, format=None, **options):
         """
-        Wrapper for ``_write``
+        Encodes ``image`` straight into ``fobj``. Engines that can encode
+        into a file object do so without holding the encoded image in memory
+        first. Wrapper for ``_write``.
 
         :param Image image: This is your engine's ``Image`` object. For
             PIL it's PIL.Image.
+        :param file fobj: A writable file-like object.
         :keyword int quality: A quality level as a percent. The lower, the
             higher the compression, the worse the artifacts.
         :keyword str format: The format to save to. If omitted, guess based
             on the extension. We recommend specifying this. Typical values
-            are 'JPEG', 'GIF', 'PNG'. Other formats largely depend on your
-            choice of Engine.
+            are 'JPEG', 'GIF', 'PNG', 'WEBP'. Other formats largely depend on
+            your choice of Engine.
+        :keyword options: Any other encoder settings, like ``progressive``
+            or ``subsampling``. These are passed along to the Engine's
+            encoder, so what's accepted depends on your choice of Engine and
+            ``format``.
         """
         if isinstance(format, basestring) and format.lower() == 'jpg':
             # This mistake is made all the time. Let's just effectively alias
             # this, since it's commonly used.
             format = 'JPEG'
 
-        raw_data = self._get_raw_data(image, format, quality)
-        dest_fobj.write(raw_data)
+        self._write(image, fobj, format, quality, **options)
+
+    def write(self, image, dest_fobj, quality=95, format=None, **options):
+        """
+        The same as :meth:`write_to`.
+        """
+        self.write_to(image, dest_fobj, quality=quality, format=format,
+                      **options)
+
+    def encode(self, image, sink=None, quality=95, format=None,
+               max_memory=1024 * 1024, **options):
+        """
+        Encodes ``image`` into ``sink``, and returns the sink rewound to the
+        start of the encoded data. This is :meth:`write_to`, plus handling the
+        buffer for you.
+
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :keyword file sink: A writable file-like object. If omitted, a
+            temporary file is used that stays in memory until it grows past
+            ``max_memory`` bytes, then moves to disk.
+        :keyword int quality: See :meth:`write_to`.
+        :keyword str format: See :meth:`write_to`.
+        :keyword int max_memory: Only used if ``sink`` is omitted.
+        :keyword options: See :meth:`write_to`.
+        :returns: The sink. If we created it, close it when you're done.
+        """
+        if sink is None:
+            sink = SpooledTemporaryFile(max_size=max_memory)
+
+        start = sink.tell()
+        self.write_to(image, sink, quality=quality, format=format, **options)
+        sink.seek(start)
+        return sink
+
+    def encode_to_size(self, image, max_bytes, sink=None, quality=95,
+                       min_quality=20, max_attempts=4, format=None,
+                       max_memory=1024 * 1024, **options):
+        """
+        Like :meth:`encode`, but finds the highest quality, from ``quality``
+        down to ``min_quality``, whose output is no larger than
+        ``max_bytes``. Each quality tried comes from trial encodes of a
+        shrunken copy, checked against the latest full encode. The search
+        is a bisection of at most ``max_attempts`` full encodes, counting
+        the first one at ``quality`` (which is all it takes if that fits).
+
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :param int max_bytes: The size to fit in.
+        :keyword int min_quality: Never go below this quality. If even this
+            doesn't fit, you get it anyway, and the size shows by how much.
+        :keyword int max_attempts: The most full encodes to make.
+        :keyword: See :meth:`encode` for the rest.
+        :rtype: tuple
+        :returns: A ``(sink, quality, size)`` tuple. ``sink`` is rewound
+            to the start of the encoded data, ``quality`` is what it was
+            encoded with, and ``size`` is its length in bytes.
+        """
+        if isinstance(format, basestring) and format.lower() == 'jpg':
+            format = 'JPEG'
+        if sink is None:
+            sink = SpooledTemporaryFile(max_size=max_memory)
+        start = sink.tell()
+
+        def attempt(attempt_quality):
+            sink.seek(start)
+            sink.truncate()
+            self.write_to(image, sink, quality=attempt_quality,
+                          format=format, **options)
+            return sink.tell() - start
+
+        size = attempt(quality)
+        if size <= max_bytes or not format or \
+           format.upper() not in LOSSY_FORMATS:
+            sink.seek(start)
+            return sink, quality, size
+
+        # What we know: ``quality`` is too big. Bisect what's left, trying
+        # the estimate rather than the middle where there is one.
+        low, high = min_quality, quality - 1
+        estimate = self._get_size_estimator(image, format, options)
+        if estimate is not None:
+            guess = estimate(max_bytes, low, high, size, quality)
+        else:
+            guess = None
+        best = None
+        encoded_quality = quality
+        attempts = 1
+        # Leaves one attempt for re-encoding at the best quality found, if
+        # that isn't the last one tried.
+        while low <= high and attempts < max_attempts - 1:
+            if guess is not None and low <= guess <= high:
+                encoded_quality = guess
+            else:
+                encoded_quality = (low + high) // 2
+            size = attempt(encoded_quality)
+            attempts += 1
+            if size <= max_bytes:
+                best = encoded_quality
+                low = encoded_quality + 1
+            else:
+                high = encoded_quality - 1
+            if estimate is not None and low <= high:
+                # How trial and full sizes compare drifts with the quality,
+                # so this encode makes a better yardstick than the last.
+                guess = estimate(max_bytes, low, high, size, encoded_quality)
+
+        if best is None:
+            # Nothing we tried fits. The smallest we're allowed is as close
+            # as it gets.
+            best = min_quality
+        if best != encoded_quality:
+            size = attempt(best)
+
+        sink.seek(start)
+        return sink, best, size
+
+    def _get_size_estimator(self, image, format, options):
+        """
+        Returns a function that guesses the highest quality that fits in a
+        given size, from trial encodes of a shrunken copy of ``image``. It
+        takes ``(max_bytes, low, high, full_size, full_quality)``, and
+        scales trial sizes by how a full encode of ``full_size`` bytes at
+        ``full_quality`` compares to the trial one, then bisects between
+        ``low`` and ``high``. Trial sizes are only worked out once per
+        quality.
+
+        :rtype: function
+        :returns: The estimating function. ``None`` if the image is too
+            small for trial encodes to be worthwhile.
+        """
+        x_image, y_image = self.get_image_size(image)
+        x_trial, y_trial = x_image // TRIAL_SHRINK, y_image // TRIAL_SHRINK
+        if x_trial < 16 or y_trial < 16:
+            return None
+        trial_image = self._scale(image, x_trial, y_trial, resample='bilinear')
+        trial_sizes = {}
+
+        def trial_size(trial_quality):
+            if trial_quality not in trial_sizes:
+                buf = StringIO()
+                self.write_to(trial_image, buf, quality=trial_quality,
+                              format=format, **options)
+                trial_sizes[trial_quality] = len(buf.getvalue())
+            return trial_sizes[trial_quality]
+
+        def estimate(max_bytes, low, high, full_size, full_quality):
+            # How much bigger the full encode is than the trial one.
+            ratio = float(full_size) / max(1, trial_size(full_quality))
+            guess = low
+            for _ in range(TRIAL_ATTEMPTS):
+                if low > high:
+                    break
+                middle = (low + high) // 2
+                if trial_size(middle) * ratio <= max_bytes:
+                    guess = middle
+                    low = middle + 1
+                else:
+                    high = middle - 1
+            return guess
+
+        return estimate
+
+    def probe(self, fobj, max_bytes=256 * 1024):
+        """
+        Reads just enough of an image to parse its header, without decoding
+        or allocating any pixel data. Use this to check what you're dealing
+        with before doing anything expensive.
+
+        :param file fobj: A readable file-like object, positioned at the
+            start of the image. If it can seek, it is put back where it was
+            afterwards.
+        :keyword int max_bytes: Give up after reading this many bytes.
+            Headers are normally in the first few kilobytes, but large EXIF
+            data or color profiles can push them further in.
+        :rtype: ImageInfo
+        :returns: What the header says, or ``None`` if it couldn't be parsed
+            in ``max_bytes``.
+        """
+        try:
+            start = fobj.tell()
+        except (AttributeError, IOError):
+            start = None
+
+        data = ''
+        read_size = PROBE_CHUNK_SIZE
+        try:
+            while True:
+                chunk = fobj.read(min(read_size, max_bytes - len(data)))
+                if not chunk:
+                    # Ran out of image before finding a whole header.
+                    return None
+                data += chunk
+                info = self._probe(data)
+                if info or len(data) >= max_bytes:
+                    return info
+                # Double the amount we have, so a big header takes a handful
+                # of attempts at most.
+                read_size = len(data)
+        finally:
+            if start is not None:
+                fobj.seek(start)
 
     def get_image_ratio(self, image):
         """
@@ -140,12 +556,19 @@ class EngineBase(object):
     # Methods which engines need to implement
     # The ``image`` argument refers to a backend image object
     #
-    def get_image(self, source):
+    def get_image(self, source, min_size=None):
         """
         Given a file-like object, loads it up into the Engine's choice of
         native object and returns it.
 
         :param file source: A file-like object to load the image from.
+        :keyword min_size: An optional hint as to the smallest dimensions,
+            in the format of (x,y), that the loaded image may have. Engines
+            that can decode at a reduced resolution (JPEG DCT scaling, for
+            example) may use this to do less work, so long as the result is
+            at least this large in both dimensions. This may also be a
+            callable, which is given the source's full dimensions (as read
+            from its header) and returns the hint.
         :returns: Your Engine's representation of an Image file.
         """
         raise NotImplemented()
@@ -161,6 +584,16 @@ class EngineBase(object):
         """
         raise NotImplemented()
 
+    def can_write(self, format):
+        """
+        Checks whether the engine can save images in ``format``. Engines
+        that can't tell say they can, and find out when saving.
+
+        :param str format: A format name, like 'JPEG' or 'webp'.
+        :rtype: bool
+        """
+        return True
+
     def is_valid_image(self, raw_data):
         """
         Checks if the supplied raw data is valid image data.
@@ -171,7 +604,36 @@ class EngineBase(object):
         """
         raise NotImplemented()
 
-    def _scale(self, image, width, height):
+    def _get_luminance(self, image, max_size):
+        """
+        Returns a shrunken grayscale copy of the image as a numpy array, for
+        :meth:`get_smart_crop_offset` to look over.
+
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :param int max_size: The longest side of the copy may be no longer
+            than this.
+        :rtype: numpy.ndarray
+        :returns: A 2D array, indexed by [y, x].
+        """
+        raise NotImplemented()
+
+    def _probe(self, data):
+        """
+        Parses the header at the start of ``data``. This method is called
+        from :meth:`probe`, with more data each time until it succeeds.
+
+        :param str data: The start of the image's raw data. This may be cut
+            off anywhere.
+        :rtype: ImageInfo
+        :returns: What the header says, or ``None`` if ``data`` doesn't hold
+            a complete header (or isn't an image).
+        :raises: :class:`athumb.pial.helpers.ImageTooLargeError` if the
+            header is parsed, but the image is too big to even open.
+        """
+        raise NotImplemented()
+
+    def _scale(self, image, width, height, resample=None, reducing_gap=None):
         """
         Given an image, scales the image to the given ``width`` and ``height``.
 
@@ -179,6 +641,14 @@ class EngineBase(object):
             PIL it's PIL.Image.
         :param int width: The width of the scaled image.
         :param int height: The height of the scaled image.
+        :keyword str resample: The name of the resampling filter to use, for
+            example 'lanczos', 'bicubic', 'bilinear' or 'nearest'. If
+            ``None``, the engine's high-quality default is used.
+        :keyword float reducing_gap: If given, the image is first shrunk by
+            an integer factor with a fast box filter, to no less than this
+            many times the target size, before the ``resample`` filter is
+            applied. Lower values are faster, higher values are closer to
+            using ``resample`` alone.
         :returns: The scaled image. The returned type depends on your
             choice of Engine.
         """
@@ -200,15 +670,34 @@ class EngineBase(object):
         """
         raise NotImplemented()
 
-    def _get_raw_data(self, image, format, quality):
+    def _write(self, image, dest_fobj, format, quality, **options):
+        """
+        Encodes the image into ``dest_fobj``. This method is called from
+        :meth:`write_to`. The default implementation writes the output of
+        :meth:`_get_raw_data`. Engines that can encode straight into a file
+        object should override this to avoid holding an extra copy of the
+        encoded image in memory.
+
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :param file dest_fobj: A writable file-like object.
+        :param str format: The format to dump the image in.
+        :param int quality: A quality level as a percent.
+        :param options: Any other encoder settings. See :meth:`write_to`.
+        """
+        dest_fobj.write(self._get_raw_data(image, format, quality, **options))
+
+    def _get_raw_data(self, image, format, quality, **options):
         """
         Gets raw data given the image, format and quality. This method is
-        called from :meth:`write`
+        called from the default :meth:`_write`
 
         :param Image image: This is your engine's ``Image`` object. For
             PIL it's PIL.Image.
         :param str format: The format to dump the image in. Typical values
             are 'JPEG', 'GIF', and 'PNG', but are dependent upon the Engine.
+        :param int quality: A quality level as a percent.
+        :param options: Any other encoder settings. See :meth:`write_to`.
         :rtype: str
         :returns: The string representation of the image.
         """
@@ -226,4 +715,18 @@ class EngineBase(object):
         :returns: The colorspace-adjusted image. The returned type depends on
             your choice of Engine.
         """
-        raise NotImplemented()
\ No newline at end of file
+        raise NotImplemented()
+
+    def _colorspace_commutes(self, image, colorspace):
+        """
+        Returns ``True`` if converting ``image`` to ``colorspace`` gives
+        exactly the same pixels whether it is done before or after scaling
+        and cropping. :meth:`create_thumbnail` then converts last, on the
+        small image. The default is to always convert first.
+
+        :param Image image: This is your engine's ``Image`` object. For
+            PIL it's PIL.Image.
+        :param str colorspace: The colorspace to set/convert the image to.
+        :rtype: bool
+        """
+        return False
\ No newline at end of file
@@ -1,26 +1,192 @@
+import math
 from cStringIO import StringIO
-from athumb.pial.engines.base import EngineBase
+from tempfile import SpooledTemporaryFile
+from athumb.pial.engines.base import EngineBase, ImageInfo
+from athumb.pial.helpers import ThumbnailError, ImageTooLargeError
 
 try:
     from PIL import Image, ImageFile, ImageDraw
 except ImportError:
     import Image, ImageFile, ImageDraw
 
+# Names for the resample option of _scale(). Pillow has renamed and added
+# filters over the years, so only the ones this version has are listed.
+RESAMPLE_FILTERS = dict(
+    (name, getattr(Image, constant)) for name, constant in (
+        ('nearest', 'NEAREST'),
+        ('box', 'BOX'),
+        ('bilinear', 'BILINEAR'),
+        ('hamming', 'HAMMING'),
+        ('bicubic', 'BICUBIC'),
+        ('lanczos', 'LANCZOS'),
+        ('antialias', 'ANTIALIAS'),
+    ) if hasattr(Image, constant)
+)
+
+
+# Pillow 5.0+ refuses to open images far over Image.MAX_IMAGE_PIXELS.
+DECOMPRESSION_BOMB_ERRORS = tuple(
+    getattr(Image, name) for name in ('DecompressionBombError',)
+    if hasattr(Image, name))
+
+# The EXIF tag for orientation.
+EXIF_ORIENTATION = 0x0112
+
+# The transposes that turn an image with the given EXIF orientation upright.
+# Orientations 5 to 8 have the width and height swapped.
+ORIENTATION_TRANSPOSES = {
+    2: (Image.FLIP_LEFT_RIGHT,),
+    3: (Image.ROTATE_180,),
+    4: (Image.FLIP_TOP_BOTTOM,),
+    5: (Image.ROTATE_90, Image.FLIP_TOP_BOTTOM),
+    6: (Image.ROTATE_270,),
+    7: (Image.ROTATE_270, Image.FLIP_TOP_BOTTOM),
+    8: (Image.ROTATE_90,),
+}
+
+# Image.info keys holding metadata, rather than anything needed to show the
+# image. Some encoders copy these from the image into the file.
+METADATA_INFO_KEYS = frozenset([
+    'exif', 'icc_profile', 'xmp', 'XML:com.adobe.xmp', 'photoshop',
+    'iptc', 'comment', 'extra',
+])
+
+# _get_luminance() samples big images down to this many times the size it
+# was asked for, with the cheapest filter, before doing it properly.
+LUMINANCE_SAMPLE_FACTOR = 4
+
+# Formats whose PIL encoders take the optimize option. Others either ignore
+# it or fail on it.
+OPTIMIZE_FORMATS = frozenset(['JPEG', 'PNG', 'GIF'])
+
+# PIL before Pillow 2.0 needs an optimized JPEG to fit in one encoder block.
+# Pillow sizes that block itself. Done once here, rather than on every save,
+# since saves happen from several threads at once.
+if ImageFile.MAXBLOCK < 1024 * 1024:
+    ImageFile.MAXBLOCK = 1024 * 1024
+
+
 class PILEngine(EngineBase):
     """
     Python Imaging Library Engine. This implements members of EngineBase.
     """
-    def get_image(self, source):
+    def get_image(self, source, min_size=None):
         """
         Given a file-like object, loads it up into a PIL.Image object
         and returns it.
 
         :param file source: A file-like object to load the image from.
+        :keyword min_size: An optional (x,y) tuple, or a callable that
+            returns one given the source's dimensions. Both are upright, as
+            :meth:`normalize` will leave the image. JPEGs are decoded at the
+            smallest 1/2, 1/4 or 1/8 scale that still covers it.
         :rtype: PIL.Image
         :returns: The loaded image.
         """
         buf = StringIO(source.read())
-        return Image.open(buf)
+        image = Image.open(buf)
+
+        if min_size is not None and image.format == 'JPEG':
+            # Image.open() only reads the header, so this is cheap.
+            sideways = self._get_orientation(image) in (5, 6, 7, 8)
+            if callable(min_size):
+                min_size = min_size(image.size[::-1] if sideways
+                                    else image.size)
+            if min_size:
+                if sideways:
+                    # The decoder works on the image as stored.
+                    min_size = tuple(min_size)[::-1]
+                # Has libjpeg scale the DCT blocks down while decoding, which
+                # is much faster and lighter than decoding at full size.
+                image.draft(image.mode, tuple(max(1, int(dim))
+                                              for dim in min_size))
+
+        return image
+
+    def normalize(self, image, strip_metadata=True, convert_srgb=False):
+        """
+        Converts the image to one of L, RGB or RGBA, decodes it, and turns
+        it upright according to its EXIF orientation. PIL loads lazily,
+        which isn't safe to do from several threads at once.
+
+        The turn comes after decoding, so it only costs a transpose of
+        what :meth:`get_image` drafted, which is often much smaller than the
+        original.
+
+        :param PIL.Image image: A freshly loaded image.
+        :keyword bool strip_metadata: Drop EXIF, ICC, XMP and the like, so
+            thumbnails are saved without them.
+        :keyword bool convert_srgb: Convert the pixels from any embedded ICC
+            profile to sRGB, which browsers assume when there's no profile.
+            Needs PIL built with littleCMS.
+        :rtype: PIL.Image
+        :returns: The normalized image.
+        """
+        orientation = self._get_orientation(image)
+
+        if convert_srgb and image.info.get('icc_profile'):
+            image = self._convert_to_srgb(image)
+
+        # Convert to RGBA (alpha) if necessary
+        if image.mode not in ('L', 'RGB', 'RGBA'):
+            image = image.convert('RGBA')
+
+        image.load()
+
+        for method in ORIENTATION_TRANSPOSES.get(orientation, ()):
+            image = image.transpose(method)
+
+        info = image.info
+        if strip_metadata:
+            info = dict((key, value) for key, value in info.items()
+                        if key not in METADATA_INFO_KEYS)
+        elif orientation != 1:
+            # It would turn the now upright image a second time.
+            info = dict(info)
+            info.pop('exif', None)
+        image.info = info
+        return image
+
+    def _convert_to_srgb(self, image):
+        """
+        Converts the image from its embedded ICC profile to sRGB. Images
+        whose profile doesn't fit their mode are left as they are.
+
+        :param PIL.Image image: An image with an ``icc_profile``.
+        :rtype: PIL.Image
+        :returns: The converted image, without the profile.
+        """
+        try:
+            from PIL import ImageCms
+        except ImportError:
+            import ImageCms
+
+        if image.mode not in ('RGB', 'RGBA', 'CMYK'):
+            return image
+        try:
+            source_profile = ImageCms.ImageCmsProfile(
+                StringIO(image.info['icc_profile']))
+            converted = ImageCms.profileToProfile(
+                image, source_profile, ImageCms.createProfile('sRGB'),
+                outputMode='RGBA' if image.mode == 'RGBA' else 'RGB')
+        except (ImageCms.PyCMSError, IOError, ValueError):
+            # Mangled, or meant for another mode. Keep what we have.
+            return image
+
+        converted.info = dict(image.info)
+        del converted.info['icc_profile']
+        return converted
+
+    def copy(self, image):
+        """
+        PIL's ``Image.save()`` keeps its encoder settings on the image, so
+        two threads can't save the same one at once.
+
+        :param PIL.Image image: The image to copy.
+        :rtype: PIL.Image
+        :returns: A copy of the image.
+        """
+        return image.copy()
 
     def get_image_size(self, image):
         """
@@ -32,6 +198,21 @@ class PILEngine(EngineBase):
         """
         return image.size
 
+    def can_write(self, format):
+        """
+        Checks whether PIL has an encoder for ``format``. Plugins that add
+        formats, like ``pillow_avif``, need to have been imported by now.
+
+        :param str format: A format name, like 'JPEG' or 'webp'.
+        :rtype: bool
+        """
+        format = format.upper()
+        if format == 'JPG':
+            format = 'JPEG'
+        # Loads the plugins for the formats Pillow comes with.
+        Image.init()
+        return format in Image.SAVE
+
     def is_valid_image(self, raw_data):
         """
         Checks if the supplied raw data is valid image data.
@@ -49,6 +230,52 @@ class PILEngine(EngineBase):
             return False
         return True
 
+    def _probe(self, data):
+        """
+        Parses the header at the start of ``data``. Image.open() only reads
+        the header, and doesn't allocate anything for the pixels.
+
+        :param str data: The start of the image's raw data.
+        :rtype: ImageInfo
+        :returns: What the header says, or ``None``.
+        """
+        try:
+            image = Image.open(StringIO(data))
+        except DECOMPRESSION_BOMB_ERRORS, exc:
+            raise ImageTooLargeError(str(exc))
+        except Exception:
+            # Cut off mid-header, or not an image we know.
+            return None
+
+        try:
+            # Multi-frame formats only count the frames in what we've read.
+            frames = getattr(image, 'n_frames', 1)
+        except Exception:
+            frames = 1
+
+        return ImageInfo(format=image.format, size=image.size,
+                         mode=image.mode, frames=frames,
+                         orientation=self._get_orientation(image))
+
+    def _get_orientation(self, image):
+        """
+        Returns the image's EXIF orientation, or 1 (upright) if it doesn't
+        have one.
+
+        :param PIL.Image image: An opened image.
+        :rtype: int
+        """
+        try:
+            if hasattr(image, 'getexif'):
+                exif = image.getexif()
+            else:
+                # Older versions only had this, and only for JPEGs.
+                exif = image._getexif()
+            return (exif or {}).get(EXIF_ORIENTATION, 1)
+        except Exception:
+            # Missing or mangled EXIF data.
+            return 1
+
     def _colorspace(self, image, colorspace):
         """
         Sets the image's colorspace. This is typical 'RGB' or 'GRAY', but
@@ -60,27 +287,86 @@ class PILEngine(EngineBase):
         :returns: The colorspace-adjusted image.
         """
         if colorspace == 'RGB':
-            if image.mode == 'RGBA':
-                # RGBA is just RGB + Alpha
+            if image.mode in ('RGB', 'RGBA'):
+                # Nothing to do. RGBA is just RGB + Alpha. This may hand
+                # back the image it was given, see EngineBase.copy().
                 return image
             if image.mode == 'P' and 'transparency' in image.info:
                 return image.convert('RGBA')
             return image.convert('RGB')
         if colorspace == 'GRAY':
+            if image.mode == 'L':
+                return image
             return image.convert('L')
         return image
 
-    def _scale(self, image, width, height):
+    def _colorspace_commutes(self, image, colorspace):
+        """
+        Grayscale to RGB just copies the one band into all three, and PIL
+        resamples each band the same way. So it's cheaper to scale the one
+        band first.
+
+        :param PIL.Image image: The image to be converted.
+        :param str colorspace: The colorspace it is to be converted to.
+        :rtype: bool
+        """
+        return colorspace == 'RGB' and image.mode == 'L'
+
+    def _scale(self, image, width, height, resample=None, reducing_gap=None):
         """
         Given an image, scales the image to the given ``width`` and ``height``.
 
         :param PIL.Image image: The image to scale.
         :param int width: The width of the scaled image.
         :param int height: The height of the scaled image.
+        :keyword str resample: One of the names in ``RESAMPLE_FILTERS``.
+            Defaults to ANTIALIAS.
+        :keyword float reducing_gap: If given, first box-reduce the image by
+            an integer factor to no less than this many times the target
+            size. Much cheaper than running the full filter over every
+            source pixel.
         :rtype: PIL.Image
         :returns: The scaled image. 
         """
-        return image.resize((width, height), resample=Image.ANTIALIAS)
+        if resample is None:
+            resample_filter = Image.ANTIALIAS
+        else:
+            try:
+                resample_filter = RESAMPLE_FILTERS[resample.lower()]
+            except KeyError:
+                raise ThumbnailError(
+                    'Unknown resample filter: %s' % resample)
+
+        if reducing_gap:
+            x_factor = max(1, int(image.size[0] / (width * reducing_gap)))
+            y_factor = max(1, int(image.size[1] / (height * reducing_gap)))
+            if x_factor > 1 or y_factor > 1:
+                image = self._reduce(image, x_factor, y_factor)
+
+        return image.resize((width, height), resample=resample_filter)
+
+    def _reduce(self, image, x_factor, y_factor):
+        """
+        Shrinks ``image`` by integer factors, averaging each block of source
+        pixels.
+
+        :param PIL.Image image: The image to shrink.
+        :param int x_factor: Divide the width by this.
+        :param int y_factor: Divide the height by this.
+        :rtype: PIL.Image
+        :returns: The reduced image.
+        """
+        if hasattr(image, 'reduce'):
+            # Pillow 7.0+ has a dedicated, very fast path for this.
+            return image.reduce((x_factor, y_factor))
+
+        # A box filter at an integer ratio does the same thing, only slower.
+        # Without one, skip straight to the final resample.
+        if 'box' not in RESAMPLE_FILTERS:
+            return image
+        size = (int(math.ceil(image.size[0] / float(x_factor))),
+                int(math.ceil(image.size[1] / float(y_factor))))
+        return image.resize(size, resample=RESAMPLE_FILTERS['box'])
 
     def _crop(self, image, width, height, x_offset, y_offset):
         """
@@ -98,7 +384,76 @@ class PILEngine(EngineBase):
         return image.crop((x_offset, y_offset,
                            width + x_offset, height + y_offset))
 
-    def _get_raw_data(self, image, format, quality):
+    def _get_luminance(self, image, max_size):
+        """
+        Returns a shrunken grayscale copy of the image as a numpy array.
+
+        :param PIL.Image image: The image to look at.
+        :param int max_size: The longest side of the copy may be no longer
+            than this.
+        :rtype: numpy.ndarray
+        """
+        import numpy
+
+        # Converting and filtering every pixel of a big image would take
+        # longer than the rest of the smart crop put together. Sampling it
+        # down to a few times the size first is plenty to find the detail.
+        sample_size = max_size * LUMINANCE_SAMPLE_FACTOR
+        if max(image.size) > sample_size:
+            ratio = float(sample_size) / max(image.size)
+            image = image.resize((max(1, int(image.size[0] * ratio)),
+                                  max(1, int(image.size[1] * ratio))),
+                                 Image.NEAREST)
+
+        small = image.convert('L')
+        # Shrinks in place, keeping the aspect ratio.
+        small.thumbnail((max_size, max_size), Image.BILINEAR)
+        return numpy.asarray(small, dtype=numpy.float32)
+
+    def _write(self, image, dest_fobj, format, quality, **options):
+        """
+        Saves the image straight into ``dest_fobj``, without buffering the
+        encoded data.
+
+        :param PIL.Image image: The image to encode.
+        :param file dest_fobj: A writable file-like object.
+        :param str format: See :meth:`_get_raw_data`.
+        :param int quality: See :meth:`_get_raw_data`.
+        :param options: See :meth:`_get_raw_data`.
+        """
+        if isinstance(dest_fobj, SpooledTemporaryFile):
+            # PIL asks for a fileno() to write to, and asking a spooled file
+            # for one forces it out to disk.
+            dest_fobj = _NoFilenoWriter(dest_fobj)
+
+        save_options = self._get_save_options(format, quality, options)
+        # Only there if normalize() was asked to keep it. Most encoders
+        # don't look in Image.info for these.
+        for key in ('icc_profile', 'exif'):
+            if image.info.get(key):
+                save_options.setdefault(key, image.info[key])
+
+        start = None
+        if save_options.get('optimize'):
+            try:
+                start = dest_fobj.tell()
+            except (AttributeError, IOError):
+                # Can't go back for a second try.
+                pass
+
+        try:
+            image.save(dest_fobj, format=format, **save_options)
+        except IOError:
+            if start is None:
+                raise
+            # optimize is a no-go for some images (and some PIL builds),
+            # omit it this attempt.
+            dest_fobj.seek(start)
+            dest_fobj.truncate()
+            del save_options['optimize']
+            image.save(dest_fobj, format=format, **save_options)
+
+    def _get_raw_data(self, image, format, quality, **options):
         """
         Returns the raw data from the Image, which can be directly written
         to a something, be it a file-like object or a database.
@@ -115,21 +470,55 @@ class PILEngine(EngineBase):
             format's handbook page for what the different values for this mean.
             For example, JPEG's max quality level is 95, with 100 completely
             disabling JPEG quantization.
+        :param options: Any other settings for the format's PIL encoder, like
+            ``progressive`` and ``subsampling`` for JPEG, or ``method`` for
+            WebP. See the PIL handbook's format pages.
         :rtype: str
         :returns: A string representation of the image.
         """
-        ImageFile.MAXBLOCK = 1024 * 1024
         buf = StringIO()
-
-        try:
-            # ptimize makes the encoder do a second pass over the image, if
-            # the format supports it.
-            image.save(buf, format=format, quality=quality, optimize=1)
-        except IOError:
-            # optimize is a no-go, omit it this attempt.
-            image.save(buf, format=format, quality=quality)
+        self._write(image, buf, format, quality, **options)
 
         raw_data = buf.getvalue()
         buf.close()
         return raw_data
 
+    def _get_save_options(self, format, quality, options):
+        """
+        Returns the keyword arguments to pass to ``Image.save()``.
+
+        :param str format: See :meth:`_get_raw_data`.
+        :param int quality: See :meth:`_get_raw_data`.
+        :param dict options: See :meth:`_get_raw_data`.
+        :rtype: dict
+        """
+        save_options = {'quality': quality}
+        if format and format.upper() in OPTIMIZE_FORMATS:
+            # optimize makes the encoder do a second pass over the image.
+            save_options['optimize'] = 1
+        save_options.update(options)
+        return save_options
+
+
+class _NoFilenoWriter(object):
+    """
+    Wraps a file-like object, exposing just enough for PIL to write to it.
+    Without a fileno(), PIL writes everything through write().
+    """
+    def __init__(self, fobj):
+        self._fobj = fobj
+
+    def write(self, data):
+        return self._fobj.write(data)
+
+    def flush(self):
+        return self._fobj.flush()
+
+    def tell(self):
+        return self._fobj.tell()
+
+    def seek(self, *args):
+        return self._fobj.seek(*args)
+
+    def truncate(self, *args):
+        return self._fobj.truncate(*args)
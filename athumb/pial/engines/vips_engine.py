@@ -0,0 +1,394 @@
+"""
+An engine built on libvips, through pyvips. libvips is demand-driven: it
+only decodes what it needs, can shrink JPEGs while loading them, and works
+in small tiles instead of whole images, so large originals take a fraction
+of the memory and time PIL needs.
+"""
+import pyvips
+
+from athumb.pial.engines.base import EngineBase, ImageInfo
+from athumb.pial.helpers import ThumbnailError
+
+# Names for the resample option of _scale(), mapped to libvips kernels. The
+# PIL names are accepted where there is an equivalent.
+RESAMPLE_KERNELS = {
+    'nearest': 'nearest',
+    'bilinear': 'linear',
+    'linear': 'linear',
+    'bicubic': 'cubic',
+    'cubic': 'cubic',
+    'mitchell': 'mitchell',
+    'lanczos': 'lanczos3',
+    'lanczos2': 'lanczos2',
+    'lanczos3': 'lanczos3',
+    'antialias': 'lanczos3',
+}
+
+# Formats whose savers take a quality setting.
+QUALITY_FORMATS = ('jpeg', 'webp', 'heif', 'avif', 'tiff')
+
+# PIL encoder setting names, mapped to their libvips saver equivalents.
+SAVE_OPTION_NAMES = {
+    'progressive': 'interlace',
+    'method': 'effort',
+}
+
+# PIL's JPEG subsampling values, mapped to libvips' subsample_mode. libvips
+# can only subsample chroma 4:2:0, so 4:2:2 gets that too.
+SUBSAMPLE_MODES = {
+    -1: 'auto',
+    0: 'off',
+    1: 'on',
+    2: 'on',
+    'keep': 'auto',
+    '4:4:4': 'off',
+    '4:2:2': 'on',
+    '4:2:0': 'on',
+}
+
+# PIL encoder settings with no libvips equivalent. optimize is always on for
+# JPEG, and metadata is stripped.
+PIL_ONLY_OPTIONS = frozenset(['optimize', 'exif', 'icc_profile'])
+
+
+class VipsEngine(EngineBase):
+    """
+    libvips Engine. This implements members of EngineBase.
+    """
+    def get_image(self, source, min_size=None):
+        """
+        Given a file-like object, loads it up into a pyvips.Image object
+        and returns it. Only the header is read at this point.
+
+        :param file source: A file-like object to load the image from.
+        :keyword min_size: An optional (x,y) tuple, or a callable that
+            returns one given the source's dimensions. Both are upright, as
+            :meth:`normalize` will leave the image. JPEGs are loaded at the
+            smallest 1/2, 1/4 or 1/8 scale that still covers it.
+        :rtype: pyvips.Image
+        :returns: The loaded image.
+        """
+        raw_data = source.read()
+        image = pyvips.Image.new_from_buffer(raw_data, '')
+
+        if min_size is not None and \
+           image.get('vips-loader').startswith('jpegload'):
+            image_size = (image.width, image.height)
+            if image.get_typeof('orientation') and \
+               image.get('orientation') in (5, 6, 7, 8):
+                image_size = image_size[::-1]
+            if callable(min_size):
+                min_size = min_size(image_size)
+            if min_size:
+                shrink = self._calc_shrink(image_size, min_size)
+                if shrink > 1:
+                    # libjpeg scales the DCT blocks down while decoding.
+                    image = pyvips.Image.new_from_buffer(raw_data, '',
+                                                         shrink=shrink)
+
+        return image
+
+    def normalize(self, image, strip_metadata=True, convert_srgb=False):
+        """
+        Converts the image to 8-bit sRGB, or 8-bit grayscale, keeping any
+        alpha, and turns it upright according to its EXIF orientation.
+        Nothing is decoded here: libvips works on demand, and is safe to use
+        from several threads.
+
+        :param pyvips.Image image: A freshly loaded image.
+        :keyword bool strip_metadata: Ignored. The libvips savers are always
+            told to strip metadata.
+        :keyword bool convert_srgb: Convert the colors from any embedded ICC
+            profile to sRGB.
+        :rtype: pyvips.Image
+        :returns: The normalized image.
+        """
+        if convert_srgb and image.get_typeof('icc-profile-data'):
+            image = image.icc_transform('srgb')
+        if image.interpretation not in ('b-w', 'srgb') or \
+           image.format != 'uchar':
+            image = image.colourspace('srgb')
+        # Only costs anything for images that aren't upright already.
+        return image.autorot()
+
+    def _calc_shrink(self, image_size, min_size):
+        """
+        Returns the largest shrink-on-load factor JPEG allows that keeps the
+        image at least ``min_size`` in both dimensions.
+
+        :param tuple image_size: The full size, as (x,y).
+        :param tuple min_size: The minimum size, as (x,y).
+        :rtype: int
+        """
+        for shrink in (8, 4, 2):
+            if image_size[0] // shrink >= min_size[0] and \
+               image_size[1] // shrink >= min_size[1]:
+                return shrink
+        return 1
+
+    def get_image_size(self, image):
+        """
+        Returns the image width and height as a tuple.
+
+        :param pyvips.Image image: An image whose dimensions to get.
+        :rtype: tuple
+        :returns: Dimensions in the form of (x,y).
+        """
+        return (image.width, image.height)
+
+    def can_write(self, format):
+        """
+        Checks whether libvips has a saver for ``format``.
+
+        :param str format: A format name, like 'JPEG' or 'webp'.
+        :rtype: bool
+        """
+        get_suffixes = getattr(pyvips, 'get_suffixes', None)
+        if get_suffixes is None:
+            # Too old a pyvips to ask.
+            return True
+        return self._get_suffix(format) in get_suffixes()
+
+    def is_valid_image(self, raw_data):
+        """
+        Checks if the supplied raw data is valid image data.
+
+        :param str raw_data: A string representation of the image data.
+        :rtype: bool
+        :returns: ``True`` if ``raw_data`` is valid, ``False`` if not.
+        """
+        try:
+            trial_image = pyvips.Image.new_from_buffer(raw_data, '')
+            # Loading is lazy. Computing anything over every pixel makes
+            # libvips decode the whole thing.
+            trial_image.avg()
+        except pyvips.Error:
+            return False
+        return True
+
+    def _probe(self, data):
+        """
+        Parses the header at the start of ``data``. libvips only reads the
+        header until pixels are asked for.
+
+        :param str data: The start of the image's raw data.
+        :rtype: ImageInfo
+        :returns: What the header says, or ``None``.
+        """
+        try:
+            image = pyvips.Image.new_from_buffer(data, '')
+        except pyvips.Error:
+            return None
+
+        def get_field(name, default):
+            if image.get_typeof(name):
+                return image.get(name)
+            return default
+
+        # 'jpegload_buffer' -> 'JPEG'
+        loader = get_field('vips-loader', '')
+        format = loader.split('load')[0].upper() or None
+        return ImageInfo(format=format, size=(image.width, image.height),
+                         mode=image.interpretation,
+                         frames=get_field('n-pages', 1),
+                         orientation=get_field('orientation', 1))
+
+    def _colorspace(self, image, colorspace):
+        """
+        Sets the image's colorspace. This is typical 'RGB' or 'GRAY', but
+        may be other things, depending on your choice of Engine.
+
+        :param pyvips.Image image: The image whose colorspace to adjust.
+        :param str colorspace: One of either 'RGB' or 'GRAY'.
+        :rtype: pyvips.Image
+        :returns: The colorspace-adjusted image.
+        """
+        if colorspace == 'RGB':
+            # Any alpha band is carried along.
+            if image.interpretation != 'srgb':
+                image = image.colourspace('srgb')
+            return image
+        if colorspace == 'GRAY':
+            if image.interpretation != 'b-w':
+                image = image.colourspace('b-w')
+            if image.hasalpha():
+                # PIL's 'L' mode has no alpha.
+                image = image.extract_band(0)
+            return image
+        return image
+
+    def _colorspace_commutes(self, image, colorspace):
+        """
+        Grayscale to sRGB copies the one band into all three, and each band
+        is resampled the same way. So it's cheaper to scale the one band
+        first.
+
+        :param pyvips.Image image: The image to be converted.
+        :param str colorspace: The colorspace it is to be converted to.
+        :rtype: bool
+        """
+        return colorspace == 'RGB' and image.interpretation == 'b-w'
+
+    def _scale(self, image, width, height, resample=None, reducing_gap=None):
+        """
+        Given an image, scales the image to the given ``width`` and ``height``.
+
+        :param pyvips.Image image: The image to scale.
+        :param int width: The width of the scaled image.
+        :param int height: The height of the scaled image.
+        :keyword str resample: One of the names in ``RESAMPLE_KERNELS``.
+            Defaults to lanczos3.
+        :keyword float reducing_gap: libvips always box-shrinks first, then
+            resamples. This sets how close to the target size the shrink
+            goes. Needs libvips 8.13 or later.
+        :rtype: pyvips.Image
+        :returns: The scaled image.
+        """
+        options = {}
+        if resample is not None:
+            try:
+                options['kernel'] = RESAMPLE_KERNELS[resample.lower()]
+            except KeyError:
+                raise ThumbnailError(
+                    'Unknown resample filter: %s' % resample)
+        if reducing_gap:
+            options['gap'] = reducing_gap
+
+        premultiplied = image.hasalpha()
+        if premultiplied:
+            # Keeps transparent pixels' colors from bleeding into the edges.
+            image = image.premultiply()
+
+        image = image.resize(float(width) / image.width,
+                             vscale=float(height) / image.height,
+                             **options)
+
+        if premultiplied:
+            image = image.unpremultiply().cast('uchar')
+        return image
+
+    def _crop(self, image, width, height, x_offset, y_offset):
+        """
+        Crops the ``image``, starting at ``width`` and ``height``, adding the
+        ``x_offset`` and ``y_offset`` to make the crop window.
+
+        :param pyvips.Image image: The image to crop.
+        :param int width: The X plane's start of the crop window.
+        :param int height: The Y plane's start of the crop window.
+        :param int x_offset: The 'width' of the crop window.
+        :param int y_offset: The 'height' of the crop window.
+        :rtype: pyvips.Image
+        :returns: The cropped image.
+        """
+        return image.crop(x_offset, y_offset, width, height)
+
+    def _get_luminance(self, image, max_size):
+        """
+        Returns a shrunken grayscale copy of the image as a numpy array.
+
+        :param pyvips.Image image: The image to look at.
+        :param int max_size: The longest side of the copy may be no longer
+            than this.
+        :rtype: numpy.ndarray
+        """
+        import numpy
+
+        scale = min(1.0, float(max_size) / max(image.width, image.height))
+        small = image.colourspace('b-w')[0].resize(scale).cast('uchar')
+        return numpy.ndarray(buffer=small.write_to_memory(),
+                             dtype=numpy.uint8,
+                             shape=(small.height, small.width))
+
+    def _write(self, image, dest_fobj, format, quality, **options):
+        """
+        Streams the encoded image into ``dest_fobj`` as libvips produces
+        it. Versions of pyvips without custom targets fall back to
+        :meth:`_get_raw_data`.
+
+        :param pyvips.Image image: The image to encode.
+        :param file dest_fobj: A writable file-like object.
+        :param str format: See :meth:`_get_raw_data`.
+        :param int quality: See :meth:`_get_raw_data`.
+        :param options: See :meth:`_get_raw_data`.
+        """
+        if not hasattr(pyvips, 'TargetCustom'):
+            return super(VipsEngine, self)._write(image, dest_fobj,
+                                                  format, quality, **options)
+
+        suffix, options = self._get_save_options(format, quality, options)
+
+        def on_write(chunk):
+            dest_fobj.write(chunk)
+            return len(chunk)
+
+        target = pyvips.TargetCustom()
+        target.on_write(on_write)
+        image.write_to_target(target, suffix, **options)
+
+    def _get_raw_data(self, image, format, quality, **options):
+        """
+        Returns the raw data from the Image, which can be directly written
+        to a something, be it a file-like object or a database.
+
+        :param pyvips.Image image: The image to get the raw data for.
+        :param str format: The format to save to, like 'JPEG' or 'PNG'.
+            libvips can't guess this, so it must be given.
+        :param int quality: A quality level as a percent. The lower, the
+            higher the compression, the worse the artifacts. Ignored by
+            lossless formats.
+        :param options: Any other settings for the format's libvips saver.
+            The PIL names ``progressive``, ``method`` and ``subsampling``
+            are translated to ``interlace``, ``effort`` and
+            ``subsample_mode``. ``optimize``, ``exif`` and ``icc_profile``
+            are ignored.
+        :rtype: str
+        :returns: A string representation of the image.
+        """
+        suffix, options = self._get_save_options(format, quality, options)
+        return image.write_to_buffer(suffix, **options)
+
+    def _get_save_options(self, format, quality, extra_options=None):
+        """
+        Translates a PIL-style format name, quality and encoder settings into
+        a libvips saver suffix and options.
+
+        :param str format: The format to save to.
+        :param int quality: A quality level as a percent.
+        :param dict extra_options: Any other encoder settings.
+        :rtype: tuple
+        :returns: A ``(suffix, options)`` tuple.
+        """
+        if not format:
+            raise ThumbnailError('VipsEngine needs an output format.')
+
+        suffix = self._get_suffix(format)
+        format = suffix[1:]
+        # Like PIL, don't carry the original's metadata along.
+        options = {'strip': True}
+        if format in QUALITY_FORMATS:
+            options['Q'] = quality
+        if format == 'jpeg':
+            # The equivalent of PIL's optimize.
+            options['optimize_coding'] = True
+        for name, value in (extra_options or {}).items():
+            if name in PIL_ONLY_OPTIONS:
+                continue
+            if name == 'subsampling':
+                if format != 'jpeg':
+                    continue
+                name, value = 'subsample_mode', SUBSAMPLE_MODES.get(value,
+                                                                    value)
+            options[SAVE_OPTION_NAMES.get(name, name)] = value
+        return suffix, options
+
+    def _get_suffix(self, format):
+        """
+        Returns the file suffix libvips picks a saver for ``format`` by.
+
+        :param str format: A format name, like 'JPEG' or 'webp'.
+        :rtype: str
+        """
+        format = format.lower()
+        if format == 'jpg':
+            format = 'jpeg'
+        return '.%s' % format
@@ -3,6 +3,14 @@ class ThumbnailError(Exception):
     pass
 
 
+class ImageTooLargeError(ThumbnailError):
+    """
+    Raised when an image's header claims dimensions the imaging library
+    refuses to even open, as a defense against decompression bombs.
+    """
+    pass
+
+
 def toint(number):
     """
     Helper to return rounded int for a float or just the int it self.
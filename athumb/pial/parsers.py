@@ -24,45 +24,54 @@ _Y_ALIAS_PERCENT = {
     'bottom': '100%',
 }
 
+def parse_crop_axis(crop):
+    """
+    Parses the cropping value for one plane (X or Y).
+
+    :param str crop: A cropping value for the plane, like '50%' or '20px'.
+    :raises: ThumbnailParseError in the event of invalid input.
+    :rtype: tuple
+    :returns: A ``(value, unit)`` tuple, where ``value`` is a float and
+        ``unit`` is either '%' or 'px'.
+    """
+    m = _CROP_PERCENT_PATTERN.match(crop)
+    if not m:
+        raise ThumbnailParseError('Unrecognized crop option: %s' % crop)
+    # we only take ints in the regexp
+    return float(m.group('value')), m.group('unit')
+
 def get_cropping_offset(crop, epsilon):
     """
     Calculates the cropping offset for the cropped image. This only calculates
     the offset for one dimension (X or Y). This should be called twice to get
     the offsets for the X and Y dimensions.
 
-    :param str crop: A percentage cropping value for the plane. This is in the
-        form of something like '50%'.
+    :param crop: A cropping value for the plane. This is in the form of
+        something like '50%', or a ``(value, unit)`` tuple as returned by
+        :func:`parse_crop_axis`.
     :param float epsilon: The difference between the original image's dimension
         (X or Y) and the desired crop window.
     :rtype: int
     :returns: The cropping offset for the given dimension.
     """
-    m = _CROP_PERCENT_PATTERN.match(crop)
-    if not m:
-        raise ThumbnailParseError('Unrecognized crop option: %s' % crop)
-    value = int(m.group('value')) # we only take ints in the regexp
-    unit = m.group('unit')
+    if isinstance(crop, basestring):
+        crop = parse_crop_axis(crop)
+    value, unit = crop
     if unit == '%':
         value = epsilon * value / 100.0
         # return ∈ [0, epsilon]
     return int(max(0, min(value, epsilon)))
 
-def parse_crop(crop, xy_image, xy_window):
+def parse_crop_anchor(crop):
     """
-    Returns x, y offsets for cropping. The window area should fit inside
-    image but it works out anyway
+    Parses a cropping offset string into the anchors for each plane. Do this
+    once up front if you'll be cropping a lot of images the same way.
 
-    :param str crop: A cropping offset string. This is either one or two
-        space-separated values. If only one value is specified, the cropping
-        amount (pixels or percentage) for both X and Y dimensions is the
-        amount given. If two values are specified, X and Y dimension cropping
-        may be set independently. Some examples: '50% 50%', '50px 20px',
-        '50%', '50px'.
-    :param tuple xy_image: The (x,y) dimensions of the image.
-    :param tuple xy_window: The desired dimensions (x,y) of the cropped image.
+    :param str crop: A cropping offset string. See :func:`parse_crop`.
     :raises: ThumbnailParseError in the event of invalid input.
-    :rtype: tuple of ints
-    :returns: A tuple of of offsets for cropping, in (x,y) format.
+    :rtype: tuple
+    :returns: An ``(x_anchor, y_anchor)`` tuple, each as returned by
+        :func:`parse_crop_axis`.
     """
     # Cropping percentages are space-separated by axis. For example:
     # '50% 75%' would be a 50% cropping ratio for X, and 75% for Y.
@@ -85,6 +94,30 @@ def parse_crop(crop, xy_image, xy_window):
     else:
         raise ThumbnailParseError('Unrecognized crop option: %s' % crop)
 
+    return parse_crop_axis(x_crop), parse_crop_axis(y_crop)
+
+def parse_crop(crop, xy_image, xy_window):
+    """
+    Returns x, y offsets for cropping. The window area should fit inside
+    image but it works out anyway
+
+    :param crop: A cropping offset string. This is either one or two
+        space-separated values. If only one value is specified, the cropping
+        amount (pixels or percentage) for both X and Y dimensions is the
+        amount given. If two values are specified, X and Y dimension cropping
+        may be set independently. Some examples: '50% 50%', '50px 20px',
+        '50%', '50px'. May also be an already parsed anchor, as returned by
+        :func:`parse_crop_anchor`.
+    :param tuple xy_image: The (x,y) dimensions of the image.
+    :param tuple xy_window: The desired dimensions (x,y) of the cropped image.
+    :raises: ThumbnailParseError in the event of invalid input.
+    :rtype: tuple of ints
+    :returns: A tuple of of offsets for cropping, in (x,y) format.
+    """
+    if isinstance(crop, basestring):
+        crop = parse_crop_anchor(crop)
+    x_crop, y_crop = crop
+
     # We now have cropping percentages for the X and Y planes.
     # Calculate the cropping offsets (in pixels) for each plane.
     offset_x = get_cropping_offset(x_crop, xy_image[0] - xy_window[0])
@@ -0,0 +1,61 @@
+"""
+Content-aware cropping. Picks the crop window with the most detail in it, as
+measured by edge energy on a small grayscale copy of the image. Needs numpy.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The smart crop works on a copy no larger than this on its longest side.
+# Plenty to find where the detail is, and small enough to take about a
+# millisecond.
+SMART_CROP_SIZE = 100
+
+
+def get_energy_map(pixels):
+    """
+    Returns the edge energy of each pixel: the absolute difference from its
+    neighbour to the left plus the one above.
+
+    :param numpy.ndarray pixels: A 2D array of luminance values.
+    :rtype: numpy.ndarray
+    """
+    pixels = numpy.asarray(pixels, dtype=numpy.float32)
+    energy = numpy.zeros_like(pixels)
+    energy[:, 1:] += numpy.abs(numpy.diff(pixels, axis=1))
+    energy[1:, :] += numpy.abs(numpy.diff(pixels, axis=0))
+    return energy
+
+
+def find_best_window(energy, width, height):
+    """
+    Finds the ``width`` by ``height`` window with the most energy in it.
+    Every possible position is scored at once, off of an integral image.
+    Ties go to the position closest to the center.
+
+    :param numpy.ndarray energy: A 2D array, as from :func:`get_energy_map`.
+    :param int width: The window's width, in the array's pixels.
+    :param int height: The window's height, in the array's pixels.
+    :rtype: tuple
+    :returns: The window's top left corner, as (x,y).
+    """
+    y_size, x_size = energy.shape
+    width = max(1, min(x_size, int(round(width))))
+    height = max(1, min(y_size, int(round(height))))
+
+    integral = numpy.zeros((y_size + 1, x_size + 1), dtype=numpy.float64)
+    integral[1:, 1:] = energy.cumsum(axis=0).cumsum(axis=1)
+    # The sum of every window, indexed by its top left corner.
+    sums = integral[height:, width:] - integral[:-height, width:] - \
+           integral[height:, :-width] + integral[:-height, :-width]
+
+    # A nudge toward the center that's too small to matter unless windows are
+    # (near enough) tied, as with flat images.
+    y_positions, x_positions = numpy.ogrid[:sums.shape[0], :sums.shape[1]]
+    distance = numpy.abs(x_positions - (sums.shape[1] - 1) / 2.0) + \
+               numpy.abs(y_positions - (sums.shape[0] - 1) / 2.0)
+    sums -= distance * (sums.max() * 1e-6 + 1e-9)
+
+    y, x = numpy.unravel_index(numpy.argmax(sums), sums.shape)
+    return int(x), int(y)
@@ -0,0 +1,193 @@
+"""
+Thumbnail plans: a field's ``thumbs`` specs, checked and worked out once, when
+the field is created. Mistakes in a spec show up when your models are
+imported, and saving or linking to a thumbnail doesn't re-parse anything.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from athumb.pial import smartcrop
+from athumb.pial.parsers import parse_crop_anchor, ThumbnailParseError
+
+# Default encoder quality for thumbnails. Can be set per-thumb.
+THUMBNAIL_QUALITY = getattr(settings, 'THUMBNAIL_QUALITY', 95)
+# Default resampling filter name for thumbnails ('lanczos', 'bicubic', ...).
+# None uses the engine's high-quality default. Can be set per-thumb.
+THUMBNAIL_RESAMPLE = getattr(settings, 'THUMBNAIL_RESAMPLE', None)
+# If set, shrink by an integer factor with a cheap box filter first, to no
+# less than this many times the thumbnail size, then finish with the
+# resampling filter. 2.0 or 3.0 is a good trade. Can be set per-thumb.
+THUMBNAIL_REDUCING_GAP = getattr(settings, 'THUMBNAIL_REDUCING_GAP', None)
+
+# Everything that may appear in a thumbnail's options dict.
+THUMB_OPTION_NAMES = frozenset([
+    'size', 'upscale', 'crop', 'resample', 'reducing_gap', 'quality',
+    'max_bytes', 'encoder_options', 'variants', 'variant_options',
+])
+
+
+class ThumbnailPlan(object):
+    """
+    One of a field's thumbnails, ready to go. These are read-only, and shared
+    by every file of the field.
+
+    name: (str) The thumbnail's name.
+    size: (tuple) The (width, height) to fit the image in.
+    upscale: (bool) Whether smaller images are scaled up.
+    crop: (tuple) The crop anchor, as returned by
+        athumb.pial.parsers.parse_crop_anchor(), 'smart', or None to not
+        crop.
+    format: (str) The format to save in, or None for the original's.
+    variants: (tuple) Extra formats to also save in.
+    scale_options: (dict) Keyword arguments for the engine's scaling. Don't
+        modify this.
+    """
+    __slots__ = ('name', 'size', 'upscale', 'crop', 'format', 'variants',
+                 'scale_options', '_encoder_settings')
+
+    def __init__(self, name, options, thumbnail_format=None,
+                 thumbnail_variants=(), engine=None):
+        def fail(message):
+            raise ImproperlyConfigured("Thumbnail %r: %s" % (name, message))
+
+        if not isinstance(options, dict):
+            fail("options must be a dict.")
+        unknown = set(options) - THUMB_OPTION_NAMES
+        if unknown:
+            fail("unknown options: %s." % ', '.join(sorted(unknown)))
+
+        size = options.get('size')
+        try:
+            size = tuple(int(dim) for dim in size)
+        except (TypeError, ValueError):
+            size = ()
+        if len(size) != 2 or min(size) < 1:
+            fail("'size' must be a (width, height) tuple of positive "
+                 "integers.")
+
+        crop = options.get('crop')
+        if crop is True:
+            # We'll just make an assumption here. Center cropping is the
+            # typical default.
+            crop = 'center'
+        if crop == 'smart':
+            # Worked out per image.
+            if smartcrop.numpy is None:
+                fail("crop='smart' needs numpy installed.")
+        elif crop:
+            try:
+                crop = parse_crop_anchor(crop)
+            except (ThumbnailParseError, AttributeError):
+                fail("invalid 'crop' value: %r." % (options['crop'],))
+        else:
+            crop = None
+
+        if thumbnail_format:
+            thumbnail_format = thumbnail_format.lower()
+        variants = tuple(variant.lower() for variant in
+                         options.get('variants', thumbnail_variants))
+        # If the regular format is known, don't store it twice.
+        variants = tuple(variant for variant in variants
+                         if variant != thumbnail_format)
+        if engine is not None:
+            formats = variants
+            if thumbnail_format:
+                formats = (thumbnail_format,) + formats
+            for format in formats:
+                if not engine.can_write(format):
+                    fail("the thumbnail engine can't save %r images." %
+                         format)
+
+        reducing_gap = options.get('reducing_gap', THUMBNAIL_REDUCING_GAP)
+        if reducing_gap is not None and reducing_gap <= 0:
+            fail("'reducing_gap' must be greater than 0.")
+
+        # The quality, byte budget and other encoder options for the regular
+        # format (None) and for each variant.
+        variant_options = options.get('variant_options', {})
+        encoder_settings = {}
+        for format, format_options in \
+                [(None, options.get('encoder_options', {}))] + \
+                [(variant, variant_options.get(variant, {}))
+                 for variant in variants]:
+            format_options = dict(format_options)
+            quality = format_options.pop('quality',
+                                         options.get('quality',
+                                                     THUMBNAIL_QUALITY))
+            if not 0 < quality <= 100:
+                fail("quality must be between 1 and 100.")
+            max_bytes = format_options.pop('max_bytes',
+                                           options.get('max_bytes'))
+            if max_bytes is not None and max_bytes <= 0:
+                fail("'max_bytes' must be greater than 0.")
+            encoder_settings[format] = (quality, max_bytes, format_options)
+
+        set_slot = lambda attr, value: object.__setattr__(self, attr, value)
+        set_slot('name', name)
+        set_slot('size', size)
+        set_slot('upscale', options.get('upscale', True))
+        set_slot('crop', crop)
+        set_slot('format', thumbnail_format)
+        set_slot('variants', variants)
+        set_slot('scale_options', {
+            'resample': options.get('resample', THUMBNAIL_RESAMPLE),
+            'reducing_gap': reducing_gap,
+        })
+        set_slot('_encoder_settings', encoder_settings)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ThumbnailPlan objects are read-only.")
+
+    def __repr__(self):
+        return '<ThumbnailPlan: %s>' % self.name
+
+    # Nothing can change, so copies can just be the original.
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get_variants(self, base_format):
+        """
+        Returns the extra formats to store the thumbnail in, given the
+        regular format it is stored in.
+        """
+        if self.format:
+            # Already left out.
+            return self.variants
+        return tuple(variant for variant in self.variants
+                     if variant != base_format)
+
+    def get_encoder_settings(self, format=None):
+        """
+        Returns a (quality, max_bytes, options) tuple to encode the thumbnail
+        (or one of its format variants) with. max_bytes is None if there's
+        no size limit. The options dict is yours to keep.
+        """
+        quality, max_bytes, options = self._encoder_settings[format]
+        return quality, max_bytes, dict(options)
+
+
+def compile_thumbs(thumbs, thumbnail_format=None, thumbnail_variants=(),
+                   engine=None):
+    """
+    Turns a field's ``thumbs`` into a tuple of ThumbnailPlans, raising
+    ImproperlyConfigured if anything is wrong with them. If an ``engine``
+    is given, it must be able to save every format asked for.
+    """
+    plans = []
+    seen = set()
+    for thumb in thumbs:
+        try:
+            name, options = thumb
+        except (TypeError, ValueError):
+            raise ImproperlyConfigured(
+                "Thumbnails must be (name, options) tuples, got %r." % (thumb,))
+        if name in seen:
+            raise ImproperlyConfigured(
+                "Thumbnail %r is defined more than once." % name)
+        seen.add(name)
+        plans.append(ThumbnailPlan(name, options, thumbnail_format,
+                                   thumbnail_variants, engine))
+    return tuple(plans)
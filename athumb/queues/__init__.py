@@ -0,0 +1,29 @@
+"""
+Job queues for generating thumbnails outside of the upload request. See
+:class:`athumb.queues.base.ThumbnailJob` for what gets queued.
+"""
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Dotted path to the queue class used for fields with deferred generation.
+THUMBNAIL_QUEUE = getattr(settings, 'THUMBNAIL_QUEUE',
+                          'athumb.queues.threaded.ThreadQueue')
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Returns the process-wide instance of the queue class named by the
+    THUMBNAIL_QUEUE setting, creating it on first use.
+    """
+    global _queue
+
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = import_string(THUMBNAIL_QUEUE)()
+    return _queue
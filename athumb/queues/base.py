@@ -0,0 +1,97 @@
+"""
+The job record and the interface all queues implement.
+"""
+try:
+    from django.apps import apps
+    get_model = apps.get_model
+except ImportError:
+    # Django < 1.7. django.db.models.loading is gone as of 1.9.
+    from django.db.models.loading import get_model
+
+
+class ThumbnailJob(object):
+    """
+    A small, serializable record of the thumbnails that need generating for
+    one stored original. We only hang on to names, so a job can be pickled,
+    dumped to JSON, or shipped to another process without dragging model
+    instances or image data along with it.
+    """
+    def __init__(self, name, app_label, model_name, field_name,
+                 thumb_names=None):
+        # Storage path of the original.
+        self.name = name
+        self.app_label = app_label
+        self.model_name = model_name
+        self.field_name = field_name
+        # The thumbnails to generate. None means all of them.
+        self.thumb_names = thumb_names
+
+    def __repr__(self):
+        return '<ThumbnailJob: %s.%s.%s %s>' % (
+            self.app_label, self.model_name, self.field_name, self.name)
+
+    @classmethod
+    def for_field_file(cls, field_file, thumb_names=None):
+        """
+        Builds a job for the given ImageWithThumbsFieldFile.
+        """
+        opts = field_file.field.model._meta
+        return cls(field_file.name, opts.app_label, opts.model_name,
+                   field_file.field.name, thumb_names=thumb_names)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Re-constitutes a job from the output of :meth:`to_dict`.
+        """
+        return cls(data['name'], data['app_label'], data['model_name'],
+                   data['field_name'], thumb_names=data.get('thumb_names'))
+
+    def to_dict(self):
+        """
+        Returns a dict of simple types, suitable for serialization.
+        """
+        return {
+            'name': self.name,
+            'app_label': self.app_label,
+            'model_name': self.model_name,
+            'field_name': self.field_name,
+            'thumb_names': self.thumb_names,
+        }
+
+    def get_field(self):
+        """
+        Looks up the ImageWithThumbsField this job is for.
+        """
+        model = get_model(self.app_label, self.model_name)
+        return model._meta.get_field(self.field_name)
+
+    def run(self):
+        """
+        Reads the original back out of storage and generates the thumbnails.
+        """
+        field = self.get_field()
+        field_file = field.attr_class(None, field, self.name)
+
+        content = field_file.storage.open(self.name)
+        try:
+            field_file.generate_thumbs(self.name, content,
+                                       thumb_names=self.thumb_names)
+        finally:
+            content.close()
+
+        field_file.clear_thumbs_pending()
+
+
+class BaseQueue(object):
+    """
+    All queues need to implement :meth:`enqueue`. How and where the jobs get
+    run is up to the queue.
+    """
+    def enqueue(self, job):
+        """
+        Queues the given job for processing.
+
+        :param ThumbnailJob job: The job to queue.
+        """
+        raise NotImplementedError()
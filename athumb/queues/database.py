@@ -0,0 +1,87 @@
+"""
+A queue that stores jobs in a database table. Jobs are run by the
+``athumb_process_jobs`` management command.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from athumb.models import QueuedThumbnailJob
+from athumb.queues.base import BaseQueue, ThumbnailJob
+
+# Jobs claimed longer ago than this many seconds are assumed to belong to a
+# drainer that died, and are picked up again. Should be comfortably longer
+# than a job ever takes.
+THUMBNAIL_QUEUE_CLAIM_TIMEOUT = getattr(settings,
+                                        'THUMBNAIL_QUEUE_CLAIM_TIMEOUT', 3600)
+
+
+class DatabaseQueue(BaseQueue):
+    """
+    Jobs survive restarts and can be processed on another machine entirely,
+    at the cost of a row write per upload.
+    """
+    def enqueue(self, job):
+        QueuedThumbnailJob.objects.create(payload=json.dumps(job.to_dict()))
+
+    def drain(self, limit=None, max_attempts=3,
+              claim_timeout=THUMBNAIL_QUEUE_CLAIM_TIMEOUT):
+        """
+        Runs queued jobs, oldest first, until the queue is empty or ``limit``
+        jobs have been attempted. Finished jobs are deleted. Failures are
+        recorded on the row and retried on later runs, until they have been
+        attempted ``max_attempts`` times. Jobs whose drainer died part way
+        through are retried once their claim is ``claim_timeout`` seconds
+        old, and count as an attempt too.
+
+        :keyword int limit: The maximum number of jobs to attempt.
+        :keyword int max_attempts: Skip jobs that have been attempted this
+            many times.
+        :keyword int claim_timeout: Take over claims older than this many
+            seconds.
+        :rtype: tuple
+        :returns: The number of jobs that succeeded and failed, in the form
+            of (succeeded, failed).
+        """
+        succeeded, failed = 0, 0
+        failed_pks = []
+
+        while limit is None or succeeded + failed < limit:
+            now = timezone.now()
+            claimable = Q(claimed=False) | \
+                Q(claimed_at__lt=now - timedelta(seconds=claim_timeout))
+            row = QueuedThumbnailJob.objects.filter(
+                claimable, attempts__lt=max_attempts
+            ).exclude(pk__in=failed_pks).order_by('pk').first()
+            if row is None:
+                break
+
+            # Claim the row, so any other drainers running at the same time
+            # leave it alone. Only one of them can change it from the state
+            # we just saw.
+            claimed = QueuedThumbnailJob.objects.filter(
+                pk=row.pk, claimed=row.claimed, claimed_at=row.claimed_at,
+            ).update(claimed=True, claimed_at=now,
+                     attempts=F('attempts') + 1)
+            if not claimed:
+                continue
+
+            job = ThumbnailJob.from_dict(json.loads(row.payload))
+            try:
+                job.run()
+            except Exception, exc:
+                QueuedThumbnailJob.objects.filter(pk=row.pk).update(
+                    claimed=False,
+                    claimed_at=None,
+                    last_error=repr(exc),
+                )
+                failed_pks.append(row.pk)
+                failed += 1
+            else:
+                row.delete()
+                succeeded += 1
+
+        return succeeded, failed
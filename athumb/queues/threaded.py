@@ -0,0 +1,64 @@
+"""
+A queue that runs jobs on a background thread within the current process.
+Nothing is persisted, so queued jobs are lost if the process exits.
+"""
+import os
+import logging
+import threading
+import Queue
+
+from django.db import close_old_connections
+
+from athumb.queues.base import BaseQueue
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadQueue(BaseQueue):
+    """
+    Runs jobs one at a time, in order, on a daemon thread that is started the
+    first time something is queued.
+    """
+    def __init__(self):
+        self._jobs = Queue.Queue()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, job):
+        self._ensure_worker()
+        self._jobs.put(job)
+
+    def _ensure_worker(self):
+        """
+        Starts the worker thread if it isn't running. Threads don't survive a
+        fork, so a pre-forking server's children each start their own.
+        """
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._work,
+                                                name='athumb-thumbnail-queue')
+                self._thread.daemon = True
+                self._thread.start()
+                self._thread_pid = os.getpid()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                job.run()
+            except Exception:
+                logger.exception("Unable to generate thumbnails for %r", job)
+            finally:
+                self._jobs.task_done()
+                close_old_connections()
+
+    def join(self):
+        """
+        Blocks until every job queued so far has been run. Mostly useful for
+        tests and management commands.
+        """
+        self._jobs.join()
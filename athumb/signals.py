@@ -0,0 +1,12 @@
+"""
+Signals sent by athumb.
+"""
+from django.dispatch import Signal
+
+# Sent after each thumbnail (and each format variant of one) is encoded and
+# stored. The sender is the model class. Handy for keeping an eye on
+# thumbnail sizes, and on how often max_bytes budgets force the quality down.
+# instance is None for thumbnails generated by deferred jobs.
+thumbnail_stored = Signal(providing_args=[
+    'instance', 'field_file', 'thumb_name', 'name', 'format', 'quality',
+    'size', 'max_bytes'])
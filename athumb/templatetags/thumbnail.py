@@ -23,7 +23,7 @@ REGEXP_THUMB_SIZES = re.compile(r'(\d+)x(\d+)$')
 REGEXP_ARGS = re.compile('(?<!quality)=')
 
 # List of valid keys for key=value tag arguments.
-TAG_SETTINGS = ['force_ssl']
+TAG_SETTINGS = ['force_ssl', 'format']
 
 def split_args(args):
     """
@@ -100,11 +100,16 @@ class ThumbnailNode(Node):
                 # server or proxy must be passing the correct headers for
                 # this to work. Also, factor in force_ssl.
                 ssl_mode = self.is_secure(context) or force_ssl
+                # Ask for a format variant (webp, avif...), if there is one.
+                format = self.kwargs.get('format')
+                if format is not None:
+                    format = format.resolve(context)
                 # Get the URL for the thumbnail from the
                 # ImageWithThumbsFieldFile object.
                 try:
                     thumbnail = relative_source.generate_url(requested_name,
-                                                             ssl_mode=ssl_mode)
+                                                             ssl_mode=ssl_mode,
+                                                             format=format)
                 except:
                     #import traceback
                     #traceback.print_stack()
@@ -151,6 +156,11 @@ def thumbnail(parser, token):
 
         {% thumbnail image 80x80 force_ssl=True %}
 
+    If the thumbnail is also stored in other formats, ask for one with
+    ``format``. You get the regular thumbnail if it isn't::
+
+        {% thumbnail image 80x80 format='webp' %}
+
     To put the thumbnail URL on the context instead of just rendering
     it, finish the tag with ``as [context_var_name]``::
 
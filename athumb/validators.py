@@ -1,9 +1,59 @@
 from django.conf import settings
 from django.core.validators import ValidationError
 
+from athumb.pial.helpers import ImageTooLargeError
+
 # A list of allowable thumbnail file extensions.
 ALLOWABLE_THUMBNAIL_EXTENSIONS = getattr(
     settings, 'ALLOWABLE_THUMBNAIL_EXTENSIONS', ['png', 'jpg', 'jpeg', 'gif'])
+# Uploads with more pixels than this (width * height) are turned away before
+# they are decoded. The default is PIL's own decompression bomb threshold.
+# Set to None to allow any size.
+ATHUMB_MAX_PIXELS = getattr(settings, 'ATHUMB_MAX_PIXELS', 89478485)
+
+
+def check_pixel_count(engine, fobj):
+    """
+    Reads just the header of the image in ``fobj`` and raises a
+    ValidationError if it has more than ATHUMB_MAX_PIXELS pixels. Images
+    whose header can't be read are let through, for the thumbnailer to deal
+    with.
+
+    engine: (EngineBase) The thumbnail engine to probe with.
+    fobj: (file) The image. It is read from the start, whatever its current
+        position, and put back at that position afterwards.
+    """
+    try:
+        position = fobj.tell()
+    except (AttributeError, IOError):
+        # Can't seek. All we can do is read on from where it is.
+        position = None
+    else:
+        # Something (a form, hashing) may have read it already.
+        fobj.seek(0)
+
+    try:
+        info = engine.probe(fobj)
+    except ImageTooLargeError:
+        # Too big for the imaging library to even open.
+        raise ValidationError(
+            "Your image is too large. Please upload a smaller one.",
+            code='too_many_pixels'
+        )
+    finally:
+        if position is not None:
+            fobj.seek(position)
+
+    if info is None or not ATHUMB_MAX_PIXELS:
+        return
+
+    width, height = info.size
+    if width * height > ATHUMB_MAX_PIXELS:
+        raise ValidationError(
+            "Your image is too large (%dx%d). Please upload an image with no "
+            "more than %d pixels." % (width, height, ATHUMB_MAX_PIXELS),
+            code='too_many_pixels'
+        )
 
 class ImageUploadExtensionValidator(object):
     """
@@ -32,4 +82,19 @@ class ImageUploadExtensionValidator(object):
             raise ValidationError(
                 "Your file is not one of the allowable types: %s" % allowable_str,
                 code='extension_not_allowed'
-            )
\ No newline at end of file
+            )
+
+
+class ImagePixelCountValidator(object):
+    """
+    Turns away new uploads with more than ATHUMB_MAX_PIXELS pixels, going
+    by the image header alone.
+    """
+    def __call__(self, value):
+        if getattr(value, '_committed', False):
+            # Already stored, so it was checked on the way in.
+            return
+
+        # Imported here, fields imports this module.
+        from athumb.fields import THUMBNAIL_ENGINE
+        check_pixel_count(THUMBNAIL_ENGINE, value)
@@ -0,0 +1,93 @@
+"""
+A small, process-wide worker pool used to run per-thumbnail work (resizing,
+encoding, and storing) concurrently.
+"""
+import os
+import sys
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+# The maximum number of thumbnails to work on at once, per process. Setting
+# this to 1 (or less) runs everything serially in the calling thread.
+THUMBNAIL_WORKERS = getattr(settings, 'THUMBNAIL_WORKERS', 4)
+# Dotted path to the pool class. Must accept the number of workers as its
+# only argument and provide apply_async(), like multiprocessing's ThreadPool.
+THUMBNAIL_WORKER_POOL = getattr(settings, 'THUMBNAIL_WORKER_POOL',
+                                'multiprocessing.pool.ThreadPool')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """
+    Returns the process-wide worker pool, creating it on first use. Pools
+    don't survive a fork, so we also re-create it if we find ourselves in a
+    different process than the one that made it (pre-forking WSGI servers).
+    """
+    global _pool, _pool_pid
+
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                pool_class = import_string(THUMBNAIL_WORKER_POOL)
+                _pool = pool_class(THUMBNAIL_WORKERS)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def run_all(func, arg_tuples):
+    """
+    Calls ``func(*args)`` for each tuple in ``arg_tuples``, spreading the
+    calls across the worker pool. Blocks until every call has finished, even
+    if some of them fail, so nothing is left writing to storage behind our
+    back. The first exception raised (in ``arg_tuples`` order) is then
+    re-raised in the calling thread.
+
+    :param callable func: The function to call.
+    :param list arg_tuples: A list of positional argument tuples.
+    """
+    arg_tuples = list(arg_tuples)
+
+    if THUMBNAIL_WORKERS <= 1 or len(arg_tuples) <= 1:
+        # Not worth the hand-off.
+        for args in arg_tuples:
+            func(*args)
+        return
+
+    pool = get_worker_pool()
+    results = [pool.apply_async(_run, (func, args)) for args in arg_tuples]
+
+    first_error = None
+    for result in results:
+        try:
+            exc_info = result.get()
+        except Exception:
+            # The pool itself failed.
+            exc_info = sys.exc_info()
+        if exc_info is not None and first_error is None:
+            first_error = exc_info
+
+    if first_error is not None:
+        raise first_error[0], first_error[1], first_error[2]
+
+
+def _run(func, args):
+    """
+    Calls ``func(*args)`` in a worker. Returns ``sys.exc_info()`` if it
+    raises, so :func:`run_all` can re-raise it with the worker's traceback,
+    or ``None`` if it doesn't.
+    """
+    try:
+        func(*args)
+    except Exception:
+        return sys.exc_info()
+    finally:
+        # Workers outlive requests, so the request_finished signal never
+        # closes the database connections they open.
+        close_old_connections()
+    return None
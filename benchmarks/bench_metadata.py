@@ -0,0 +1,53 @@
+"""
+How many bytes leaving EXIF and ICC profiles out of thumbnails saves, on
+average, for photos carrying as much metadata as phone photos tend to. Run
+from the top of the source tree::
+
+    python -m benchmarks.bench_metadata
+"""
+from athumb.pial.engines.pil_engine import PILEngine
+
+from tests.helpers import encode, make_photo
+from tests.test_metadata import make_exif, make_icc_profile
+
+# Maker notes and the like. Phones commonly write 10-60KB of EXIF.
+EXIF_PADDING = 16 * 1024
+SIZES = [(100, 100), (200, 200), (400, 400), (800, 800)]
+FORMATS = ['JPEG', 'WEBP']
+PHOTOS = 4
+
+
+def main():
+    engine = PILEngine()
+    # Upright, since normalize() drops the EXIF of turned photos either way.
+    sources = [encode(make_photo((2000, 1500), seed=seed), quality=92,
+                      exif=make_exif(1, padding=EXIF_PADDING),
+                      icc_profile=make_icc_profile())
+               for seed in range(PHOTOS)]
+
+    print "%-5s %-9s %10s %10s %7s" % ('', 'size', 'kept', 'stripped',
+                                      'saved')
+    for format in FORMATS:
+        for size in SIZES:
+            totals = {}
+            for strip_metadata in (False, True):
+                total = 0
+                for source in sources:
+                    source.seek(0)
+                    image = engine.normalize(
+                        engine.get_image(source, min_size=size),
+                        strip_metadata=strip_metadata)
+                    thumb = engine.create_thumbnail(image, size)
+                    sink = engine.encode(thumb, format=format, quality=85)
+                    sink.seek(0, 2)
+                    total += sink.tell()
+                    sink.close()
+                totals[strip_metadata] = total / float(len(sources))
+            kept, stripped = totals[False], totals[True]
+            print "%-5s %-9s %10d %10d %6.1f%%" % (
+                format, '%dx%d' % size, kept, stripped,
+                100 * (kept - stripped) / kept)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+How many requests storing a file takes, against a local S3 stand-in. A save
+used to look the key up first (a HEAD request), then upload it. Run from
+the top of the source tree::
+
+    python -m benchmarks.bench_s3_requests
+"""
+from django.core.files.base import ContentFile
+
+from tests.fake_s3 import FakeS3Server
+from tests.test_s3_requests import LocalS3BotoStorage
+
+OBJECTS = 100
+
+
+class LookupFirstStorage(LocalS3BotoStorage):
+    """
+    Saves the way it used to be done, asking S3 for the key before
+    uploading it.
+    """
+    def _save(self, name, content):
+        with self.pooled_bucket() as bucket:
+            bucket.get_key(name)
+        return super(LookupFirstStorage, self)._save(name, content)
+
+
+def count_requests(server, storage):
+    # The first save also checks the bucket, once per storage instance.
+    storage.save('warm-up.jpg', ContentFile('x'))
+    server.reset()
+    for number in range(OBJECTS):
+        storage.save('thumbs/%d_small.jpg' % number,
+                     ContentFile('x' * 4096))
+    counts = {}
+    for method, path in server.requests:
+        counts[method] = counts.get(method, 0) + 1
+    storage.connection_pool.clear()
+    return counts
+
+
+def main():
+    server = FakeS3Server()
+    server.start()
+    try:
+        print "%-16s %8s %8s %8s %12s" % ('', 'HEAD', 'PUT', 'total',
+                                         'per object')
+        for label, storage_class, options in (
+                ('lookup first', LookupFirstStorage, {}),
+                ('blind PUT', LocalS3BotoStorage, {}),
+                ('conditional', LocalS3BotoStorage,
+                 {'conditional_writes': True})):
+            counts = count_requests(
+                server, storage_class(server.port, **options))
+            total = sum(counts.values())
+            print "%-16s %8d %8d %8d %12.2f" % (
+                label, counts.get('HEAD', 0), counts.get('PUT', 0), total,
+                total / float(OBJECTS))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Throughput versus quality of PILEngine's scaling options, to help pick a
+resample filter and reducing_gap per thumbnail size. Quality is the PSNR
+against the default single-pass filter, which is what athumb did before
+reducing_gap existed. Run from the top of the source tree::
+
+    python -m benchmarks.bench_scaling
+"""
+import sys
+import time
+
+from athumb.pial.engines.pil_engine import PILEngine, RESAMPLE_FILTERS
+
+from tests.helpers import make_photo, psnr
+
+SOURCE_SIZE = (4000, 3000)
+THUMB_SIZES = [(1200, 1200), (600, 600), (150, 150)]
+GAPS = [None, 1.5, 2.0, 3.0]
+FILTERS = [None] + [name for name in ('lanczos', 'bicubic', 'bilinear')
+                    if name in RESAMPLE_FILTERS]
+REPEAT = 3
+
+
+def time_scale(engine, image, size, resample, gap):
+    best = None
+    for _ in range(REPEAT):
+        start = time.time()
+        thumb = engine.scale(image, size, True, None, resample=resample,
+                             reducing_gap=gap)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return thumb, best
+
+
+def main():
+    engine = PILEngine()
+    image = make_photo(SOURCE_SIZE)
+    megapixels = SOURCE_SIZE[0] * SOURCE_SIZE[1] / 1e6
+
+    print "Source: %dx%d. Best of %d runs." % (SOURCE_SIZE + (REPEAT,))
+    print "%-11s %-10s %-5s %9s %8s %9s" % (
+        'size', 'filter', 'gap', 'ms', 'MP/s', 'PSNR dB')
+    for size in THUMB_SIZES:
+        reference, _ = time_scale(engine, image, size, None, None)
+        for resample in FILTERS:
+            for gap in GAPS:
+                thumb, elapsed = time_scale(engine, image, size, resample,
+                                            gap)
+                print "%-11s %-10s %-5s %9.1f %8.1f %9.1f" % (
+                    '%dx%d' % size, resample or 'default', gap or '-',
+                    elapsed * 1000, megapixels / elapsed,
+                    psnr(thumb, reference))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
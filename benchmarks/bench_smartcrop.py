@@ -0,0 +1,47 @@
+"""
+How long crop='smart' takes to pick its window, per image. It runs on the
+upload path, so the target is under 10ms. Run from the top of the source
+tree::
+
+    python -m benchmarks.bench_smartcrop
+"""
+import time
+
+from athumb.pial.engines.pil_engine import PILEngine
+
+from tests.helpers import make_photo
+
+# (source size, crop window). The window is picked from the already scaled
+# image, so these are typical of what it sees.
+CASES = [
+    ((4000, 3000), (1200, 1200)),
+    ((1600, 1200), (600, 600)),
+    ((800, 600), (200, 200)),
+    ((267, 200), (200, 200)),
+]
+RUNS = 50
+TARGET_MS = 10.0
+
+
+def main():
+    engine = PILEngine()
+    print "%-11s %-11s %9s %9s" % ('image', 'window', 'mean ms', 'max ms')
+    slowest = 0
+    for size, geometry in CASES:
+        image = make_photo(size)
+        image.load()
+        timings = []
+        for _ in range(RUNS):
+            start = time.time()
+            engine.get_smart_crop_offset(image, geometry)
+            timings.append((time.time() - start) * 1000)
+        slowest = max(slowest, max(timings))
+        print "%-11s %-11s %9.2f %9.2f" % (
+            '%dx%d' % size, '%dx%d' % geometry,
+            sum(timings) / len(timings), max(timings))
+    print "Target: %.0fms. %s" % (
+        TARGET_MS, 'OK' if slowest < TARGET_MS else 'Over target.')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,8 @@ setup(
     version=athumb.VERSION,
     packages=['athumb', 'athumb.backends', 'athumb.management',
               'athumb.pial', 'athumb.pial.engines',
-              'athumb.management.commands', 'athumb.templatetags',
+              'athumb.management.commands', 'athumb.migrations',
+              'athumb.queues', 'athumb.templatetags',
               'athumb.upload_handlers'],
     description='A simple, S3-backed thumbnailer field.',
     long_description=long_description,
@@ -0,0 +1,29 @@
+"""
+django-athumb's tests. Run them from the top of the source tree with::
+
+    python -m unittest discover -s tests -t .
+
+Tests for optional pieces (numpy, pyvips, boto) are skipped if those aren't
+installed.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    # Files and the database go in a scratch directory, removed on exit.
+    _scratch = tempfile.mkdtemp(prefix='athumb-tests-')
+    atexit.register(shutil.rmtree, _scratch, True)
+    settings.configure(
+        DATABASES={'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(_scratch, 'tests.db'),
+        }},
+        INSTALLED_APPS=['athumb', 'tests'],
+        MEDIA_ROOT=os.path.join(_scratch, 'media'),
+    )
+    django.setup()
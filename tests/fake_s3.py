@@ -0,0 +1,361 @@
+"""
+A local stand-in for S3, just enough of it for S3BotoStorage to store, list
+and read objects, in one go or in parts, which counts the requests it gets.
+"""
+import hashlib
+import itertools
+import socket
+import threading
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from xml.etree import cElementTree
+from xml.sax.saxutils import escape
+
+# Every object claims to have been written at this time.
+LAST_MODIFIED = '2026-01-01T00:00:00.000Z'
+# S3 won't take parts smaller than this, except for the last one.
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class FakeS3Server(ThreadingMixIn, HTTPServer):
+    """
+    Serves path-style requests (``/bucket/key``) on localhost, on a port of
+    its own choosing. Use :meth:`start` and :meth:`stop` around a test.
+
+    ``requests`` is a list of ``(method, path)`` tuples, in the order they
+    came in. ``objects`` maps ``(bucket, key)`` to the stored bytes.
+    ``uploads`` maps the IDs of multipart uploads in progress to their
+    ``(bucket, key)`` and a dict of the parts uploaded so far, by number.
+
+    Set ``part_failures[part_num]`` to have the next that many uploads of
+    that part fail with a 500. Keys in ``undeletable`` come back as errors
+    from multi-object deletes, and requests whose method is in ``hang_up``
+    get no response at all, just a closed connection. Bucket listings
+    return at most ``max_keys`` keys and prefixes a page, like S3's 1000.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeS3Handler)
+        self.port = self.server_address[1]
+        self.requests = []
+        self.objects = {}
+        self.uploads = {}
+        self.part_failures = {}
+        self.undeletable = set()
+        self.hang_up = set()
+        self.max_keys = 1000
+        self._upload_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # Sockets of the clients connected right now.
+        self.clients = set()
+        self._thread = None
+
+    def start(self):
+        # Checks for stop() often, so tests don't wait on it.
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        kwargs={'poll_interval': 0.01})
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+        # Hangs up on kept-alive connections, so their threads finish.
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def reset(self):
+        with self.lock:
+            del self.requests[:]
+
+    def count(self, method=None):
+        """
+        How many requests came in, of any method, or just ``method``.
+        """
+        with self.lock:
+            return len([request for request in self.requests
+                        if method is None or request[0] == method])
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Sends each response in one go, without waiting on delayed ACKs.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.clients.add(self.connection)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.clients.discard(self.connection)
+        BaseHTTPRequestHandler.finish(self)
+
+    def log_message(self, *args):
+        pass
+
+    def _parse(self):
+        """
+        Returns the bucket and key asked for. The query string's parameters
+        are left in ``self.query``.
+        """
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path))
+        url = urlparse.urlparse(self.path)
+        self.query = dict(urlparse.parse_qsl(url.query,
+                                             keep_blank_values=True))
+        bucket, _, key = url.path.lstrip('/').partition('/')
+        return bucket, urlparse.unquote(key)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _respond_xml(self, status, body):
+        self._respond(status, '<?xml version="1.0" encoding="UTF-8"?>' + body,
+                      {'Content-Type': 'application/xml'})
+
+    def _respond_error(self, status, code):
+        # boto drops the connection after a server error without closing it,
+        # so hang up rather than wait on it.
+        self._respond(status, '<?xml version="1.0" encoding="UTF-8"?>'
+                      '<Error><Code>%s</Code></Error>' % code, {
+                          'Content-Type': 'application/xml',
+                          'Connection': 'close' if status >= 500 else
+                                        'keep-alive'})
+
+    def _respond(self, status, body='', headers=None):
+        if self.command in self.server.hang_up:
+            self.close_connection = 1
+            return
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        bucket, key = self._parse()
+        if not key:
+            self._respond(200)
+            return
+        data = self.server.objects.get((bucket, key))
+        if data is None:
+            self._respond(404)
+        else:
+            self._respond(200, headers={
+                'ETag': '"%s"' % hashlib.md5(data).hexdigest()})
+
+    def do_GET(self):
+        bucket, key = self._parse()
+        if 'uploadId' in self.query:
+            self._list_parts()
+            return
+        if not key:
+            self._list_objects(bucket)
+            return
+        data = self.server.objects.get((bucket, key))
+        if data is None:
+            self._respond(404)
+        else:
+            self._respond(200, data, {
+                'ETag': '"%s"' % hashlib.md5(data).hexdigest()})
+
+    def do_PUT(self):
+        bucket, key = self._parse()
+        data = self._read_body()
+        if 'partNumber' in self.query:
+            self._upload_part(data)
+            return
+        if not key:
+            self._respond(200)
+            return
+        with self.server.lock:
+            if self.headers.get('If-None-Match') == '*' and \
+               (bucket, key) in self.server.objects:
+                exists = True
+            else:
+                exists = False
+                self.server.objects[(bucket, key)] = data
+        if exists:
+            self._respond(412)
+        else:
+            self._respond(200, headers={
+                'ETag': '"%s"' % hashlib.md5(data).hexdigest()})
+
+    def do_POST(self):
+        bucket, key = self._parse()
+        data = self._read_body()
+        if 'uploads' in self.query:
+            with self.server.lock:
+                upload_id = 'upload%d' % next(self.server._upload_ids)
+                self.server.uploads[upload_id] = ((bucket, key), {})
+            self._respond_xml(200, (
+                '<InitiateMultipartUploadResult><Bucket>%s</Bucket>'
+                '<Key>%s</Key><UploadId>%s</UploadId>'
+                '</InitiateMultipartUploadResult>') % (bucket, key, upload_id))
+        elif 'uploadId' in self.query:
+            self._complete_upload(data)
+        elif 'delete' in self.query:
+            self._delete_objects(bucket, data)
+        else:
+            self._respond_error(400, 'InvalidRequest')
+
+    def do_DELETE(self):
+        bucket, key = self._parse()
+        with self.server.lock:
+            if 'uploadId' in self.query:
+                # Aborting a multipart upload.
+                self.server.uploads.pop(self.query['uploadId'], None)
+            else:
+                self.server.objects.pop((bucket, key), None)
+        self._respond(204)
+
+    def _list_objects(self, bucket):
+        prefix = self.query.get('prefix', '')
+        marker = self.query.get('marker', '')
+        delimiter = self.query.get('delimiter', '')
+        max_keys = min(int(self.query.get('max-keys', 1000)),
+                       self.server.max_keys)
+        with self.server.lock:
+            objects = sorted((key, data) for (key_bucket, key), data
+                             in self.server.objects.items()
+                             if key_bucket == bucket and
+                             key.startswith(prefix) and key > marker)
+
+        # Keys, and the prefixes keys were rolled up into, in name order.
+        entries = []
+        for key, data in objects:
+            if delimiter and delimiter in key[len(prefix):]:
+                common = key[:key.index(delimiter, len(prefix)) + 1]
+                # A prefix that is the marker went out on the last page.
+                if common > marker and (not entries or
+                                        entries[-1][0] != common):
+                    entries.append((common, None))
+            else:
+                entries.append((key, data))
+        truncated = len(entries) > max_keys
+        entries = entries[:max_keys]
+
+        body = []
+        for name, data in entries:
+            if data is None:
+                body.append('<CommonPrefixes><Prefix>%s</Prefix>'
+                            '</CommonPrefixes>' % escape(name))
+            else:
+                body.append(
+                    '<Contents><Key>%s</Key><LastModified>%s</LastModified>'
+                    '<ETag>"%s"</ETag><Size>%d</Size>'
+                    '<StorageClass>STANDARD</StorageClass></Contents>' % (
+                        escape(name), LAST_MODIFIED,
+                        hashlib.md5(data).hexdigest(), len(data)))
+        if truncated and delimiter:
+            # Without a delimiter, the last key is the marker to go on from.
+            body.append('<NextMarker>%s</NextMarker>' % escape(entries[-1][0]))
+        self._respond_xml(200, (
+            '<ListBucketResult><Name>%s</Name><Prefix>%s</Prefix>'
+            '<Marker>%s</Marker><MaxKeys>%d</MaxKeys>'
+            '<IsTruncated>%s</IsTruncated>%s</ListBucketResult>') % (
+            bucket, escape(prefix), escape(marker), max_keys,
+            'true' if truncated else 'false', ''.join(body)))
+
+    def _delete_objects(self, bucket, body):
+        keys = [element.findtext('Key') for element in
+                cElementTree.fromstring(body).findall('Object')]
+        errors = []
+        with self.server.lock:
+            for key in keys:
+                if key in self.server.undeletable:
+                    errors.append(key)
+                else:
+                    self.server.objects.pop((bucket, key), None)
+        # Quiet mode, so only the errors are listed.
+        self._respond_xml(200, '<DeleteResult>%s</DeleteResult>' % ''.join(
+            '<Error><Key>%s</Key><Code>AccessDenied</Code>'
+            '<Message>Access Denied</Message></Error>' % key
+            for key in errors))
+
+    def _upload_part(self, data):
+        part_num = int(self.query['partNumber'])
+        with self.server.lock:
+            upload = self.server.uploads.get(self.query['uploadId'])
+            failures = self.server.part_failures.get(part_num, 0)
+            if failures:
+                self.server.part_failures[part_num] = failures - 1
+            elif upload is not None:
+                upload[1][part_num] = data
+        if upload is None:
+            self._respond_error(404, 'NoSuchUpload')
+        elif failures:
+            self._respond_error(500, 'InternalError')
+        else:
+            self._respond(200, headers={
+                'ETag': '"%s"' % hashlib.md5(data).hexdigest()})
+
+    def _list_parts(self):
+        with self.server.lock:
+            upload = self.server.uploads.get(self.query['uploadId'])
+            parts = sorted(upload[1].items()) if upload else None
+        if parts is None:
+            self._respond_error(404, 'NoSuchUpload')
+            return
+        self._respond_xml(200, (
+            '<ListPartsResult><UploadId>%s</UploadId>'
+            '<IsTruncated>false</IsTruncated>%s</ListPartsResult>') % (
+            self.query['uploadId'], ''.join(
+                '<Part><PartNumber>%d</PartNumber><ETag>"%s"</ETag>'
+                '<Size>%d</Size></Part>' % (
+                    part_num, hashlib.md5(data).hexdigest(), len(data))
+                for part_num, data in parts)))
+
+    def _complete_upload(self, body):
+        listed = [(int(part.findtext('PartNumber')), part.findtext('ETag'))
+                  for part in cElementTree.fromstring(body).findall('Part')]
+        with self.server.lock:
+            upload = self.server.uploads.get(self.query['uploadId'])
+            if upload is None:
+                error = (404, 'NoSuchUpload')
+            else:
+                (bucket, key), parts = upload
+                error = self._check_parts(listed, parts)
+            if error is None:
+                data = ''.join(parts[part_num] for part_num, _ in listed)
+                self.server.objects[(bucket, key)] = data
+                del self.server.uploads[self.query['uploadId']]
+        if error is not None:
+            self._respond_error(*error)
+            return
+        self._respond_xml(200, (
+            '<CompleteMultipartUploadResult><Bucket>%s</Bucket><Key>%s</Key>'
+            '<ETag>"%s-%d"</ETag></CompleteMultipartUploadResult>') % (
+            bucket, key, hashlib.md5(data).hexdigest(), len(listed)))
+
+    def _check_parts(self, listed, parts):
+        """
+        Returns the status and error code S3 would give for completing an
+        upload with the ``listed`` (number, ETag) pairs, or None if it
+        would go through.
+        """
+        numbers = [part_num for part_num, _ in listed]
+        if not numbers or numbers != sorted(set(numbers)):
+            return 400, 'InvalidPartOrder'
+        for part_num, etag in listed:
+            data = parts.get(part_num)
+            if data is None or \
+               etag.strip('"') != hashlib.md5(data).hexdigest():
+                return 400, 'InvalidPart'
+        if any(len(parts[part_num]) < MIN_PART_SIZE
+               for part_num in numbers[:-1]):
+            return 400, 'EntityTooSmall'
+        return None
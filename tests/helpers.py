@@ -0,0 +1,92 @@
+"""
+Things the tests and benchmarks share: made-up test images, ways to compare
+them, the test database, and a clock.
+"""
+import math
+import random
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from PIL import Image, ImageChops, ImageDraw
+
+_tables_created = False
+
+
+def make_photo(size=(1600, 1200), mode='RGB', seed=0):
+    """
+    Returns a photo-like test image: smooth, random color fields with some
+    hard edges on top. The same arguments always make the same image.
+    """
+    rnd = random.Random(seed)
+    x, y = size
+    # A small grid of random colors, blown up, makes soft gradients.
+    grid = (max(2, x // 40), max(2, y // 40))
+    noise = bytearray(rnd.randrange(256) for _ in range(grid[0] * grid[1] * 3))
+    image = Image.frombytes('RGB', grid, bytes(noise))
+    image = image.resize(size, Image.BICUBIC)
+
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        left, top = rnd.randrange(x), rnd.randrange(y)
+        box = (left, top, left + rnd.randrange(x // 4) + 1,
+               top + rnd.randrange(y // 4) + 1)
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        if rnd.random() < 0.5:
+            draw.rectangle(box, fill=color)
+        else:
+            draw.ellipse(box, fill=color)
+    del draw
+
+    if mode != 'RGB':
+        image = image.convert(mode)
+    return image
+
+
+def encode(image, format='JPEG', **options):
+    """
+    Returns ``image`` saved in ``format``, as a rewound file-like object.
+    """
+    buf = StringIO()
+    image.save(buf, format=format, **options)
+    buf.seek(0)
+    return buf
+
+
+def psnr(image, reference):
+    """
+    Returns the peak signal-to-noise ratio of ``image`` against
+    ``reference``, in dB. Higher is closer. Identical images give infinity.
+    """
+    diff = ImageChops.difference(image.convert('RGB'),
+                                 reference.convert('RGB'))
+    histogram = diff.histogram()
+    squared = 0
+    for band in range(3):
+        for value, count in enumerate(histogram[band * 256:(band + 1) * 256]):
+            squared += count * value * value
+    mse = squared / float(image.size[0] * image.size[1] * 3)
+    if mse == 0:
+        return float('inf')
+    return 10 * math.log10(255 * 255 / mse)
+
+
+def create_tables():
+    """
+    Creates the tables for athumb's models and the tests' own, the first
+    time it's called.
+    """
+    global _tables_created
+    if not _tables_created:
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        _tables_created = True
+
+
+class Clock(object):
+    """
+    Stands in for the time module, with time that only moves when told.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
@@ -0,0 +1,12 @@
+from django.db import models
+
+from athumb.fields import ImageWithThumbsField
+
+
+class Photo(models.Model):
+    image = ImageWithThumbsField(
+        upload_to='photos', blank=True,
+        thumbs=(
+            ('small', {'size': (50, 50)}),
+            ('medium', {'size': (120, 120), 'crop': True}),
+        ))
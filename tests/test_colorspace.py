@@ -0,0 +1,103 @@
+"""
+Converting the colorspace after scaling, where that commutes, must give the
+same pixels as converting the full-size image first.
+"""
+import unittest
+
+from athumb.pial.engines.pil_engine import PILEngine
+from athumb.pial.parsers import parse_crop_anchor
+
+from tests.helpers import encode, make_photo
+
+CASES = [
+    # (geometry, crop, resample, reducing_gap)
+    ((200, 200), None, None, None),
+    ((200, 200), parse_crop_anchor('center'), None, None),
+    ((300, 120), parse_crop_anchor('left bottom'), 'bicubic', None),
+    ((150, 150), parse_crop_anchor('25% 75%'), 'lanczos', 2.0),
+    ((100, 100), None, 'bilinear', 3.0),
+    ((2000, 2000), None, None, None),
+]
+
+
+class CommutedPipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+
+    def convert_first(self, image, geometry, crop, resample, reducing_gap,
+                      colorspace='RGB'):
+        """
+        The pipeline as it was: convert the full-size image, then scale and
+        crop.
+        """
+        image = image.convert(colorspace == 'RGB' and 'RGB' or 'L')
+        image = self.engine.scale(image, geometry, True, crop,
+                                  resample=resample, reducing_gap=reducing_gap)
+        return self.engine.crop(image, geometry, crop)
+
+    def assertSamePixels(self, image, expected, label):
+        self.assertEqual(image.mode, expected.mode, label)
+        self.assertEqual(image.size, expected.size, label)
+        self.assertTrue(image.tobytes() == expected.tobytes(), label)
+
+    def test_grayscale_to_rgb(self):
+        source = self.engine.normalize(self.engine.get_image(
+            encode(make_photo((800, 600), mode='L'), quality=90)))
+        self.assertEqual(source.mode, 'L')
+        self.assertTrue(self.engine._colorspace_commutes(source, 'RGB'))
+
+        for geometry, crop, resample, reducing_gap in CASES:
+            thumb = self.engine.create_thumbnail(
+                source, geometry, crop=crop, resample=resample,
+                reducing_gap=reducing_gap)
+            expected = self.convert_first(source, geometry, crop, resample,
+                                          reducing_gap)
+            self.assertSamePixels(thumb, expected, (geometry, crop, resample,
+                                                    reducing_gap))
+
+    def test_rgb_is_not_copied(self):
+        # Already RGB, so the colorspace step has nothing to do.
+        source = make_photo((800, 600))
+        self.assertTrue(self.engine.colorspace(source, 'RGB') is source)
+        for geometry, crop, resample, reducing_gap in CASES:
+            thumb = self.engine.create_thumbnail(
+                source, geometry, crop=crop, resample=resample,
+                reducing_gap=reducing_gap)
+            expected = self.convert_first(source, geometry, crop, resample,
+                                          reducing_gap)
+            self.assertSamePixels(thumb, expected, geometry)
+
+    def test_rgb_to_gray(self):
+        # Doesn't commute (rounding differs), so it's still done first.
+        source = make_photo((800, 600))
+        self.assertFalse(self.engine._colorspace_commutes(source, 'GRAY'))
+        thumb = self.engine.create_thumbnail(source, (200, 200),
+                                             colorspace='GRAY')
+        expected = self.convert_first(source, (200, 200), None, None, None,
+                                      colorspace='GRAY')
+        self.assertSamePixels(thumb, expected, 'GRAY')
+
+    def test_unscaled_thumbnail_can_be_copied(self):
+        # Too small to scale, so every plan would get the source back. Each
+        # needs its own to save from.
+        source = make_photo((120, 90))
+        thumb = self.engine.create_thumbnail(source, (200, 200),
+                                             upscale=False)
+        self.assertTrue(thumb is source)
+        copied = self.engine.copy(thumb)
+        self.assertFalse(copied is source)
+        self.assertSamePixels(copied, source, 'copy')
+        self.engine.encode(copied, format='PNG')
+        self.assertFalse(hasattr(source, 'encoderinfo'))
+
+    def test_normalize_modes(self):
+        for mode, expected_mode in (('L', 'L'), ('RGB', 'RGB'),
+                                    ('RGBA', 'RGBA'), ('P', 'RGBA'),
+                                    ('CMYK', 'RGBA')):
+            image = make_photo((64, 48), mode=mode)
+            self.assertEqual(self.engine.normalize(image).mode,
+                             expected_mode, mode)
+
+
+if __name__ == '__main__':
+    unittest.main()
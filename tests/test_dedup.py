@@ -0,0 +1,152 @@
+"""
+Deduplicated uploads share stored files, and the files go once the last
+field value using them lets go, including by being replaced.
+"""
+import shutil
+import tempfile
+import unittest
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+from athumb import fields
+from athumb.dedup import CacheIndex, DatabaseIndex
+from athumb.models import DeduplicatedImage
+
+from tests.helpers import create_tables, encode, make_photo
+from tests.models import Photo
+
+
+class Holder(object):
+    """
+    Stands in for a model instance.
+    """
+    photo = None
+
+
+class ReplaceTests(unittest.TestCase):
+    def setUp(self):
+        cache.clear()
+        self.location = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.location)
+        self.field = fields.ImageWithThumbsField(
+            upload_to='photos', storage=self.storage,
+            thumbs=(('small', {'size': (50, 50)}),))
+        self.field.set_attributes_from_name('photo')
+        self.index = CacheIndex()
+        self._get_dedup_index = fields.get_dedup_index
+        fields.get_dedup_index = lambda: self.index
+
+        self.first = encode(make_photo((200, 150), seed=1)).getvalue()
+        self.second = encode(make_photo((200, 150), seed=2)).getvalue()
+
+    def tearDown(self):
+        fields.get_dedup_index = self._get_dedup_index
+        shutil.rmtree(self.location)
+        cache.clear()
+
+    def upload(self, fieldfile, data):
+        fieldfile.save('photo.jpg', ContentFile(data), save=False)
+        return fieldfile.name
+
+    def new_fieldfile(self):
+        return self.field.attr_class(Holder(), self.field, None)
+
+    def test_replaced_files_are_released(self):
+        one, other = self.new_fieldfile(), self.new_fieldfile()
+        shared_name = self.upload(one, self.first)
+        self.assertEqual(self.upload(other, self.first), shared_name)
+
+        # Replacing one's file lets go of the shared one...
+        self.assertNotEqual(self.upload(one, self.second), shared_name)
+        self.assertTrue(self.storage.exists(shared_name))
+        # ...so when the other is deleted, nothing else is using it.
+        other.delete(save=False)
+        self.assertFalse(self.storage.exists(shared_name))
+        self.assertTrue(self.storage.exists(one.name))
+
+    def test_replaced_with_the_same_image(self):
+        one, other = self.new_fieldfile(), self.new_fieldfile()
+        shared_name = self.upload(one, self.first)
+        self.upload(other, self.first)
+        self.assertEqual(self.upload(one, self.first), shared_name)
+
+        # Still two references.
+        other.delete(save=False)
+        self.assertTrue(self.storage.exists(shared_name))
+        one.delete(save=False)
+        self.assertFalse(self.storage.exists(shared_name))
+
+
+class ModelReplaceTests(unittest.TestCase):
+    """
+    Replacing the image the way forms and the admin do: assigning an upload
+    to the model attribute, then saving the instance.
+    """
+    @classmethod
+    def setUpClass(cls):
+        create_tables()
+
+    def setUp(self):
+        self._get_dedup_index = fields.get_dedup_index
+        index = DatabaseIndex()
+        fields.get_dedup_index = lambda: index
+        self.first = encode(make_photo((200, 150), seed=1)).getvalue()
+        self.second = encode(make_photo((200, 150), seed=2)).getvalue()
+
+    def tearDown(self):
+        fields.get_dedup_index = self._get_dedup_index
+        for photo in Photo.objects.all():
+            photo.image.delete(save=False)
+        Photo.objects.all().delete()
+        DeduplicatedImage.objects.all().delete()
+
+    def create(self, data, name):
+        photo = Photo()
+        photo.image = ContentFile(data, name=name)
+        photo.save()
+        return photo
+
+    def refcount(self, name):
+        return DeduplicatedImage.objects.get(name=name).refcount
+
+    def test_assigned_upload_releases_the_old_file(self):
+        shared_name = self.create(self.first, 'one.jpg').image.name
+        other = self.create(self.first, 'other.jpg')
+        self.assertEqual(other.image.name, shared_name)
+        self.assertEqual(self.refcount(shared_name), 2)
+
+        photo = Photo.objects.exclude(pk=other.pk).get()
+        photo.image = ContentFile(self.second, name='two.jpg')
+        photo.save()
+        self.assertNotEqual(photo.image.name, shared_name)
+        self.assertEqual(self.refcount(shared_name), 1)
+
+        # Only the other one has it now, so deleting that deletes the file.
+        other.image.delete()
+        self.assertFalse(other.image.storage.exists(shared_name))
+
+    def test_replaced_twice(self):
+        photo = self.create(self.first, 'one.jpg')
+        first_name = photo.image.name
+        photo.image = ContentFile(self.second, name='two.jpg')
+        photo.save()
+        second_name = photo.image.name
+        # The same instance, not reloaded.
+        photo.image = ContentFile(self.first, name='three.jpg')
+        photo.save()
+        for name in (first_name, second_name):
+            self.assertFalse(DeduplicatedImage.objects.filter(
+                name=name).exists())
+        self.assertEqual(self.refcount(photo.image.name), 1)
+
+    def test_new_instance_releases_nothing(self):
+        shared_name = self.create(self.first, 'one.jpg').image.name
+        # Its upload is named like the stored file, but isn't it.
+        self.create(self.second, shared_name)
+        self.assertEqual(self.refcount(shared_name), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
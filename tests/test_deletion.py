@@ -0,0 +1,144 @@
+"""
+Deleting stored files in batches: S3's multi-object delete and how its
+failures are reported, the fallback for other storage backends, and
+delete_with_thumbnails().
+"""
+import os
+import unittest
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from athumb import delete_with_thumbnails, fields
+from athumb.deletion import delete_many
+
+from tests.helpers import create_tables, encode, make_photo
+from tests.models import Photo
+
+try:
+    from athumb.backends.s3boto import S3BotoStorage
+except ImportError:
+    S3BotoStorage = None
+else:
+    from tests.fake_s3 import FakeS3Server
+    from tests.test_s3_requests import LocalS3BotoStorage
+
+
+@unittest.skipIf(S3BotoStorage is None, 'boto is needed.')
+class S3DeleteManyTests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeS3Server()
+        self.server.start()
+        self.storage = LocalS3BotoStorage(self.server.port)
+        self.names = ['photos/%d.jpg' % number for number in range(5)]
+        for name in self.names:
+            self.storage.save(name, ContentFile('data'))
+        self.server.reset()
+
+    def tearDown(self):
+        self.storage.connection_pool.clear()
+        if self.server.port is not None:
+            self.server.stop()
+
+    def test_one_request(self):
+        self.assertEqual(delete_many(self.storage, self.names), {})
+        self.assertEqual(self.server.count(), 1)
+        self.assertEqual(self.server.objects, {})
+
+    def test_some_not_deleted(self):
+        self.server.undeletable.add('photos/1.jpg')
+        self.assertEqual(delete_many(self.storage, self.names),
+                         {'photos/1.jpg': 'AccessDenied: Access Denied'})
+        self.assertEqual(self.server.objects.keys(), [('media', 'photos/1.jpg')])
+
+    def assert_all_failed(self, errors, exc_name):
+        self.assertEqual(sorted(errors), self.names)
+        for error in errors.values():
+            self.assertTrue(error.startswith(exc_name + ':'), error)
+
+    def test_connection_refused(self):
+        # Otherwise it's the kept-alive connection being hung up on.
+        self.storage.connection_pool.clear()
+        self.server.stop()
+        self.server.port = None
+        self.assert_all_failed(delete_many(self.storage, self.names),
+                               'error')
+
+    def test_no_response(self):
+        self.server.hang_up.add('POST')
+        self.assert_all_failed(delete_many(self.storage, self.names),
+                               'BadStatusLine')
+        # Not put back for the next request.
+        stats = self.storage.connection_pool.stats()
+        self.assertEqual((stats['discarded'], stats['idle']), (1, 0))
+
+
+class FallbackTests(unittest.TestCase):
+    """
+    Storage backends without delete_many() of their own.
+    """
+    def test_deleted(self):
+        names = [default_storage.save('deletion/%d.txt' % number,
+                                      ContentFile('data'))
+                 for number in range(3)]
+        self.assertEqual(delete_many(default_storage, names), {})
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_errors(self):
+        name = default_storage.save('deletion/photo.jpg', ContentFile('data'))
+        # A directory can't be deleted like a file.
+        errors = delete_many(default_storage, ['deletion', name])
+        self.assertEqual(errors.keys(), ['deletion'])
+        self.assertTrue(errors['deletion'].startswith('OSError:'))
+        self.assertFalse(default_storage.exists(name))
+        os.rmdir(default_storage.path('deletion'))
+
+
+class DeleteWithThumbnailsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_tables()
+
+    def setUp(self):
+        self.photos = []
+        for seed in (1, 2):
+            photo = Photo()
+            photo.image = ContentFile(
+                encode(make_photo((200, 150), seed=seed)).getvalue(),
+                name='photo.jpg')
+            photo.save()
+            self.photos.append(photo)
+
+    def tearDown(self):
+        Photo.objects.all().delete()
+
+    def test_deleted(self):
+        stored = [name for photo in self.photos
+                  for name in photo.image._stored_filenames()]
+        for name in stored:
+            self.assertTrue(default_storage.exists(name))
+
+        errors = delete_with_thumbnails(Photo.objects.all(), 'image')
+        self.assertEqual(errors, {})
+        self.assertFalse(Photo.objects.exists())
+        for name in stored:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_urls_forgotten(self):
+        # Loaded the way the queryset will load them.
+        photos = list(Photo.objects.all())
+        cache_keys = [photo.image._url_cache_key('small', False, True)
+                      for photo in photos]
+        for photo in photos:
+            photo.image.generate_url('small')
+        for key in cache_keys:
+            self.assertNotEqual(fields.LOCAL_URL_CACHE.get(key), None)
+
+        delete_with_thumbnails(Photo.objects.all(), 'image')
+        for key in cache_keys:
+            self.assertEqual(fields.LOCAL_URL_CACHE.get(key), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+EngineBase.encode_to_size(): the quality it settles on, and how many full
+encodes it takes to get there.
+"""
+import unittest
+
+from athumb.pial.engines.pil_engine import PILEngine
+
+from tests.helpers import make_photo
+
+
+class CountingEngine(PILEngine):
+    """
+    Counts the encodes of full-size images, leaving out encode_to_size()'s
+    trial encodes of a shrunken copy.
+    """
+    def __init__(self, full_size):
+        self.full_size = full_size
+        self.full_encodes = 0
+
+    def write_to(self, image, fobj, **kwargs):
+        if image.size == self.full_size:
+            self.full_encodes += 1
+        return super(CountingEngine, self).write_to(image, fobj, **kwargs)
+
+
+class EncodeToSizeTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.image = make_photo((800, 600))
+        # Encoded size by quality, the exhaustive way.
+        cls.sizes = {}
+        for quality in range(20, 96):
+            sink = PILEngine().encode(cls.image, format='JPEG',
+                                      quality=quality)
+            sink.seek(0, 2)
+            cls.sizes[quality] = sink.tell()
+            sink.close()
+
+    def setUp(self):
+        self.engine = CountingEngine(self.image.size)
+
+    def best_quality(self, max_bytes):
+        """
+        The highest quality that fits, found by trying every one.
+        """
+        fits = [quality for quality, size in self.sizes.items()
+                if size <= max_bytes]
+        return max(fits) if fits else None
+
+    def encode_to_size(self, max_bytes, **kwargs):
+        self.engine.full_encodes = 0
+        sink, quality, size = self.engine.encode_to_size(
+            self.image, max_bytes, format='JPEG', **kwargs)
+        data = sink.read()
+        sink.close()
+        self.assertEqual(len(data), size)
+        return quality, size
+
+    def test_close_to_best_quality(self):
+        for fraction in (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9):
+            max_bytes = int(self.sizes[95] * fraction)
+            quality, size = self.encode_to_size(max_bytes)
+            best = self.best_quality(max_bytes)
+            self.assertLessEqual(size, max_bytes, fraction)
+            self.assertEqual(size, self.sizes[quality], fraction)
+            # Four encodes can't always land on it exactly, but where they
+            # miss, the sizes are close even if the qualities aren't.
+            self.assertTrue(best - 10 <= quality <= best,
+                            (fraction, quality, best))
+            self.assertGreater(size, self.sizes[best] * 0.85,
+                               (fraction, size, self.sizes[best]))
+
+    def test_bounded_encodes(self):
+        for max_attempts in (2, 3, 4, 6):
+            for fraction in (0.3, 0.6, 0.9):
+                max_bytes = int(self.sizes[95] * fraction)
+                quality, size = self.encode_to_size(max_bytes,
+                                                    max_attempts=max_attempts)
+                self.assertLessEqual(self.engine.full_encodes, max_attempts,
+                                     (max_attempts, fraction))
+                self.assertLessEqual(size, max_bytes,
+                                     (max_attempts, fraction))
+
+    def test_fits_at_first_quality(self):
+        quality, size = self.encode_to_size(self.sizes[95] + 1)
+        self.assertEqual(quality, 95)
+        self.assertEqual(self.engine.full_encodes, 1)
+
+    def test_unreachable_budget(self):
+        # Even the lowest quality allowed is too big. That's what you get.
+        quality, size = self.encode_to_size(self.sizes[20] // 2)
+        self.assertEqual(quality, 20)
+        self.assertEqual(size, self.sizes[20])
+
+    def test_lossless_format(self):
+        # Quality doesn't change PNG's size, so there's nothing to search.
+        self.engine.full_encodes = 0
+        sink, quality, size = self.engine.encode_to_size(
+            self.image, 1000, format='PNG')
+        sink.close()
+        self.assertEqual(quality, 95)
+        self.assertEqual(self.engine.full_encodes, 1)
+        self.assertGreater(size, 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
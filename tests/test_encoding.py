@@ -0,0 +1,59 @@
+"""
+PILEngine encoding straight into file objects, and trying again without
+optimize when the encoder can't manage it.
+"""
+import unittest
+from cStringIO import StringIO
+
+from athumb.pial.engines.pil_engine import PILEngine
+
+from tests.helpers import make_photo
+
+
+class CantOptimize(object):
+    """
+    Wraps an image whose encoder fails part way through with optimize on,
+    like PIL's did for JPEGs over its block size.
+    """
+    def __init__(self, image, always=False):
+        self.image = image
+        self.info = image.info
+        self.always = always
+
+    def save(self, fobj, **options):
+        if options.get('optimize') or self.always:
+            fobj.write('half an image')
+            raise IOError('encoder error -2 when writing image file')
+        return self.image.save(fobj, **options)
+
+
+class OptimizeFallbackTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+        self.image = make_photo((320, 240))
+        expected = StringIO()
+        self.image.save(expected, format='JPEG', quality=80)
+        self.expected = expected.getvalue()
+
+    def test_retried_in_place(self):
+        buf = StringIO()
+        buf.write('before')
+        self.engine.write_to(CantOptimize(self.image), buf, quality=80,
+                             format='JPEG')
+        self.assertTrue(buf.getvalue() == 'before' + self.expected)
+
+    def test_spooled(self):
+        sink = self.engine.encode(CantOptimize(self.image), quality=80,
+                                  format='JPEG')
+        self.assertTrue(sink.read() == self.expected)
+        sink.close()
+
+    def test_other_errors(self):
+        # Fails without optimize too, so it's a real problem.
+        self.assertRaises(IOError, self.engine.write_to,
+                          CantOptimize(self.image, always=True), StringIO(),
+                          format='JPEG')
+
+
+if __name__ == '__main__':
+    unittest.main()
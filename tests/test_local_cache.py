@@ -0,0 +1,84 @@
+"""
+The in-process LRU cache in front of Django's cache for thumbnail URLs.
+"""
+import unittest
+
+from athumb import local_cache
+from athumb.local_cache import LocalCache
+
+from tests.helpers import Clock
+
+
+class LocalCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self._time = local_cache.time
+        local_cache.time = self.clock
+
+    def tearDown(self):
+        local_cache.time = self._time
+
+    def assert_stats(self, cache, **expected):
+        stats = cache.stats()
+        self.assertEqual(dict((name, stats[name]) for name in expected),
+                         expected)
+
+    def test_least_recently_used_evicted(self):
+        cache = LocalCache(3, 60)
+        for key in 'abc':
+            cache.set(key, key.upper())
+        # Using 'a' makes 'b' the least recently used.
+        self.assertEqual(cache.get('a'), 'A')
+        cache.set('d', 'D')
+        self.assertEqual(cache.get('b'), None)
+        for key in 'acd':
+            self.assertEqual(cache.get(key), key.upper())
+        self.assert_stats(cache, hits=4, misses=1, evictions=1, size=3)
+
+    def test_set_refreshes(self):
+        cache = LocalCache(2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('a', 3)
+        cache.set('c', 4)
+        self.assertEqual(cache.get('a'), 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assert_stats(cache, evictions=1, size=2)
+
+    def test_expiry(self):
+        cache = LocalCache(10, 60)
+        cache.set('a', 'A')
+        self.clock.now += 30
+        cache.set('b', 'B')
+        self.clock.now += 30
+        self.assertEqual(cache.get('a'), 'A')
+        self.clock.now += 1
+        # Reading doesn't extend it.
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), 'B')
+        self.clock.now += 30
+        self.assertEqual(cache.get('b'), None)
+        # Expired entries are dropped, not counted as evictions.
+        self.assert_stats(cache, hits=2, misses=2, evictions=0, size=0)
+
+    def test_disabled(self):
+        cache = LocalCache(0, 60)
+        cache.set('a', 'A')
+        self.assertEqual(cache.get('a'), None)
+        self.assert_stats(cache, hits=0, misses=1, evictions=0, size=0)
+
+    def test_delete_many_and_clear(self):
+        cache = LocalCache(10, 60)
+        for key in 'abc':
+            cache.set(key, key.upper())
+        cache.delete_many(['a', 'b', 'missing'])
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('c'), 'C')
+        cache.clear()
+        self.assertEqual(cache.get('c'), None)
+        # The counters survive clear().
+        self.assert_stats(cache, hits=1, misses=2, evictions=0, size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+PILEngine turning images upright by their EXIF orientation, and leaving
+EXIF and ICC profiles out of thumbnails.
+"""
+import unittest
+from cStringIO import StringIO
+
+from PIL import Image, ImageCms
+
+from athumb.pial.engines.pil_engine import PILEngine
+
+from tests.helpers import encode, make_photo, psnr
+
+EXIF_ORIENTATION = 0x0112
+# How each orientation's image is stored, given the upright one. These are
+# the EXIF spec's, worked out independently of the engine's.
+STORED_TRANSPOSES = {
+    1: None,
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_90,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_270,
+}
+
+
+def make_exif(orientation=1, padding=0):
+    """
+    Returns EXIF data with the given orientation, padded out with a maker
+    note of ``padding`` bytes, as cameras and phones tend to add.
+    """
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    if padding:
+        exif[0x927c] = b'\0' * padding
+    return exif.tobytes()
+
+
+def make_icc_profile():
+    return ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+
+
+def make_stored(upright, orientation, **options):
+    """
+    Returns ``upright`` as a camera would store it with ``orientation``,
+    as a JPEG file-like object.
+    """
+    method = STORED_TRANSPOSES[orientation]
+    stored = upright.transpose(method) if method is not None else upright
+    return encode(stored, quality=95, exif=make_exif(orientation), **options)
+
+
+class OrientationTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+        # Not symmetric either way, so any wrong turn or flip shows.
+        self.upright = make_photo((240, 160))
+
+    def test_every_orientation(self):
+        for orientation in sorted(STORED_TRANSPOSES):
+            image = self.engine.normalize(self.engine.get_image(
+                make_stored(self.upright, orientation)))
+            self.assertEqual(image.size, self.upright.size, orientation)
+            self.assertGreater(psnr(image, self.upright), 30, orientation)
+
+    def test_draft_size_is_upright(self):
+        upright = make_photo((800, 600))
+        seen = []
+
+        def min_size(image_size):
+            seen.append(image_size)
+            # Half of 800 only just covers it. Swapped the wrong way round,
+            # half of 600 wouldn't, and it would be decoded at full size.
+            return (390, 100)
+
+        for orientation in (6, 8):
+            del seen[:]
+            image = self.engine.normalize(self.engine.get_image(
+                make_stored(upright, orientation), min_size=min_size))
+            self.assertEqual(seen, [(800, 600)], orientation)
+            self.assertEqual(image.size, (400, 300), orientation)
+            expected = upright.resize((400, 300), Image.BILINEAR)
+            self.assertGreater(psnr(image, expected), 25, orientation)
+
+    def test_kept_exif_is_not_applied_twice(self):
+        image = self.engine.normalize(
+            self.engine.get_image(make_stored(self.upright, 6)),
+            strip_metadata=False)
+        self.assertFalse(image.info.get('exif'))
+        saved = Image.open(self.engine.encode(image, format='JPEG'))
+        self.assertEqual(self.engine._get_orientation(saved), 1)
+
+
+class StripMetadataTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+        self.source = encode(make_photo((800, 600)), quality=95,
+                             exif=make_exif(padding=8000),
+                             icc_profile=make_icc_profile())
+
+    def thumbnail(self, format, strip_metadata):
+        self.source.seek(0)
+        image = self.engine.normalize(self.engine.get_image(self.source),
+                                      strip_metadata=strip_metadata)
+        thumb = self.engine.create_thumbnail(image, (100, 100))
+        sink = self.engine.encode(thumb, format=format, quality=85)
+        data = sink.read()
+        sink.close()
+        return data
+
+    def test_stripped(self):
+        for format in ('JPEG', 'PNG', 'WEBP'):
+            saved = Image.open(StringIO(self.thumbnail(format, True)))
+            self.assertFalse(saved.info.get('exif'), format)
+            self.assertFalse(saved.info.get('icc_profile'), format)
+
+    def test_kept(self):
+        saved = Image.open(StringIO(self.thumbnail('JPEG', False)))
+        self.assertTrue(saved.info.get('exif'))
+        self.assertEqual(saved.info.get('icc_profile'), make_icc_profile())
+
+    def test_smaller(self):
+        for format in ('JPEG', 'PNG', 'WEBP'):
+            stripped = len(self.thumbnail(format, True))
+            kept = len(self.thumbnail(format, False))
+            self.assertLess(stripped + 8000, kept, format)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Thumbnail specs are checked when the field is made, including whether the
+engine can save the formats they ask for.
+"""
+import unittest
+
+from django.core.exceptions import ImproperlyConfigured
+
+from athumb.pial.engines.pil_engine import PILEngine
+from athumb.plans import compile_thumbs
+
+THUMBS = (
+    ('small', {'size': (60, 60)}),
+    ('large', {'size': (600, 600), 'variants': ('webp', 'png')}),
+)
+
+
+class FormatTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+
+    def test_supported(self):
+        plans = compile_thumbs(THUMBS, 'jpg', ('webp',), engine=self.engine)
+        self.assertEqual(plans[0].variants, ('webp',))
+        self.assertEqual(plans[1].variants, ('webp', 'png'))
+
+    def test_unsupported_variant(self):
+        self.assertRaises(ImproperlyConfigured, compile_thumbs, THUMBS,
+                          'jpeg', ('nosuchformat',), engine=self.engine)
+
+    def test_unsupported_format(self):
+        self.assertRaises(ImproperlyConfigured, compile_thumbs, THUMBS,
+                          'nosuchformat', engine=self.engine)
+
+    def test_unchecked_without_engine(self):
+        compile_thumbs(THUMBS, 'nosuchformat', ('nosuchformat',))
+
+    def test_engine_checks(self):
+        self.assertTrue(self.engine.can_write('jpg'))
+        self.assertTrue(self.engine.can_write('JPEG'))
+        self.assertTrue(self.engine.can_write('webp'))
+        self.assertFalse(self.engine.can_write('nosuchformat'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+The connection pool the S3 backends share between threads.
+"""
+import unittest
+
+from athumb.backends import pool
+from athumb.backends.pool import ConnectionPool
+
+from tests.helpers import Clock
+
+
+class Connection(object):
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.made = []
+        self.clock = Clock()
+        self._time = pool.time
+        pool.time = self.clock
+
+    def tearDown(self):
+        pool.time = self._time
+
+    def factory(self):
+        conn = Connection(len(self.made))
+        self.made.append(conn)
+        return conn
+
+    def make_pool(self, **kwargs):
+        return ConnectionPool(self.factory, **kwargs)
+
+    def assert_stats(self, pool, **expected):
+        stats = pool.stats()
+        self.assertEqual(dict((name, stats[name]) for name in expected),
+                         expected)
+
+    def test_reused(self):
+        pool = self.make_pool()
+        for _ in range(3):
+            with pool.connection() as conn:
+                self.assertIs(conn, self.made[0])
+        self.assert_stats(pool, opened=1, reused=2, in_use=0, idle=1)
+
+    def test_concurrent_use(self):
+        pool = self.make_pool()
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertIsNot(first, second)
+                self.assert_stats(pool, opened=2, in_use=2, idle=0)
+        # The one put back last is handed out first.
+        with pool.connection() as conn:
+            self.assertIs(conn, first)
+        self.assert_stats(pool, opened=2, reused=1, in_use=0, idle=2)
+
+    def test_size_cap(self):
+        pool = self.make_pool(max_size=2)
+        conns = [pool.acquire() for _ in range(4)]
+        for conn in conns:
+            pool.release(conn)
+        self.assert_stats(pool, opened=4, in_use=0, idle=2)
+        self.assertEqual([conn.closed for conn in conns],
+                         [False, False, True, True])
+
+    def test_idle_eviction(self):
+        pool = self.make_pool(max_idle_time=60)
+        old, recent = pool.acquire(), pool.acquire()
+        pool.release(old)
+        self.clock.now += 45
+        pool.release(recent)
+        self.clock.now += 30
+
+        # The old one is closed on the way to the recent one.
+        self.assertIs(pool.acquire(), recent)
+        self.assertTrue(old.closed)
+        self.assert_stats(pool, opened=2, reused=1, evicted=1, idle=0)
+
+        # Nothing left, so a new one.
+        self.clock.now += 120
+        pool.release(recent)
+        self.clock.now += 61
+        self.assertIs(pool.acquire(), self.made[2])
+        self.assertTrue(recent.closed)
+        self.assert_stats(pool, opened=3, evicted=2, in_use=1)
+
+    def test_discarded_on_error(self):
+        pool = self.make_pool()
+        try:
+            with pool.connection() as conn:
+                raise IOError('Connection reset by peer')
+        except IOError:
+            pass
+        self.assertTrue(conn.closed)
+        self.assert_stats(pool, opened=1, discarded=1, in_use=0, idle=0)
+
+        with pool.connection() as fresh:
+            self.assertIsNot(fresh, conn)
+
+    def test_failed_factory(self):
+        def factory():
+            raise IOError('No route to host')
+        pool = ConnectionPool(factory)
+        self.assertRaises(IOError, pool.acquire)
+        self.assert_stats(pool, opened=0, in_use=0)
+
+    def test_clear(self):
+        pool = self.make_pool()
+        in_use = pool.acquire()
+        pool.release(pool.acquire())
+        pool.clear()
+        self.assertTrue(self.made[1].closed)
+        self.assertFalse(in_use.closed)
+        self.assert_stats(pool, in_use=1, idle=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
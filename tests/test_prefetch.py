@@ -0,0 +1,128 @@
+"""
+prefetch_thumbnail_urls() resolving many thumbnail URLs with one cache round
+trip, and generate_url() answering from what it found.
+"""
+import unittest
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+
+from athumb import fields, prefetch_thumbnail_urls
+
+from tests.helpers import create_tables, encode, make_photo
+from tests.models import Photo
+
+THUMB_NAMES = ['small', 'medium']
+
+
+class CountingCache(object):
+    """
+    Passes everything through to Django's cache, noting the method names.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self.cache, name)
+
+
+class PrefetchTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_tables()
+        data = encode(make_photo((200, 150))).getvalue()
+        for number in range(3):
+            photo = Photo()
+            photo.image = ContentFile(data, name='%d.jpg' % number)
+            photo.save()
+        # One without an image, which is skipped.
+        Photo.objects.create()
+
+    @classmethod
+    def tearDownClass(cls):
+        for photo in Photo.objects.all():
+            if photo.image:
+                photo.image.delete(save=False)
+        Photo.objects.all().delete()
+
+    def setUp(self):
+        cache.clear()
+        fields.LOCAL_URL_CACHE.clear()
+        self.cache = CountingCache(cache)
+        self._cache = fields.cache
+        fields.cache = self.cache
+
+        self.built = []
+        field_file_class = fields.ImageWithThumbsFieldFile
+        self._build_thumb_url = build_thumb_url = \
+            field_file_class._build_thumb_url
+
+        def counting_build_thumb_url(field_file, *args, **kwargs):
+            self.built.append(field_file.name)
+            return build_thumb_url(field_file, *args, **kwargs)
+        field_file_class._build_thumb_url = counting_build_thumb_url
+
+    def tearDown(self):
+        fields.cache = self._cache
+        fields.ImageWithThumbsFieldFile._build_thumb_url = \
+            self._build_thumb_url
+
+    def prefetch(self, **kwargs):
+        photos = prefetch_thumbnail_urls(Photo.objects.all(), 'image',
+                                         THUMB_NAMES, **kwargs)
+        self.assertEqual(len(photos), 4)
+        return [photo for photo in photos if photo.image]
+
+    def test_later_urls_from_memory(self):
+        photos = self.prefetch()
+        self.assertEqual(self.cache.calls, ['get_many', 'set_many'])
+        self.assertEqual(len(self.built), 6)
+        local_stats = fields.LOCAL_URL_CACHE.stats()
+
+        del self.cache.calls[:], self.built[:]
+        urls = [photo.image.generate_url(thumb_name) for photo in photos
+                for thumb_name in THUMB_NAMES]
+        self.assertEqual(self.cache.calls, [])
+        self.assertEqual(self.built, [])
+        self.assertEqual(fields.LOCAL_URL_CACHE.stats(), local_stats)
+
+        self.assertEqual(urls, [
+            photo.image.generate_url(thumb_name, check_cache=False)
+            for photo in photos for thumb_name in THUMB_NAMES])
+        self.assertEqual(len(set(urls)), 6)
+
+    def test_shared_cache_hit(self):
+        self.prefetch()
+        fields.LOCAL_URL_CACHE.clear()
+        del self.cache.calls[:], self.built[:]
+        # Another process, say.
+        self.prefetch()
+        self.assertEqual(self.cache.calls, ['get_many'])
+        self.assertEqual(self.built, [])
+
+    def test_local_cache_hit(self):
+        self.prefetch()
+        del self.cache.calls[:], self.built[:]
+        self.prefetch()
+        self.assertEqual(self.cache.calls, [])
+        self.assertEqual(self.built, [])
+
+    def test_ssl_mode_mismatch(self):
+        photo = self.prefetch(ssl_mode=False)[0]
+        del self.cache.calls[:], self.built[:]
+        # Not what was prefetched, so it's looked up as usual.
+        url = photo.image.generate_url('small', ssl_mode=True)
+        self.assertEqual(self.cache.calls, ['get', 'set'])
+        self.assertEqual(self.built, [photo.image.name])
+        self.assertEqual(url, photo.image.generate_url('small', ssl_mode=True,
+                                                       check_cache=False))
+        # Prefetched ones still come from memory.
+        del self.cache.calls[:]
+        photo.image.generate_url('small')
+        self.assertEqual(self.cache.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+The database queue: claiming jobs so concurrent drainers don't run them
+twice, taking over stale claims, and giving up on jobs that keep failing.
+"""
+import sys
+import unittest
+from cStringIO import StringIO
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db.models import signals
+from django.utils import timezone
+
+from athumb.models import QueuedThumbnailJob
+from athumb.queues.base import ThumbnailJob
+from athumb.queues.database import DatabaseQueue
+
+from tests.helpers import create_tables, encode, make_photo
+
+
+class DrainTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        create_tables()
+
+    def setUp(self):
+        self.queue = DatabaseQueue()
+        self.name = default_storage.save(
+            'photos/queued.jpg',
+            ContentFile(encode(make_photo((200, 150))).getvalue()))
+
+    def tearDown(self):
+        QueuedThumbnailJob.objects.all().delete()
+        for name in default_storage.listdir('photos')[1]:
+            default_storage.delete('photos/' + name)
+
+    def enqueue(self, name=None):
+        self.queue.enqueue(ThumbnailJob(name or self.name, 'tests', 'photo',
+                                        'image'))
+        return QueuedThumbnailJob.objects.order_by('-pk')[0]
+
+    def stored(self):
+        return sorted(default_storage.listdir('photos')[1])
+
+    def test_runs_jobs(self):
+        self.enqueue()
+        self.assertEqual(self.queue.drain(), (1, 0))
+        self.assertFalse(QueuedThumbnailJob.objects.exists())
+        # The original and its two thumbnails.
+        self.assertEqual(len(self.stored()), 3)
+
+    def test_claimed_elsewhere(self):
+        row = self.enqueue()
+        claimed_at = timezone.now()
+
+        def claim_first(instance, **kwargs):
+            # Another drainer claims the job between this one finding it and
+            # claiming it.
+            if instance.pk == row.pk and not instance.claimed:
+                QueuedThumbnailJob.objects.filter(pk=row.pk).update(
+                    claimed=True, claimed_at=claimed_at, attempts=1)
+
+        signals.post_init.connect(claim_first, sender=QueuedThumbnailJob)
+        try:
+            self.assertEqual(self.queue.drain(), (0, 0))
+        finally:
+            signals.post_init.disconnect(claim_first,
+                                         sender=QueuedThumbnailJob)
+        # Left to the other drainer, and only counted once.
+        row = QueuedThumbnailJob.objects.get(pk=row.pk)
+        self.assertEqual((row.claimed, row.attempts), (True, 1))
+        self.assertEqual(self.stored(), [self.name.split('/')[1]])
+
+    def test_stale_claim_taken_over(self):
+        row = self.enqueue()
+        QueuedThumbnailJob.objects.filter(pk=row.pk).update(
+            claimed=True, attempts=1,
+            claimed_at=timezone.now() - timedelta(seconds=120))
+
+        # Not old enough yet.
+        self.assertEqual(self.queue.drain(claim_timeout=300), (0, 0))
+        self.assertTrue(QueuedThumbnailJob.objects.filter(pk=row.pk).exists())
+
+        self.assertEqual(self.queue.drain(claim_timeout=60), (1, 0))
+        self.assertFalse(QueuedThumbnailJob.objects.exists())
+
+    def test_dropped_after_max_attempts(self):
+        row = self.enqueue('photos/missing.jpg')
+
+        def process_jobs():
+            stdout = sys.stdout
+            sys.stdout = StringIO()
+            try:
+                call_command('athumb_process_jobs', max_attempts=2)
+                return sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+
+        for attempts in (1, 2):
+            self.assertEqual(process_jobs(),
+                             'Processed 1 job(s), 1 failed.\n')
+            row = QueuedThumbnailJob.objects.get(pk=row.pk)
+            self.assertEqual((row.claimed, row.attempts), (False, attempts))
+            self.assertIn('IOError', row.last_error)
+
+        # Kept for a look, but not tried again.
+        self.assertEqual(process_jobs(), 'Processed 0 job(s), 0 failed.\n')
+        self.assertEqual(QueuedThumbnailJob.objects.get(pk=row.pk).attempts,
+                         2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Listing S3BotoStorage's contents a level, or a page, at a time, against a
+local S3 stand-in.
+"""
+import hashlib
+import unittest
+from datetime import datetime
+
+try:
+    from athumb.backends.s3boto import KeyInfo
+except ImportError:
+    KeyInfo = None
+else:
+    from tests.fake_s3 import FakeS3Server
+    from tests.test_s3_requests import LocalS3BotoStorage
+
+NAMES = [
+    'top.jpg',
+    'photos/',
+    'photos/a.jpg',
+    'photos/b.jpg',
+    'photos/2025/12/x.jpg',
+    'photos/2026/01/y.jpg',
+    'photos/2026/01/z.jpg',
+    'photos/2026/02/w.jpg',
+    'photos/2026/readme.txt',
+    'thumbs/a_small.jpg',
+]
+
+
+@unittest.skipIf(KeyInfo is None, 'Django and boto are needed.')
+class ListingTests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeS3Server()
+        self.server.start()
+        self.storage = LocalS3BotoStorage(self.server.port)
+        for name in NAMES:
+            self.server.objects[('media', name)] = name
+        # Gets the bucket check out of the way.
+        self.storage.exists('top.jpg')
+        self.server.reset()
+
+    def tearDown(self):
+        self.storage.connection_pool.clear()
+        self.server.stop()
+
+    def test_listdir(self):
+        self.assertEqual(self.storage.listdir(''),
+                         (['photos', 'thumbs'], ['top.jpg']))
+        # The placeholder for the directory itself isn't listed.
+        self.assertEqual(self.storage.listdir('photos'),
+                         (['2025', '2026'], ['a.jpg', 'b.jpg']))
+        self.assertEqual(self.storage.listdir('/photos/2026/'),
+                         (['01', '02'], ['readme.txt']))
+        self.assertEqual(self.storage.listdir('photos/2026/01'),
+                         ([], ['y.jpg', 'z.jpg']))
+        self.assertEqual(self.storage.listdir('nothing'), ([], []))
+        self.assertEqual(self.server.count('GET'), 5)
+
+    def test_listdir_pages(self):
+        self.server.max_keys = 2
+        self.assertEqual(self.storage.listdir('photos'),
+                         (['2025', '2026'], ['a.jpg', 'b.jpg']))
+        # The placeholder, a.jpg | b.jpg, 2025/ | 2026/
+        self.assertEqual(self.server.count('GET'), 3)
+        self.assertEqual(self.storage.listdir('photos/2026'),
+                         (['01', '02'], ['readme.txt']))
+
+    def test_iter_keys(self):
+        keys = list(self.storage.iter_keys('photos/2026/'))
+        self.assertEqual([key.name for key in keys], [
+            'photos/2026/01/y.jpg',
+            'photos/2026/01/z.jpg',
+            'photos/2026/02/w.jpg',
+            'photos/2026/readme.txt',
+        ])
+        self.assertEqual(keys[0], KeyInfo(
+            name='photos/2026/01/y.jpg', size=len('photos/2026/01/y.jpg'),
+            etag=hashlib.md5('photos/2026/01/y.jpg').hexdigest(),
+            last_modified=datetime(2026, 1, 1)))
+        self.assertEqual(self.server.count('GET'), 1)
+
+    def test_iter_keys_pages(self):
+        keys = self.storage.iter_keys(page_size=3)
+        self.assertEqual([key.name for key in keys], sorted(NAMES))
+        # 3 + 3 + 3 + 1
+        self.assertEqual(self.server.count('GET'), 4)
+
+    def test_iter_keys_whole_pages(self):
+        names = [key.name for key in
+                 self.storage.iter_keys('photos/', page_size=4)]
+        self.assertEqual(names, sorted(name for name in NAMES
+                                       if name.startswith('photos/')))
+        # 8 keys: the second page isn't truncated, so that's it.
+        self.assertEqual(self.server.count('GET'), 2)
+
+    def test_iter_keys_lazy(self):
+        keys = self.storage.iter_keys(page_size=3)
+        next(keys)
+        self.assertEqual(self.server.count('GET'), 1)
+        # Nothing held while the caller works on a page.
+        self.assertEqual(self.storage.connection_pool.stats()['in_use'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+S3BotoStorage uploading big files in parts, against a local S3 stand-in.
+"""
+import os
+import unittest
+import urlparse
+
+try:
+    from django.core.exceptions import ImproperlyConfigured
+    from django.core.files.base import ContentFile
+    from boto.exception import BotoServerError
+    from athumb.backends.s3boto import MULTIPART_MIN_CHUNK_SIZE
+except ImportError:
+    MULTIPART_MIN_CHUNK_SIZE = None
+else:
+    from tests.fake_s3 import FakeS3Server
+    from tests.test_s3_requests import LocalS3BotoStorage
+
+
+@unittest.skipIf(MULTIPART_MIN_CHUNK_SIZE is None,
+                 'Django and boto are needed.')
+class MultipartTests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeS3Server()
+        self.server.start()
+        self.storage = LocalS3BotoStorage(
+            self.server.port, multipart_threshold=MULTIPART_MIN_CHUNK_SIZE,
+            multipart_chunk_size=MULTIPART_MIN_CHUNK_SIZE,
+            multipart_concurrency=3, multipart_retries=2,
+            multipart_retry_delay=0.01)
+        # Two full parts and a short one, each different.
+        self.data = os.urandom(MULTIPART_MIN_CHUNK_SIZE * 2 + 1000)
+
+    def tearDown(self):
+        self.storage.connection_pool.clear()
+        self.server.stop()
+
+    def part_requests(self, part_num):
+        """
+        How many times the given part was uploaded.
+        """
+        return len([path for method, path in self.server.requests
+                    if method == 'PUT' and urlparse.parse_qs(
+                        urlparse.urlparse(path).query).get('partNumber') ==
+                    [str(part_num)]])
+
+    def test_parts_in_order(self):
+        self.storage.save('print.tif', ContentFile(self.data))
+        # The server only completes uploads whose parts are listed in
+        # order, and puts them together in that order.
+        self.assertTrue(self.server.objects[('media', 'print.tif')] ==
+                        self.data)
+        self.assertEqual([self.part_requests(number) for number in (1, 2, 3)],
+                         [1, 1, 1])
+        self.assertEqual(self.server.uploads, {})
+
+    def test_retried_part(self):
+        # The first part finishes last, after the others.
+        self.server.part_failures[1] = 2
+        self.storage.save('print.tif', ContentFile(self.data))
+        self.assertTrue(self.server.objects[('media', 'print.tif')] ==
+                        self.data)
+        self.assertEqual(self.part_requests(1), 3)
+        self.assertEqual(self.part_requests(2), 1)
+
+    def test_failed_part_aborts(self):
+        # One more failure than there are retries.
+        self.server.part_failures[2] = 3
+        self.assertRaises(BotoServerError, self.storage.save, 'print.tif',
+                          ContentFile(self.data))
+        self.assertEqual(self.part_requests(2), 3)
+        self.assertNotIn(('media', 'print.tif'), self.server.objects)
+        # Aborted, so S3 doesn't keep the other parts.
+        self.assertEqual(self.server.uploads, {})
+        self.assertEqual(self.server.count('DELETE'), 1)
+
+    def test_small_files_in_one_request(self):
+        self.storage.save('photo.jpg', ContentFile('x' * 1000))
+        self.assertEqual(self.server.count('POST'), 0)
+        self.assertEqual(self.server.objects[('media', 'photo.jpg')],
+                         'x' * 1000)
+
+    def test_chunk_size_too_small(self):
+        self.assertRaises(ImproperlyConfigured, LocalS3BotoStorage,
+                          self.server.port, multipart_chunk_size=1024 * 1024)
+        # Doesn't matter with multipart uploads off.
+        LocalS3BotoStorage(self.server.port, multipart_threshold=0,
+                           multipart_chunk_size=1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
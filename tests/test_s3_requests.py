@@ -0,0 +1,89 @@
+"""
+How many requests S3BotoStorage makes to store things, counted by a local
+S3 stand-in. See benchmarks/bench_s3_requests.py for the numbers.
+"""
+import unittest
+
+try:
+    from django.core.files.base import ContentFile
+    from athumb.backends.s3boto import S3BotoStorage
+    from boto.s3.connection import OrdinaryCallingFormat, S3Connection
+except ImportError:
+    S3BotoStorage = None
+else:
+    from tests.fake_s3 import FakeS3Server
+
+    class LocalS3BotoStorage(S3BotoStorage):
+        """
+        Talks to a :class:`FakeS3Server` rather than S3.
+        """
+        def __init__(self, port, **kwargs):
+            self.port = port
+            kwargs.setdefault('bucket', 'media')
+            kwargs.setdefault('access_key', 'access')
+            kwargs.setdefault('secret_key', 'secret')
+            super(LocalS3BotoStorage, self).__init__(**kwargs)
+
+        def _new_connection(self):
+            connection = S3Connection(
+                self._access_key, self._secret_key, host='127.0.0.1',
+                port=self.port, is_secure=False,
+                calling_format=OrdinaryCallingFormat(),
+            )
+            # Leaves retrying to the storage, where there's any.
+            connection.num_retries = 0
+            return connection
+
+
+@unittest.skipIf(S3BotoStorage is None, 'Django and boto are needed.')
+class RequestCountTests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeS3Server()
+        self.server.start()
+        self.storages = []
+
+    def tearDown(self):
+        # Hangs up the kept-alive connections, so the server can stop.
+        for storage in self.storages:
+            storage.connection_pool.clear()
+        self.server.stop()
+
+    def make_storage(self, **kwargs):
+        storage = LocalS3BotoStorage(self.server.port, **kwargs)
+        self.storages.append(storage)
+        return storage
+
+    def test_one_request_per_save(self):
+        storage = self.make_storage()
+        # The first save also makes sure the bucket is there, once.
+        storage.save('photos/first.jpg', ContentFile('first'))
+        self.server.reset()
+
+        for number in range(10):
+            name = 'photos/%d.jpg' % number
+            self.assertEqual(storage.save(name, ContentFile('data')), name)
+        self.assertEqual(self.server.count(), 10)
+        self.assertEqual(self.server.count('PUT'), 10)
+        self.assertEqual(self.server.objects[('media', 'photos/9.jpg')],
+                         'data')
+
+    def test_overwrites(self):
+        storage = self.make_storage()
+        storage.save('photo.jpg', ContentFile('old'))
+        self.server.reset()
+        storage.save('photo.jpg', ContentFile('new'))
+        self.assertEqual(self.server.count(), 1)
+        self.assertEqual(self.server.objects[('media', 'photo.jpg')], 'new')
+
+    def test_conditional_writes(self):
+        storage = self.make_storage(conditional_writes=True)
+        storage.save('photo.jpg', ContentFile('old'))
+        self.server.reset()
+        # Still the one request, and what was there stays.
+        storage.save('photo.jpg', ContentFile('new'))
+        self.assertEqual(self.server.count(), 1)
+        self.assertEqual(self.server.objects[('media', 'photo.jpg')], 'old')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+S3BotoStorage's URLs: signed ones are cached until close to expiring, and
+none of them take a request to S3 unless asked to check the key exists.
+"""
+import unittest
+import urlparse
+
+try:
+    from django.core.files.base import ContentFile
+    from athumb.backends import s3boto
+except ImportError:
+    s3boto = None
+else:
+    from athumb import local_cache
+    from tests.fake_s3 import FakeS3Server
+    from tests.helpers import Clock
+    from tests.test_s3_requests import LocalS3BotoStorage
+
+
+@unittest.skipIf(s3boto is None, 'Django and boto are needed.')
+class URLTests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeS3Server()
+        self.server.start()
+        self.clock = Clock()
+        self._time = local_cache.time
+        local_cache.time = self.clock
+        self._margin = s3boto.URL_CACHE_MARGIN
+        self.storages = []
+
+    def tearDown(self):
+        local_cache.time = self._time
+        s3boto.URL_CACHE_MARGIN = self._margin
+        for storage in self.storages:
+            storage.connection_pool.clear()
+        self.server.stop()
+
+    def make_storage(self, **kwargs):
+        storage = LocalS3BotoStorage(self.server.port, **kwargs)
+        self.storages.append(storage)
+        # Counts the URLs it signs (or builds).
+        self.signed = []
+        generate_url = storage.connection.generate_url
+
+        def counting_generate_url(*args, **kwargs):
+            self.signed.append(kwargs['key'])
+            return generate_url(*args, **kwargs)
+        storage.connection.generate_url = counting_generate_url
+        return storage
+
+    def test_cached_until_margin(self):
+        storage = self.make_storage()
+        url = storage.url('photos/a.jpg')
+        self.assertIn('Signature=', url)
+        self.assertEqual(storage.url('photos/a.jpg'), url)
+        self.assertEqual(len(self.signed), 1)
+
+        # Just over the margin left: still handed out.
+        self.clock.now += s3boto.QUERYSTRING_EXPIRE - \
+            s3boto.URL_CACHE_MARGIN - 1
+        self.assertEqual(storage.url('photos/a.jpg'), url)
+        self.assertEqual(len(self.signed), 1)
+
+        # Any closer to expiring, and it's signed again.
+        self.clock.now += 2
+        storage.url('photos/a.jpg')
+        self.assertEqual(len(self.signed), 2)
+        self.assertEqual(self.server.count(), 0)
+
+    def test_cached_separately(self):
+        storage = self.make_storage()
+        url = storage.url('photos/a.jpg')
+        attachment_url = storage.url_as_attachment('photos/a.jpg', 'a.jpg')
+        self.assertNotEqual(attachment_url, url)
+        self.assertNotEqual(storage.url('photos/b.jpg'), url)
+        self.assertEqual(storage.url_as_attachment('photos/a.jpg', 'a.jpg'),
+                         attachment_url)
+        self.assertEqual(len(self.signed), 3)
+
+    def test_no_cache_without_margin(self):
+        s3boto.URL_CACHE_MARGIN = s3boto.QUERYSTRING_EXPIRE
+        storage = self.make_storage()
+        storage.url('photos/a.jpg')
+        storage.url('photos/a.jpg')
+        self.assertEqual(len(self.signed), 2)
+
+    def test_unsigned(self):
+        storage = self.make_storage(querystring_auth=False)
+        url = storage.url('photos/a.jpg')
+        self.assertEqual(urlparse.urlparse(url).query, '')
+        self.assertEqual(storage.url_for_name('photos/a.jpg'), url)
+        self.assertEqual(self.server.count(), 0)
+
+    def test_verify_exists(self):
+        storage = self.make_storage()
+        storage.save('photos/a.jpg', ContentFile('data'))
+        self.server.reset()
+
+        self.assertEqual(storage.url('photos/missing.jpg', verify_exists=True),
+                         '')
+        self.assertEqual(storage.url('photos/a.jpg', verify_exists=True),
+                         storage.url('photos/a.jpg'))
+        self.assertEqual(self.server.count(), 2)
+        self.assertEqual(self.server.count('HEAD'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
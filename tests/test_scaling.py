@@ -0,0 +1,116 @@
+"""
+PILEngine's resampling filters and two-stage reduce-then-resample scaling.
+See benchmarks/bench_scaling.py for speed.
+"""
+import unittest
+
+from athumb.pial.engines.pil_engine import PILEngine
+from athumb.pial.helpers import ThumbnailError
+from athumb.workers import run_all
+
+from tests.helpers import make_photo, psnr
+
+
+class ReducingGapTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+        self.image = make_photo((2400, 1800))
+
+    def test_size_is_unchanged(self):
+        for gap in (None, 1.5, 2.0, 3.0):
+            thumb = self.engine.scale(self.image, (200, 200), True, None,
+                                      reducing_gap=gap)
+            self.assertEqual(thumb.size, (200, 150))
+
+    def test_close_to_single_pass(self):
+        # The reference is the single full-quality pass used before.
+        reference = self.engine.scale(self.image, (300, 300), True, None)
+        for gap, min_psnr in ((2.0, 40), (3.0, 40)):
+            thumb = self.engine.scale(self.image, (300, 300), True, None,
+                                      reducing_gap=gap)
+            self.assertGreater(psnr(thumb, reference), min_psnr,
+                               'reducing_gap=%s' % gap)
+
+    def test_larger_gap_is_closer(self):
+        reference = self.engine.scale(self.image, (300, 300), True, None)
+        close = psnr(self.engine.scale(self.image, (300, 300), True, None,
+                                       reducing_gap=3.0), reference)
+        far = psnr(self.engine.scale(self.image, (300, 300), True, None,
+                                     reducing_gap=1.1), reference)
+        self.assertGreaterEqual(close, far)
+
+    def test_no_reduction_below_gap(self):
+        # Only 1.5 times bigger than the target, so a 2.0 gap can't reduce.
+        image = make_photo((300, 225))
+        reference = self.engine.scale(image, (200, 200), True, None)
+        thumb = self.engine.scale(image, (200, 200), True, None,
+                                  reducing_gap=2.0)
+        self.assertEqual(thumb.tobytes(), reference.tobytes())
+
+
+class ResampleTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+        self.image = make_photo((800, 600))
+
+    def test_named_filters(self):
+        for name in ('nearest', 'bilinear', 'bicubic', 'lanczos', 'LANCZOS'):
+            thumb = self.engine.scale(self.image, (100, 100), True, None,
+                                      resample=name)
+            self.assertEqual(thumb.size, (100, 75))
+
+    def test_unknown_filter(self):
+        self.assertRaises(ThumbnailError, self.engine.scale, self.image,
+                          (100, 100), True, None, resample='sharpest')
+
+
+class ScaleChainTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+        self.image = make_photo((1600, 1200))
+        # 800x600 comes from the original, 300x225 and 250x188 from that
+        # (neither is twice the other), and 100x75 from 250x188.
+        self.specs = [((size, size), True, None, {})
+                      for size in (300, 800, 250, 100)]
+
+    def test_levels(self):
+        levels = []
+
+        def run_all(func, arg_tuples):
+            arg_tuples = list(arg_tuples)
+            levels.append(sorted(index for index, in arg_tuples))
+            for args in arg_tuples:
+                func(*args)
+
+        self.engine.scale_chain(self.image, self.specs, run_all=run_all)
+        self.assertEqual(levels, [[1], [0, 2], [3]])
+
+    def test_upscaled_sources_skipped(self):
+        levels = []
+
+        def run_all(func, arg_tuples):
+            levels.append(sorted(index for index, in arg_tuples))
+            for args in arg_tuples:
+                func(*args)
+
+        small = make_photo((400, 300))
+        specs = [((1600, 1600), True, None, {}), ((100, 100), True, None, {})]
+        results = self.engine.scale_chain(small, specs, run_all=run_all)
+        # Both straight from the original.
+        self.assertEqual(levels, [[0, 1]])
+        self.assertEqual([image.size for image in results],
+                         [(1600, 1200), (100, 75)])
+
+    def test_same_as_serial(self):
+        serial = self.engine.scale_chain(self.image, self.specs)
+        threaded = self.engine.scale_chain(self.image, self.specs,
+                                           run_all=run_all)
+        for one, other in zip(serial, threaded):
+            self.assertEqual(one.size, other.size)
+            self.assertTrue(one.tobytes() == other.tobytes())
+        self.assertEqual([image.size for image in serial],
+                         [(300, 225), (800, 600), (250, 188), (100, 75)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+crop='smart'. See benchmarks/bench_smartcrop.py for speed.
+"""
+import unittest
+
+from PIL import Image
+
+from athumb.pial import smartcrop
+from athumb.pial.engines.pil_engine import PILEngine
+
+from tests.helpers import make_photo
+
+
+@unittest.skipIf(smartcrop.numpy is None, 'numpy is needed.')
+class SmartCropTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+
+    def flat_with_detail(self, size, box):
+        """
+        A flat gray image, with a detailed photo pasted in at ``box``.
+        """
+        image = Image.new('RGB', size, (128, 128, 128))
+        detail = make_photo((box[2] - box[0], box[3] - box[1]))
+        image.paste(detail, box[:2])
+        return image
+
+    def test_finds_detail(self):
+        cases = [
+            # (image size, where the detail is, crop window)
+            ((900, 300), (700, 50, 880, 250), (300, 300)),
+            ((900, 300), (10, 50, 200, 250), (300, 300)),
+            ((300, 900), (50, 600, 250, 850), (300, 300)),
+            ((800, 600), (450, 350, 750, 580), (400, 300)),
+        ]
+        for size, box, geometry in cases:
+            image = self.flat_with_detail(size, box)
+            x, y = self.engine.get_smart_crop_offset(image, geometry)
+            # The window must hold all of the detail.
+            self.assertTrue(x <= box[0] and box[2] <= x + geometry[0] and
+                            y <= box[1] and box[3] <= y + geometry[1],
+                            (size, box, (x, y)))
+
+    def test_flat_image_is_centered(self):
+        image = Image.new('RGB', (900, 300), (10, 200, 30))
+        x, y = self.engine.get_smart_crop_offset(image, (300, 300))
+        self.assertTrue(abs(x - 300) <= 10, x)
+        self.assertEqual(y, 0)
+
+    def test_stays_in_bounds(self):
+        image = make_photo((1000, 700))
+        for geometry in ((999, 10), (10, 699), (1, 1), (1000, 700)):
+            x, y = self.engine.get_smart_crop_offset(image, geometry)
+            self.assertTrue(0 <= x <= 1000 - geometry[0])
+            self.assertTrue(0 <= y <= 700 - geometry[1])
+
+    def test_thumbnail(self):
+        image = make_photo((1600, 1200))
+        thumb = self.engine.create_thumbnail(image, (200, 200), crop='smart')
+        self.assertEqual(thumb.size, (200, 200))
+
+    def test_find_best_window(self):
+        energy = smartcrop.numpy.zeros((10, 20), dtype=smartcrop.numpy.float32)
+        energy[6:9, 15:18] = 1
+        self.assertEqual(smartcrop.find_best_window(energy, 3, 3), (15, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
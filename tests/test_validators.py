@@ -0,0 +1,108 @@
+"""
+Turning away images with too many pixels, going by their headers alone.
+"""
+import struct
+import unittest
+import warnings
+import zlib
+from cStringIO import StringIO
+
+from PIL import Image
+
+from django.core.files.base import ContentFile
+from django.core.validators import ValidationError
+
+from athumb import validators
+from athumb.exceptions import UploadedImageIsTooLargeError
+from athumb.pial.engines.pil_engine import PILEngine
+from athumb.validators import check_pixel_count
+
+from tests.helpers import create_tables, encode, make_photo
+from tests.models import Photo
+
+
+def png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + \
+        struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+
+def png_bomb(width, height):
+    """
+    Returns a tiny PNG whose header claims it's ``width`` by ``height``.
+    Decoding it would take about width * height * 3 bytes.
+    """
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return '\x89PNG\r\n\x1a\n' + png_chunk('IHDR', header) + \
+        png_chunk('IDAT', zlib.compress('\0' * 1024)) + png_chunk('IEND', '')
+
+
+class PixelCountTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = PILEngine()
+        self._max_pixels = validators.ATHUMB_MAX_PIXELS
+        validators.ATHUMB_MAX_PIXELS = 89478485
+        # PIL warns about every one of these it opens.
+        self._warnings = warnings.catch_warnings()
+        self._warnings.__enter__()
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+
+    def tearDown(self):
+        self._warnings.__exit__()
+        validators.ATHUMB_MAX_PIXELS = self._max_pixels
+
+    def check(self, data, position=0):
+        fobj = StringIO(data)
+        fobj.seek(position)
+        try:
+            check_pixel_count(self.engine, fobj)
+        finally:
+            self.assertEqual(fobj.tell(), position)
+
+    def test_bomb(self):
+        try:
+            self.check(png_bomb(10000, 10000))
+        except ValidationError, exc:
+            self.assertEqual(exc.code, 'too_many_pixels')
+            self.assertIn('10000x10000', exc.messages[0])
+        else:
+            self.fail('The bomb was let through.')
+
+    def test_too_big_to_open(self):
+        # Over PIL's own limit too, so there's no size to report.
+        self.assertRaises(ValidationError, self.check,
+                          png_bomb(20000, 20000))
+
+    def test_read_already(self):
+        # Read to the end by something else first, the way hashing it
+        # would leave it.
+        data = png_bomb(10000, 10000)
+        self.assertRaises(ValidationError, self.check, data, len(data))
+
+    def test_normal_image(self):
+        data = encode(make_photo((640, 480))).getvalue()
+        self.check(data)
+        self.check(data, 100)
+
+    def test_no_limit(self):
+        validators.ATHUMB_MAX_PIXELS = None
+        self.check(png_bomb(10000, 10000))
+
+
+class SaveTests(unittest.TestCase):
+    """
+    Field files check uploads too, in case no form validated them.
+    """
+    @classmethod
+    def setUpClass(cls):
+        create_tables()
+
+    def test_bomb_not_stored(self):
+        photo = Photo()
+        self.assertRaises(UploadedImageIsTooLargeError, photo.image.save,
+                          'bomb.png', ContentFile(png_bomb(10000, 10000)))
+        self.assertFalse(photo.image)
+        self.assertFalse(Photo.objects.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+VipsEngine should make thumbnails of the same dimensions, cropped at the same
+offsets, as PILEngine. Skipped without pyvips (and libvips).
+"""
+import unittest
+
+try:
+    import pyvips
+    from athumb.pial.engines.vips_engine import VipsEngine
+except (ImportError, OSError):
+    # OSError: pyvips is there, but libvips isn't.
+    pyvips = None
+
+from athumb.pial.engines.pil_engine import PILEngine
+from athumb.pial.parsers import parse_crop_anchor
+
+from tests.helpers import encode, make_photo
+
+SOURCE_SIZES = [(800, 600), (600, 800), (500, 500), (150, 90)]
+GEOMETRIES = [(200, 200), (300, 100), (100, 300), (1000, 1000)]
+CROPS = [None, 'center', 'top', 'right bottom', '25% 75%', '10px 20px']
+
+
+class CropRecorder(object):
+    """
+    Wraps an engine's _crop(), keeping its (width, height, x, y) arguments.
+    """
+    def __init__(self, engine):
+        self.calls = []
+        self._crop = engine._crop
+        engine._crop = self
+
+    def __call__(self, image, width, height, x_offset, y_offset):
+        self.calls.append((width, height, x_offset, y_offset))
+        return self._crop(image, width, height, x_offset, y_offset)
+
+
+@unittest.skipIf(pyvips is None, 'pyvips and libvips are needed.')
+class ParityTests(unittest.TestCase):
+    def setUp(self):
+        self.pil = PILEngine()
+        self.vips = VipsEngine()
+        self.pil_crops = CropRecorder(self.pil)
+        self.vips_crops = CropRecorder(self.vips)
+
+    def load(self, engine, source, min_size=None):
+        source.seek(0)
+        image = engine.get_image(source, min_size=min_size)
+        return engine.normalize(image)
+
+    def test_dimensions_and_crop_offsets(self):
+        for source_size in SOURCE_SIZES:
+            source = encode(make_photo(source_size), quality=90)
+            pil_image = self.load(self.pil, source)
+            vips_image = self.load(self.vips, source)
+            self.assertEqual(self.pil.get_image_size(pil_image),
+                             self.vips.get_image_size(vips_image))
+
+            for geometry in GEOMETRIES:
+                for crop in CROPS:
+                    if crop:
+                        crop = parse_crop_anchor(crop)
+                    for upscale in (True, False):
+                        label = '%s -> %s crop=%r upscale=%s' % (
+                            source_size, geometry, crop, upscale)
+                        pil_thumb = self.pil.create_thumbnail(
+                            pil_image, geometry, upscale=upscale, crop=crop)
+                        vips_thumb = self.vips.create_thumbnail(
+                            vips_image, geometry, upscale=upscale, crop=crop)
+                        self.assertEqual(
+                            self.pil.get_image_size(pil_thumb),
+                            self.vips.get_image_size(vips_thumb), label)
+                        self.assertEqual(self.pil_crops.calls,
+                                         self.vips_crops.calls, label)
+
+    def test_shrink_on_load_covers_min_size(self):
+        source = encode(make_photo((3200, 2400)), quality=90)
+        for min_size in [(400, 300), (801, 300), (1600, 1200), (3200, 2400)]:
+            pil_size = self.pil.get_image_size(
+                self.load(self.pil, source, min_size))
+            vips_size = self.vips.get_image_size(
+                self.load(self.vips, source, min_size))
+            for size in (pil_size, vips_size):
+                self.assertTrue(size[0] >= min_size[0] and
+                                size[1] >= min_size[1], (min_size, size))
+
+    def test_grayscale_and_alpha(self):
+        for mode, format in (('L', 'PNG'), ('RGBA', 'PNG')):
+            source = encode(make_photo((640, 480), mode=mode), format=format)
+            pil_thumb = self.pil.create_thumbnail(
+                self.load(self.pil, source), (100, 100))
+            vips_thumb = self.vips.create_thumbnail(
+                self.load(self.vips, source), (100, 100))
+            self.assertEqual(self.pil.get_image_size(pil_thumb),
+                             self.vips.get_image_size(vips_thumb))
+            self.assertEqual(len(pil_thumb.getbands()), vips_thumb.bands)
+
+
+@unittest.skipIf(pyvips is None, 'pyvips and libvips are needed.')
+class EncoderOptionTests(unittest.TestCase):
+    def setUp(self):
+        self.vips = VipsEngine()
+        self.image = self.vips.normalize(
+            self.vips.get_image(encode(make_photo((320, 240)), quality=90)))
+
+    def test_pil_options(self):
+        # What a thumb's encoder_options would say, written for PIL.
+        pil_options = {'progressive': True, 'subsampling': 0,
+                       'optimize': True, 'exif': '', 'icc_profile': ''}
+        suffix, options = self.vips._get_save_options('JPEG', 80,
+                                                      pil_options)
+        self.assertEqual(suffix, '.jpeg')
+        self.assertEqual(options['interlace'], True)
+        self.assertEqual(options['subsample_mode'], 'off')
+        for name in ('subsampling', 'optimize', 'exif', 'icc_profile'):
+            self.assertFalse(name in options, name)
+        # libvips takes them.
+        for format in ('JPEG', 'WEBP', 'PNG'):
+            self.vips.encode(self.image, format=format, quality=80,
+                             **pil_options)
+
+    def test_can_write(self):
+        self.assertTrue(self.vips.can_write('jpg'))
+        self.assertTrue(self.vips.can_write('PNG'))
+        self.assertFalse(self.vips.can_write('nosuchformat'))
+
+
+if __name__ == '__main__':
+    unittest.main()
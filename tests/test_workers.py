@@ -0,0 +1,63 @@
+"""
+run_all() hands work to the worker pool, and brings failures back.
+"""
+import threading
+import traceback
+import unittest
+
+from athumb import workers
+
+
+def fail_in_worker(number):
+    raise ValueError(number)
+
+
+class RunAllTests(unittest.TestCase):
+    def setUp(self):
+        self.closed = []
+        self._close_old_connections = workers.close_old_connections
+        workers.close_old_connections = \
+            lambda: self.closed.append(threading.current_thread())
+
+    def tearDown(self):
+        workers.close_old_connections = self._close_old_connections
+
+    def test_runs_everything(self):
+        done = []
+        lock = threading.Lock()
+
+        def record(number):
+            with lock:
+                done.append(number)
+
+        workers.run_all(record, [(number,) for number in range(10)])
+        self.assertEqual(sorted(done), range(10))
+
+    def test_first_error_with_worker_traceback(self):
+        done = []
+
+        def maybe_fail(number):
+            if number in (3, 6):
+                fail_in_worker(number)
+            done.append(number)
+
+        try:
+            workers.run_all(maybe_fail, [(number,) for number in range(8)])
+        except ValueError, exc:
+            frames = traceback.format_exc()
+        else:
+            self.fail('Nothing was raised.')
+        self.assertEqual(exc.args, (3,))
+        self.assertTrue('fail_in_worker' in frames, frames)
+        # The rest still ran.
+        self.assertEqual(sorted(done), [0, 1, 2, 4, 5, 7])
+
+    def test_closes_connections_in_workers(self):
+        workers.run_all(lambda number: None,
+                        [(number,) for number in range(6)])
+        self.assertEqual(len(self.closed), 6)
+        self.assertFalse(threading.current_thread() in self.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()